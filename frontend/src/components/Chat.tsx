@@ -15,7 +15,6 @@ import {
   ListItem,
   Heading,
 } from '@chakra-ui/react';
-import axios from 'axios';
 import ReactMarkdown from 'react-markdown';
 import remarkGfm from 'remark-gfm';
 import rehypeRaw from 'rehype-raw';
@@ -29,6 +28,25 @@ interface Message {
   role?: 'user' | 'assistant';
 }
 
+interface StreamEvent {
+  event: string;
+  data: any;
+}
+
+// Parse one server-sent event block ("event: ...\ndata: ...")
+const parseStreamEvent = (block: string): StreamEvent => {
+  let event = 'message';
+  const dataLines: string[] = [];
+  block.split('\n').forEach(line => {
+    if (line.startsWith('event:')) {
+      event = line.slice(6).trim();
+    } else if (line.startsWith('data:')) {
+      dataLines.push(line.slice(5).trim());
+    }
+  });
+  return { event, data: dataLines.length ? JSON.parse(dataLines.join('\n')) : null };
+};
+
 interface MarkdownComponentProps {
   children: ReactNode;
 }
@@ -43,6 +61,7 @@ const Chat = () => {
   const [messages, setMessages] = useState<Message[]>([]);
   const [input, setInput] = useState('');
   const [isLoading, setIsLoading] = useState(false);
+  const [isStreaming, setIsStreaming] = useState(false);
   const messagesEndRef = useRef<HTMLDivElement>(null);
 
   const scrollToBottom = () => {
@@ -75,27 +94,77 @@ const Chat = () => {
         sources: msg.sources,
       }));
 
-      const response = await axios.post('http://localhost:8001/ask', {
-        question: input.trim(),
-        conversation_history: conversationHistory,
+      const response = await fetch('http://localhost:8001/ask/stream', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({
+          question: userMessage.content,
+          conversation_history: conversationHistory,
+        }),
       });
+      if (!response.ok || !response.body) {
+        throw new Error(`Request failed with status ${response.status}`);
+      }
 
-      const assistantMessage: Message = {
-        type: 'assistant',
-        content: response.data.answer,
-        sources: response.data.sources,
-        role: 'assistant',
+      // Update the assistant message that is being streamed in
+      const updateAssistantMessage = (update: Partial<Message>) => {
+        setMessages(prev => {
+          const next = [...prev];
+          next[next.length - 1] = { ...next[next.length - 1], ...update };
+          return next;
+        });
       };
 
-      setMessages(prev => [...prev, assistantMessage]);
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let answer = '';
+      let started = false;
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        // Events are separated by a blank line; keep any partial event for the next read
+        const blocks = buffer.split('\n\n');
+        buffer = blocks.pop() ?? '';
+
+        for (const block of blocks) {
+          if (!block.trim()) continue;
+          const { event, data } = parseStreamEvent(block);
+          if (event === 'error') {
+            throw new Error(data?.detail || 'Streaming failed');
+          }
+          if (!started) {
+            started = true;
+            setIsStreaming(true);
+            setMessages(prev => [...prev, { type: 'assistant', content: '', sources: [], role: 'assistant' }]);
+          }
+          if (event === 'sources') {
+            updateAssistantMessage({ sources: data.sources });
+          } else if (event === 'token') {
+            answer += data.token;
+            updateAssistantMessage({ content: answer });
+          } else if (event === 'done') {
+            updateAssistantMessage({ content: data.answer, sources: data.sources });
+          }
+        }
+      }
     } catch (error) {
       const errorMessage: Message = {
         type: 'error',
         content: 'Failed to get response from the server. Please try again.',
       };
-      setMessages(prev => [...prev, errorMessage]);
+      // Drop a partially streamed answer that never produced any text
+      setMessages(prev => {
+        const last = prev[prev.length - 1];
+        const kept = last && last.type === 'assistant' && !last.content ? prev.slice(0, -1) : prev;
+        return [...kept, errorMessage];
+      });
     } finally {
       setIsLoading(false);
+      setIsStreaming(false);
     }
   };
 
@@ -224,7 +293,7 @@ const Chat = () => {
             </Box>
           </Flex>
         ))}
-        {isLoading && (
+        {isLoading && !isStreaming && (
           <Flex w="100%" justify="flex-start">
             <Box bg="gray.100" p={4} borderRadius="lg">
               <Spinner size="sm" />
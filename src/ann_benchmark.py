@@ -0,0 +1,144 @@
+"""
+Recall@k vs. latency report for the ANN index types against the exact flat
+baseline.
+
+Uses the vectors of an existing index when `--index-path` is given, and
+clustered synthetic vectors otherwise. Queries are perturbed copies of held-out
+vectors, searched one at a time like the API does.
+
+    python src/ann_benchmark.py --index-path faiss_index --k 4 10
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import faiss
+import numpy as np
+import yaml
+
+sys.path.append(str(Path(__file__).parent))
+
+from ann_index import FLAT_INDEX_FILENAME, build_ann_index, factory_string, flat_vectors
+from load_test import percentile
+
+# Query-time settings swept for each index type
+SWEEPS = {
+    "flat": [{}],
+    "ivf": [{"nprobe": n} for n in (1, 4, 16, 64)],
+    "hnsw": [{"ef_search": ef} for ef in (16, 32, 64, 128)],
+    "pq": [{}],
+    "ivfpq": [{"nprobe": n} for n in (4, 16, 64)],
+}
+
+
+def synthetic_vectors(count: int, dimension: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Unit vectors drawn around random cluster centres, like topical doc chunks"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, count)] + 0.5 * rng.standard_normal((count, dimension)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def split_queries(vectors: np.ndarray, queries: int, seed: int = 0) -> Tuple[np.ndarray, np.ndarray]:
+    """Hold out `queries` vectors and perturb them into queries"""
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(vectors))
+    held_out, base = vectors[order[:queries]], vectors[order[queries:]]
+    noise = rng.standard_normal(held_out.shape).astype(np.float32) * held_out.std() * 0.3
+    return np.ascontiguousarray(base), np.ascontiguousarray(held_out + noise)
+
+
+def measure(index, queries: np.ndarray, truth: np.ndarray, ks: List[int]) -> Dict:
+    """Per-query latency and recall@k of `index` against the exact neighbours"""
+    k_max = max(ks)
+    latencies = []
+    found = np.empty((len(queries), k_max), dtype=np.int64)
+    for i in range(len(queries)):
+        started = time.perf_counter()
+        _, ids = index.search(queries[i:i + 1], k_max)
+        latencies.append(time.perf_counter() - started)
+        found[i] = ids[0]
+    result = {
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "qps": round(len(queries) / sum(latencies), 1),
+    }
+    for k in ks:
+        hits = sum(len(set(found[i, :k]) & set(truth[i, :k])) for i in range(len(queries)))
+        result[f"recall@{k}"] = round(hits / (k * len(queries)), 4)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall vs. latency of ANN index types")
+    parser.add_argument("--index-path", help="Benchmark the vectors of this index instead of synthetic ones")
+    parser.add_argument("--vectors", type=int, default=20000, help="Synthetic vector count")
+    parser.add_argument("--dimension", type=int, default=256, help="Synthetic vector dimension")
+    parser.add_argument("--clusters", type=int, default=200, help="Synthetic topic clusters")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, nargs="+", default=[4, 10])
+    parser.add_argument("--types", nargs="+", default=list(SWEEPS), choices=list(SWEEPS))
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    config_path = os.path.join(Path(__file__).parent.absolute(), "config.yaml")
+    with open(config_path) as f:
+        ann_config = yaml.safe_load(f)['vector_store'].get('ann', {})
+
+    if args.index_path:
+        vectors = flat_vectors(faiss.read_index(os.path.join(args.index_path, FLAT_INDEX_FILENAME)))
+    else:
+        vectors = synthetic_vectors(args.vectors, args.dimension, args.clusters)
+    base, queries = split_queries(vectors, min(args.queries, len(vectors) // 10))
+
+    exact = faiss.IndexFlatL2(base.shape[1])
+    exact.add(base)
+    _, truth = exact.search(queries, max(args.k))
+
+    results = []
+    for kind in args.types:
+        config = {**ann_config, "type": kind}
+        started = time.perf_counter()
+        index = build_ann_index(base, config)
+        build_seconds = time.perf_counter() - started
+        size = len(faiss.serialize_index(index))
+        # The sweeps only change query-time knobs, so one build serves them all
+        for params in SWEEPS[kind]:
+            settings = {**config, **params}
+            if "nprobe" in params:
+                faiss.extract_index_ivf(index).nprobe = params["nprobe"]
+            if "ef_search" in params:
+                index.hnsw.efSearch = params["ef_search"]
+            result = {
+                "type": kind,
+                "factory": factory_string(settings, base.shape[1], len(base)),
+                **params,
+                "build_s": round(build_seconds, 3),
+                "size_mb": round(size / 1e6, 2),
+                **measure(index, queries, truth, args.k),
+            }
+            results.append(result)
+            print(f"{result['factory']:>16} {json.dumps(params):>20}  "
+                  f"recall@{args.k[0]}={result[f'recall@{args.k[0]}']:.3f}  p50={result['p50_ms']}ms  "
+                  f"size={result['size_mb']}MB", file=sys.stderr)
+
+    report = {
+        "vectors": len(base),
+        "dimension": base.shape[1],
+        "queries": len(queries),
+        "source": args.index_path or "synthetic",
+        "results": results,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import json
+import math
+import os
+import time
+from typing import Optional, Tuple
+
+import faiss
+import numpy as np
+
+# The flat index.faiss written by the pipeline stays the exact, updatable copy;
+# the configured ANN index is built from it and served beside it
+ANN_INDEX_FILENAME = "ann.faiss"
+ANN_META_FILENAME = "ann.json"
+FLAT_INDEX_FILENAME = "index.faiss"
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "pq", "ivfpq")
+
+# Faiss needs about this many training vectors per IVF cell
+MIN_POINTS_PER_CELL = 39
+
+
+def index_type(config: dict) -> str:
+    kind = config.get('type', 'flat')
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown vector_store.ann.type '{kind}', expected one of {', '.join(INDEX_TYPES)}")
+    return kind
+
+
+def factory_string(config: dict, dimension: int, count: int) -> str:
+    """
+    Faiss index_factory description for the configured index type, with
+    parameters capped to what `count` training vectors can support
+    """
+    kind = index_type(config)
+    nlist = max(1, min(config.get('nlist', 1024), count // MIN_POINTS_PER_CELL))
+    pq_m = config.get('pq_m', 32)
+    if kind in ("pq", "ivfpq") and dimension % pq_m:
+        raise ValueError(f"vector_store.ann.pq_m={pq_m} must divide the embedding dimension {dimension}")
+    pq_bits = max(1, min(config.get('pq_bits', 8), int(math.log2(max(2, count)))))
+
+    if kind == "flat":
+        return "Flat"
+    if kind == "ivf":
+        return f"IVF{nlist},Flat"
+    if kind == "hnsw":
+        return f"HNSW{config.get('hnsw_m', 32)},Flat"
+    if kind == "pq":
+        return f"PQ{pq_m}x{pq_bits}"
+    return f"IVF{nlist},PQ{pq_m}x{pq_bits}"
+
+
+def apply_search_params(index, config: dict) -> None:
+    """Set the query-time knobs (IVF nprobe, HNSW efSearch) on a loaded index"""
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = config.get('ef_search', 64)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        ivf.nprobe = min(config.get('nprobe', 16), ivf.nlist)
+
+
+def build_ann_index(vectors: np.ndarray, config: dict, trained=None):
+    """
+    Build the configured index over `vectors`, in their order so positions
+    keep matching the docstore mapping. `trained` is a previously trained
+    index of the same layout whose quantizers are reused instead of retraining.
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if trained is not None:
+        index = trained
+        index.reset()
+    else:
+        index = faiss.index_factory(vectors.shape[1], factory_string(config, vectors.shape[1], len(vectors)))
+        if isinstance(index, faiss.IndexHNSW):
+            index.hnsw.efConstruction = config.get('ef_construction', 200)
+        if not index.is_trained:
+            index.train(vectors)
+    index.add(vectors)
+    apply_search_params(index, config)
+    return index
+
+
+def flat_vectors(index) -> np.ndarray:
+    """All vectors of a flat index, in position order"""
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def _read_meta(index_path: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(index_path, ANN_META_FILENAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_ann_index(index_path: str, flat_index, config: dict) -> Optional[dict]:
+    """
+    Build the configured ANN index from the flat index and persist it beside
+    it. IVF and PQ quantizers are reused from the previous build while the
+    layout is unchanged and the index has not outgrown its training set by
+    more than `retrain_growth`. Returns the build metadata, or None for flat.
+    """
+    kind = index_type(config)
+    if kind == "flat" or flat_index.ntotal == 0:
+        return None
+
+    started = time.perf_counter()
+    vectors = flat_vectors(flat_index)
+    factory = factory_string(config, flat_index.d, flat_index.ntotal)
+    previous = _read_meta(index_path)
+    trained = None
+    trained_count = flat_index.ntotal
+    if (previous and previous.get('factory') == factory and kind != "hnsw"
+            and flat_index.ntotal <= previous['trained_count'] * config.get('retrain_growth', 2.0)):
+        try:
+            trained = faiss.read_index(os.path.join(index_path, ANN_INDEX_FILENAME))
+            trained_count = previous['trained_count']
+        except RuntimeError:
+            trained = None
+
+    index = build_ann_index(vectors, config, trained=trained)
+    meta = {
+        'type': kind,
+        'factory': factory,
+        'ntotal': index.ntotal,
+        'trained_count': trained_count,
+        'retrained': trained is None,
+        'build_seconds': round(time.perf_counter() - started, 3),
+    }
+
+    # Written under temporary names and swapped in, so readers never see a torn file
+    index_file = os.path.join(index_path, ANN_INDEX_FILENAME)
+    meta_file = os.path.join(index_path, ANN_META_FILENAME)
+    faiss.write_index(index, index_file + ".tmp")
+    with open(meta_file + ".tmp", 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(index_file + ".tmp", index_file)
+    os.replace(meta_file + ".tmp", meta_file)
+    return meta
+
+
+def read_index(path: str, mmap: bool = True):
+    """Read a faiss index, memory-mapped when possible so processes share its pages"""
+    if mmap:
+        flag = getattr(faiss, 'IO_FLAG_MMAP_IFC', faiss.IO_FLAG_MMAP)
+        try:
+            return faiss.read_index(path, flag)
+        except RuntimeError as e:
+            print(f"⚠️ Could not memory-map {path}, reading it into memory: {e}")
+    return faiss.read_index(path)
+
+
+def load_serving_index(index_path: str, config: dict, expected_count: int) -> Tuple[object, str]:
+    """
+    Load the index the API searches: the configured ANN index when it is built
+    and matches the docstore, otherwise the exact flat index.
+    Returns the index and a short description of what was loaded.
+    """
+    kind = index_type(config)
+    mmap = config.get('mmap', True)
+    if kind != "flat":
+        meta = _read_meta(index_path)
+        ann_file = os.path.join(index_path, ANN_INDEX_FILENAME)
+        if meta and meta.get('type') == kind and meta.get('ntotal') == expected_count and os.path.exists(ann_file):
+            index = read_index(ann_file, mmap)
+            apply_search_params(index, config)
+            return index, meta['factory']
+        print(f"⚠️ No up-to-date {kind} index in {index_path}, serving the flat index. "
+              f"Re-run the indexer to build it.")
+    return read_index(os.path.join(index_path, FLAT_INDEX_FILENAME), mmap), "Flat"
@@ -1,10 +1,20 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import Dict, List, Optional, Tuple
 import uvicorn
+import asyncio
+import hmac
+import time
 import traceback
+import json
+import yaml
 from doc_indexer import DocumentationIndexer
+from concurrency import LLMGate, Overloaded, RequestCoalescer
+from metrics import IN_FLIGHT, REGISTRY, REQUEST_SECONDS, REQUESTS
+from query_cache import normalize_question
+from shards import UnknownCollection
 import sys
 from pathlib import Path
 import os
@@ -16,6 +26,16 @@ sys.path.append(str(Path(__file__).parent))
 script_dir = Path(__file__).parent.absolute()
 config_path = os.path.join(script_dir, "config.yaml")
 
+def batch_concurrency_limit() -> int:
+    """Most LLM calls one batch may ask to keep in flight, from the serving config"""
+    try:
+        with open(config_path) as f:
+            serving_config = (yaml.safe_load(f) or {}).get('serving', {})
+    except OSError:
+        serving_config = {}
+    return max(1, min(serving_config.get('batch', {}).get('max_concurrency', 4),
+                      serving_config.get('max_in_flight_llm_calls', 8)))
+
 app = FastAPI(
     title="Adobe Analytics Documentation API",
     description="API for querying Adobe Analytics documentation using AI",
@@ -41,6 +61,30 @@ app.add_middleware(
 # Initialize the documentation indexer
 indexer = None
 
+# Serving-side concurrency control, created once the config is known
+llm_gate = None
+request_coalescer = RequestCoalescer()
+
+# Index reloads, one at a time, and the task polling for new versions
+reload_lock = asyncio.Lock()
+reload_task = None
+
+# Read from whichever gate is current when /metrics is scraped
+IN_FLIGHT.set_function(lambda: llm_gate.in_flight if llm_gate is not None else 0, kind="llm_calls")
+IN_FLIGHT.set_function(lambda: llm_gate.queued if llm_gate is not None else 0, kind="llm_queued")
+
+def get_llm_gate(indexer: DocumentationIndexer) -> LLMGate:
+    """Create the LLM concurrency gate from the indexer's serving config"""
+    global llm_gate
+    if llm_gate is None:
+        serving_config = indexer.config.get('serving', {})
+        llm_gate = LLMGate(
+            max_in_flight=serving_config.get('max_in_flight_llm_calls', 8),
+            max_queued=serving_config.get('max_queued_requests', 32),
+            queue_timeout=serving_config.get('queue_timeout', 30)
+        )
+    return llm_gate
+
 def initialize_indexer():
     """Initialize the indexer and load the index"""
     global indexer
@@ -75,11 +119,54 @@ class Message(BaseModel):
 class QuestionRequest(BaseModel):
     question: str
     conversation_history: Optional[List[Message]] = []
+    collections: Optional[List[str]] = None  # Search only these collections; all of them by default
+
+class BatchQuestionRequest(BaseModel):
+    questions: List[str]
+    collections: Optional[List[str]] = None  # Search only these collections; all of them by default
+    # LLM calls in flight for this batch; at most serving.batch.max_concurrency and max_in_flight_llm_calls
+    max_concurrency: Optional[int] = Field(None, ge=1, le=batch_concurrency_limit())
 
 class QuestionResponse(BaseModel):
     answer: str
     sources: List[str]
     conversation_history: List[Message]
+    cached: bool = False  # True when the answer was served from the answer cache
+    usage: Optional[Dict[str, int]] = None  # Token counts after history compaction
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """
+    Time every request, count it by status and track it as in flight.
+    Streamed responses are timed until their last byte is sent.
+    """
+    started = time.perf_counter()
+    IN_FLIGHT.inc(kind="http_requests")
+    try:
+        response = await call_next(request)
+    except Exception:
+        IN_FLIGHT.dec(kind="http_requests")
+        raise
+    # The route template, not the raw path, so unknown URLs add no new series
+    route = request.scope.get("route")
+    endpoint = route.path if route is not None else "unmatched"
+    REQUESTS.inc(endpoint=endpoint, status=str(response.status_code))
+
+    def finish():
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+        IN_FLIGHT.dec(kind="http_requests")
+
+    body = response.body_iterator
+
+    async def timed_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            finish()
+
+    response.body_iterator = timed_body()
+    return response
 
 @app.on_event("startup")
 async def startup_event():
@@ -90,6 +177,37 @@ async def startup_event():
         print(f"❌ Error during startup: {e}")
         # Don't raise an exception here, let the API start anyway
         # The error will be handled when endpoints are called
+    global reload_task
+    interval = indexer.config.get('serving', {}).get('reload_poll_interval', 10) if indexer is not None else 0
+    if interval:
+        reload_task = asyncio.create_task(watch_index(interval))
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if reload_task is not None:
+        reload_task.cancel()
+
+async def reload_index() -> Dict[str, str]:
+    """
+    Load newly published index versions in a worker thread while queries
+    keep being served, then swap them in. Returns the collections reloaded.
+    """
+    async with reload_lock:
+        reloaded = await asyncio.get_running_loop().run_in_executor(None, indexer.reload_index)
+    for name, version in reloaded.items():
+        print(f"✅ Now serving version {version} of collection {name}")
+    return reloaded
+
+async def watch_index(interval: float):
+    """Poll for newly published index versions and hot-swap them in"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            if indexer.index_changed():
+                await reload_index()
+        except Exception as e:
+            # Keep serving the loaded version and try again on the next poll
+            print(f"❌ Error reloading the index: {e}")
 
 @app.get("/")
 async def root():
@@ -99,7 +217,12 @@ async def root():
         "message": "Adobe Analytics Documentation API is running",
         "endpoints": {
             "ask": "/ask (POST) - Ask a question about Adobe Analytics",
-            "health": "/health (GET) - Check API and indexer status"
+            "ask_stream": "/ask/stream (POST) - Ask a question and stream the answer as server-sent events",
+            "ask_batch": "/ask/batch (POST) - Answer many questions and stream the results as NDJSON",
+            "collections": "/collections (GET) - List the documentation collections and their index sizes",
+            "health": "/health (GET) - Check API and indexer status",
+            "metrics": "/metrics (GET) - Prometheus metrics",
+            "admin_reload": "/admin/reload (POST) - Load and swap in newly published index versions"
         }
     }
 
@@ -109,10 +232,70 @@ async def health_check():
     global indexer
     return {
         "status": "healthy",
-        "index_loaded": indexer is not None and hasattr(indexer, 'vectorstore'),
-        "qa_chain_ready": indexer is not None and hasattr(indexer, 'qa_chain')
+        "index_loaded": indexer is not None and bool(indexer.shards),
+        "collections": indexer.current_versions() if indexer is not None else None,
+        "qa_chain_ready": indexer is not None and hasattr(indexer, 'qa_chain'),
+        "query_embedding_cache": indexer.query_cache.stats() if indexer is not None else None,
+        "answer_cache": indexer.answer_cache.stats() if indexer is not None and indexer.answer_cache else None,
+        "llm_gate": llm_gate.stats() if llm_gate is not None else None,
+        "coalesced_requests": request_coalescer.coalesced
+    }
+
+@app.get("/collections")
+async def list_collections():
+    """Configured collections, and the number of chunks of those loaded for serving"""
+    indexer = initialize_indexer()
+    return {
+        "collections": [
+            {
+                "name": name,
+                "loaded": name in indexer.shards,
+                "chunks": len(indexer.shards[name]) if name in indexer.shards else 0,
+                "version": indexer.shards[name].version if name in indexer.shards else None,
+            }
+            for name in indexer.collections
+        ]
     }
 
+@app.post("/admin/reload")
+async def admin_reload(authorization: Optional[str] = Header(None)):
+    """
+    Load newly published index versions now instead of at the next poll.
+    Requires `Authorization: Bearer <ADMIN_TOKEN>`, and is disabled when
+    ADMIN_TOKEN is not set.
+    """
+    token = os.getenv("ADMIN_TOKEN")
+    if not token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled; set ADMIN_TOKEN to enable them")
+    if not hmac.compare_digest(authorization or "", f"Bearer {token}"):
+        raise HTTPException(status_code=401, detail="Invalid or missing admin token")
+    indexer = initialize_indexer()
+    try:
+        reloaded = await reload_index()
+    except Exception as e:
+        print(f"❌ Error reloading the index: {e}")
+        raise HTTPException(status_code=500, detail=f"Reload failed, still serving the loaded version: {e}")
+    return {"reloaded": reloaded, "collections": indexer.current_versions()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Counters, gauges and stage timing histograms in the Prometheus text format"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+def history_turns(request: QuestionRequest) -> List[Tuple[str, str]]:
+    """The conversation so far as (role, content) pairs"""
+    return [(msg.role, msg.content) for msg in request.conversation_history or []]
+
+def build_full_question(request: QuestionRequest) -> str:
+    """Prefix the question with the whole conversation and the collections, used as the coalescing key"""
+    conversation_context = ""
+    if request.collections:
+        conversation_context += f"collections: {','.join(sorted(set(request.collections)))}\n"
+    if request.conversation_history:
+        for msg in request.conversation_history:
+            conversation_context += f"{msg.role}: {msg.content}\n"
+    return f"{conversation_context}User: {request.question}"
+
 @app.post("/ask", response_model=QuestionResponse)
 async def ask_question(request: QuestionRequest):
     """
@@ -122,17 +305,20 @@ async def ask_question(request: QuestionRequest):
         # Ensure indexer is initialized
         indexer = initialize_indexer()
         
-        # Format conversation history for context
-        conversation_context = ""
-        if request.conversation_history:
-            for msg in request.conversation_history:
-                conversation_context += f"{msg.role}: {msg.content}\n"
-        
-        # Combine conversation history with current question
-        full_question = f"{conversation_context}User: {request.question}"
-        
-        # Get answer using the indexer
-        result = indexer.ask_question(full_question)
+        # Get answer using the indexer without blocking the event loop; the
+        # history is compacted to its token budget, and identical conversations
+        # in flight at the same time share one upstream call
+        try:
+            result = await request_coalescer.run(
+                normalize_question(build_full_question(request)),
+                lambda: indexer.ask_question_async(request.question, llm_gate=get_llm_gate(indexer),
+                                                   history=history_turns(request),
+                                                   collections=request.collections)
+            )
+        except Overloaded as e:
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+        except UnknownCollection as e:
+            raise HTTPException(status_code=400, detail=str(e))
         
         # Create response with updated conversation history
         response = QuestionResponse(
@@ -141,7 +327,9 @@ async def ask_question(request: QuestionRequest):
             conversation_history=request.conversation_history + [
                 Message(role="user", content=request.question),
                 Message(role="assistant", content=result["answer"], sources=result["sources"])
-            ]
+            ],
+            cached=result.get("cached", False),
+            usage=result.get("usage")
         )
         
         return response
@@ -155,6 +343,93 @@ async def ask_question(request: QuestionRequest):
             detail=error_detail
         )
 
+def sse_event(event: str, data: dict) -> str:
+    """Format one server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/ask/stream")
+async def ask_question_stream(request: QuestionRequest):
+    """
+    Ask a question and stream the answer as server-sent events: a "sources"
+    event once retrieval finishes, "token" events as the answer is generated,
+    and a final "done" event carrying the updated conversation history
+    """
+    indexer = initialize_indexer()
+    try:
+        indexer.select_shards(request.collections)
+    except UnknownCollection as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def events():
+        answer_parts = []
+        sources = []
+        cached = False
+        usage = None
+        try:
+            async for event, data in indexer.stream_answer(request.question, llm_gate=get_llm_gate(indexer),
+                                                           history=history_turns(request),
+                                                           collections=request.collections):
+                if event == "sources":
+                    sources = data["sources"]
+                    cached = data["cached"]
+                    usage = data["usage"]
+                elif event == "token":
+                    answer_parts.append(data["token"])
+                yield sse_event(event, data)
+
+            answer = "".join(answer_parts)
+            conversation_history = request.conversation_history + [
+                Message(role="user", content=request.question),
+                Message(role="assistant", content=answer, sources=sources)
+            ]
+            yield sse_event("done", {
+                "answer": answer,
+                "sources": sources,
+                "cached": cached,
+                "usage": usage,
+                "conversation_history": [msg.model_dump() for msg in conversation_history]
+            })
+        except Overloaded as e:
+            yield sse_event("error", {"status": 429, "detail": str(e)})
+        except Exception as e:
+            print(f"Error streaming answer: {e}\nTraceback: {traceback.format_exc()}")
+            yield sse_event("error", {"status": 500, "detail": f"Error processing question: {str(e)}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/ask/batch")
+async def ask_question_batch(request: BatchQuestionRequest):
+    """
+    Answer many independent questions and stream the results as NDJSON, one
+    line per question in completion order, each with the question's `index`
+    in the request. The last line carries the throughput `report`.
+    """
+    indexer = initialize_indexer()
+    max_questions = indexer.config.get('serving', {}).get('batch', {}).get('max_questions', 10000)
+    if len(request.questions) > max_questions:
+        raise HTTPException(status_code=413, detail=f"At most {max_questions} questions per batch")
+    try:
+        indexer.select_shards(request.collections)
+    except UnknownCollection as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def lines():
+        try:
+            async for event, data in indexer.ask_batch(request.questions, llm_gate=get_llm_gate(indexer),
+                                                       collections=request.collections,
+                                                       max_concurrency=request.max_concurrency):
+                yield json.dumps(data if event == "result" else {"report": data}) + "\n"
+        except Exception as e:
+            print(f"Error answering batch: {e}\nTraceback: {traceback.format_exc()}")
+            yield json.dumps({"error": f"Error processing batch: {str(e)}", "status": 500}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 def main():
     """Run the API server"""
     uvicorn.run(app, host="0.0.0.0", port=8001)
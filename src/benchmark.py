@@ -0,0 +1,349 @@
+"""
+Offline end-to-end benchmark: crawl, index and serve a synthetic doc site.
+
+Serves a generated documentation site from a local HTTP server, with a
+configurable number of pages, link fan-out, share of JavaScript-rendered
+pages and share of near-duplicate pages. It then runs the real DocumentationIndexer against it with
+deterministic fake embeddings, and load-tests /ask with a latency-simulating
+fake LLM. Nothing leaves the machine. The JSON report covers crawl throughput,
+extraction time per page, bytes and load time of browser-rendered pages,
+split/embed/index build times, what deduplication saved, index size, an incremental re-crawl, and /ask
+latency percentiles per client concurrency. The site also serves robots.txt
+and a sitemap index with gzipped sitemaps, for `--discovery sitemap`.
+
+    python src/benchmark.py --pages 200 --fan-out 5 --js-fraction 0.1 --output bench.json
+
+JavaScript-rendered pages need the Playwright browser (playwright install chromium);
+without it they are reported as failed pages.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, Optional
+
+sys.path.append(str(Path(__file__).parent))
+
+import api
+from concurrency import LLMGate
+from doc_indexer import DocumentationIndexer
+from fakes import FakeChatModel, HashEmbeddings
+from load_test import TOPICS, run_level, start_server
+from shards import DEFAULT_COLLECTION, Collection
+
+WORDS = ("report suite dimension metric visitor visit hit segment container rule classification "
+         "workspace panel freeform table calculated attribution lookback allocation expiration "
+         "implementation variable tracking server call beacon data collection processing").split()
+
+
+class SyntheticSite:
+    """
+    Deterministic documentation site: page i links to its `fan_out` children
+    i * fan_out + 1 .. i * fan_out + fan_out and back to the home page.
+    A `js_fraction` share of pages (never the home page) render their content
+    and links with JavaScript, so only a browser can extract them. A
+    `duplicate_fraction` share repeat the content of an earlier page under
+    their own heading, like a page mirrored under another path.
+    Every page is listed in one of the gzipped sitemaps of /sitemap.xml,
+    with a `<lastmod>` that moves when the page is `modify`-ed.
+    """
+
+    def __init__(self, pages: int, fan_out: int = 5, js_fraction: float = 0.0,
+                 paragraphs: int = 8, seed: int = 0, duplicate_fraction: float = 0.0):
+        self.pages = pages
+        self.fan_out = max(1, fan_out)
+        self.paragraphs = paragraphs
+        self.seed = seed
+        rng = random.Random(seed)
+        self.js_pages = {i for i in range(1, pages) if rng.random() < js_fraction}
+        self.duplicates = {i: rng.randrange(i) for i in range(1, pages) if rng.random() < duplicate_fraction}
+        self.versions: Dict[int, int] = {}
+        self.modified_at: Dict[int, float] = {}
+
+    @property
+    def depth(self) -> int:
+        """Link depth of the deepest page below the home page"""
+        depth, reach, width = 0, 1, 1
+        while reach < self.pages:
+            width *= self.fan_out
+            reach += width
+            depth += 1
+        return depth
+
+    @staticmethod
+    def path(i: int) -> str:
+        return f"/docs/{i}.html"
+
+    def _body(self, i: int) -> str:
+        source = i
+        while source in self.duplicates:
+            source = self.duplicates[source]
+        rng = random.Random(self.seed * 1000003 + source)
+        topic = TOPICS[source % len(TOPICS)]
+        parts = [f"<h1>Working with {topic}, part {i}</h1>"]
+        if self.versions.get(i):
+            parts.append(f"<p>Revision {self.versions[i]} of this page.</p>")
+        for p in range(self.paragraphs):
+            if p % 3 == 0:
+                parts.append(f"<h2>Section {p // 3 + 1}</h2>")
+            words = rng.choices(WORDS, k=60)
+            words[rng.randrange(60)] = f"eVar{rng.randint(1, 250)}"
+            parts.append(f"<p>{' '.join(words).capitalize()}.</p>")
+        parts.append(f"<ul><li>Uses prop{source % 75 + 1}</li><li>Sends s.tl() link calls</li></ul>")
+        parts.append(f"<pre>s.eVar{source % 250 + 1} = \"{topic}\";\ns.t();</pre>")
+        return "".join(parts)
+
+    def _links(self, i: int) -> str:
+        children = range(i * self.fan_out + 1, min(self.pages, i * self.fan_out + self.fan_out + 1))
+        return "".join(f'<li><a href="{self.path(c)}">Page {c}</a></li>' for c in children)
+
+    def html(self, i: int) -> str:
+        nav = f'<nav><a href="{self.path(0)}">Home</a></nav>'
+        if i in self.js_pages:
+            payload = json.dumps({"body": self._body(i), "links": self._links(i)})
+            return (f"<html><head><title>Page {i}</title></head><body>{nav}"
+                    f'<main id="content"></main>'
+                    f"<script>const page = {payload};"
+                    f"document.getElementById('content').innerHTML = page.body + '<ul>' + page.links + '</ul>';"
+                    f"</script></body></html>")
+        return (f"<html><head><title>Page {i}</title></head><body>{nav}"
+                f"<main>{self._body(i)}<ul>{self._links(i)}</ul></main>"
+                f"<footer>Copyright</footer></body></html>")
+
+    def modify(self, i: int) -> None:
+        self.versions[i] = self.versions.get(i, 0) + 1
+        self.modified_at[i] = time.time()
+
+    def lastmod(self, i: int) -> str:
+        if i not in self.modified_at:
+            return "2024-01-01"
+        return datetime.fromtimestamp(self.modified_at[i], timezone.utc).isoformat(timespec='seconds')
+
+    def sitemap(self, name: str, base_url: str, per_file: int = 100) -> Optional[bytes]:
+        """robots.txt, the sitemap index and its gzipped sitemaps"""
+        files = range(-(-self.pages // per_file))
+        if name == "/robots.txt":
+            return f"User-agent: *\nAllow: /\nSitemap: {base_url}/sitemap.xml\n".encode('utf-8')
+        ns = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+        if name == "/sitemap.xml":
+            entries = "".join(f"<sitemap><loc>{base_url}/sitemaps/{n}.xml.gz</loc></sitemap>" for n in files)
+            return f'<?xml version="1.0" encoding="UTF-8"?><sitemapindex {ns}>{entries}</sitemapindex>'.encode('utf-8')
+        if name.startswith("/sitemaps/") and name.endswith(".xml.gz"):
+            n = int(name[len("/sitemaps/"):-len(".xml.gz")])
+            pages = range(n * per_file, min(self.pages, (n + 1) * per_file))
+            entries = "".join(f"<url><loc>{base_url}{self.path(i)}</loc><lastmod>{self.lastmod(i)}</lastmod></url>"
+                              for i in pages)
+            return gzip.compress(f'<?xml version="1.0" encoding="UTF-8"?><urlset {ns}>{entries}</urlset>'.encode('utf-8'))
+        return None
+
+    def serve(self, port: int) -> ThreadingHTTPServer:
+        """Serve the site from a background thread, with ETags for conditional requests"""
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                name = self.path.split('?')[0]
+                sitemap = site.sitemap(name, f"http://127.0.0.1:{port}")
+                if sitemap is not None:
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain' if name.endswith('.txt') else 'application/xml')
+                    self.send_header('Content-Length', str(len(sitemap)))
+                    self.end_headers()
+                    self.wfile.write(sitemap)
+                    return
+                if not (name.startswith("/docs/") and name.endswith(".html")):
+                    self.send_error(404)
+                    return
+                try:
+                    i = int(name[len("/docs/"):-len(".html")])
+                except ValueError:
+                    i = -1
+                if not 0 <= i < site.pages:
+                    self.send_error(404)
+                    return
+                body = site.html(i).encode('utf-8')
+                etag = '"' + hashlib.md5(body).hexdigest() + '"'
+                if self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+def stage_ms_per_item(stages: Dict[str, dict], stage: str) -> Optional[float]:
+    timing = stages.get(stage)
+    if not timing or not timing["count"]:
+        return None
+    return round(timing["seconds"] / timing["count"] * 1000, 3)
+
+
+def stage_seconds(stages: Dict[str, dict], stage: str) -> float:
+    return stages.get(stage, {}).get("seconds", 0.0)
+
+
+def crawl_report(run: dict) -> dict:
+    return {
+        "pages_crawled": run["pages_crawled"],
+        "pages_failed": run["pages_failed"],
+        "crawl_seconds": run["crawl_seconds"],
+        "pages_per_second": run["pages_per_second"],
+        "pages_changed": run["pages_changed"],
+        "pages_unchanged": run["pages_unchanged"],
+        "pages_skipped": run["pages_skipped"],
+    }
+
+
+def build_indexer(index_path: str, site_url: str, site: SyntheticSite, args) -> DocumentationIndexer:
+    """Point a real indexer at the local site, with fake embeddings and LLM"""
+    config_path = os.path.join(Path(__file__).parent.absolute(), "config.yaml")
+    indexer = DocumentationIndexer(config_path=config_path, embeddings=HashEmbeddings(),
+                                   llm=FakeChatModel(latency=args.llm_latency))
+    # Every chunk reaches the embedding backend, so the embed stage is measured honestly
+    indexer.embeddings.cache = None
+    indexer.config['vector_store']['index_path'] = index_path
+    indexer.collections = {DEFAULT_COLLECTION: Collection(
+        DEFAULT_COLLECTION, [site_url + site.path(0)], {'accepted': [f"{site_url}/docs/*"], 'blacklisted': []}, index_path
+    )}
+    indexer.max_depth = site.depth + 1
+    indexer.fetch_mode = args.fetch_mode
+    indexer.discovery = args.discovery
+    indexer.crawler_config.update({
+        'state_path': os.path.join(os.path.dirname(index_path), "crawl_state.sqlite"),
+        'concurrency': args.crawl_concurrency,
+        'per_host_concurrency': args.crawl_concurrency,
+        'requests_per_second': 0,
+        'report_every': max(25, site.pages // 10),
+    })
+    return indexer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark on a synthetic doc site")
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--fan-out", type=int, default=5, help="Links from each page to new pages")
+    parser.add_argument("--js-fraction", type=float, default=0.0,
+                        help="Share of pages rendered by JavaScript (needs the Playwright browser)")
+    parser.add_argument("--paragraphs", type=int, default=8, help="Paragraphs per page")
+    parser.add_argument("--duplicate-fraction", type=float, default=0.0,
+                        help="Share of pages that nearly duplicate an earlier page")
+    parser.add_argument("--fetch-mode", default="auto", choices=["auto", "http", "browser"])
+    parser.add_argument("--discovery", default="links", choices=["links", "sitemap"])
+    parser.add_argument("--modified-fraction", type=float, default=0.0,
+                        help="Share of pages changed, with a new sitemap lastmod, before the re-crawl")
+    parser.add_argument("--crawl-concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Simulated LLM latency in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests-per-client", type=int, default=4)
+    parser.add_argument("--max-in-flight", type=int, default=16, help="Cap on concurrent LLM calls")
+    parser.add_argument("--site-port", type=int, default=8803)
+    parser.add_argument("--api-port", type=int, default=8804)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    site = SyntheticSite(args.pages, args.fan_out, args.js_fraction, args.paragraphs,
+                         duplicate_fraction=args.duplicate_fraction)
+    site_server = site.serve(args.site_port)
+    site_url = f"http://127.0.0.1:{args.site_port}"
+    root_url = site_url + site.path(0)
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            # Indexer progress goes to stderr so stdout carries only the report
+            with redirect_stdout(sys.stderr):
+                indexer = build_indexer(os.path.join(tmp, "faiss_index"), site_url, site, args)
+                first = indexer.index_documents([root_url], full_rebuild=True)
+                indexer.processed_urls = set()
+                rng = random.Random(site.seed + 1)
+                for i in range(site.pages):
+                    if rng.random() < args.modified_fraction:
+                        site.modify(i)
+                recrawl = indexer.index_documents([root_url])
+
+                indexer.load_index()
+                indexer.setup_qa_chain()
+                # Unique questions and no answer cache, so every request reaches the LLM
+                indexer.answer_cache = None
+                api.indexer = indexer
+                api.llm_gate = LLMGate(max_in_flight=args.max_in_flight, max_queued=10000, queue_timeout=600)
+                api_server = start_server(args.api_port)
+                try:
+                    levels = []
+                    for concurrency in args.concurrency:
+                        result = run_level(args.api_port, concurrency, concurrency * args.requests_per_client)
+                        levels.append(result)
+                        print(f"concurrency={concurrency:3d}  {result['throughput_rps']:7.2f} req/s  "
+                              f"p50={result['p50_ms']}ms p95={result['p95_ms']}ms p99={result['p99_ms']}ms")
+                finally:
+                    api_server.should_exit = True
+    finally:
+        site_server.shutdown()
+
+    stages = first["stages"]
+    report = {
+        "site": {
+            "pages": site.pages,
+            "fan_out": site.fan_out,
+            "js_pages": len(site.js_pages),
+            "duplicate_pages": len(site.duplicates),
+            "depth": site.depth,
+        },
+        "crawl": crawl_report(first),
+        "extraction": {
+            "static_ms_per_page": stage_ms_per_item(stages, "extract_static"),
+            "browser_ms_per_page": stage_ms_per_item(stages, "extract_browser"),
+        },
+        "browser_loads": first["browser"],
+        "build": {
+            "chunks": first["chunks_added"],
+            "split_s": round(stage_seconds(stages, "split"), 3),
+            "embed_s": round(stage_seconds(stages, "embed"), 3),
+            "index_s": round(stage_seconds(stages, "index"), 3),
+            "checkpoint_s": round(stage_seconds(stages, "checkpoint"), 3),
+            "ann_build_s": round(stage_seconds(stages, "ann_build"), 3),
+            "bm25_build_s": round(stage_seconds(stages, "bm25_build"), 3),
+            "dedup_s": round(stage_seconds(stages, "dedup"), 3),
+        },
+        "dedup": first["dedup"],
+        "index": {
+            "bytes": first["index_bytes"],
+            "mb": round(first["index_bytes"] / 1e6, 3),
+        },
+        "recrawl": crawl_report(recrawl),
+        "ask": {
+            "llm_latency_s": args.llm_latency,
+            "max_in_flight_llm_calls": args.max_in_flight,
+            "levels": levels,
+        },
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import re
+from array import array
+from collections import Counter
+from typing import Dict, Hashable, Iterable, List, Tuple
+
+import numpy as np
+
+BM25_FILENAME = "bm25.npz"
+
+# Dropped from documents and queries: they match nearly every chunk, so they
+# cost the most postings to score while barely moving the ranking
+STOPWORDS = frozenset(
+    "a an and are as at be by can do does for from has have how i if in is it its "
+    "me my of on or so than that the then there these this to was we what when "
+    "where which who why will with you your".split()
+)
+
+# Keeps identifiers like s.tl, evar5 or page_name together
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[._][a-z0-9]+)*")
+_NUMBERED_RE = re.compile(r"^([a-z]+)\d+$")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercased word tokens. Dotted and underscored identifiers also yield
+    their parts, and numbered ones their stem, so "eVar5" matches "eVar".
+    """
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in STOPWORDS:
+            continue
+        tokens.append(token)
+        if '.' in token or '_' in token:
+            tokens.extend(part for part in re.split(r'[._]', token) if part and part not in STOPWORDS)
+        numbered = _NUMBERED_RE.match(token)
+        if numbered:
+            tokens.append(numbered.group(1))
+    return tokens
+
+
+class BM25Index:
+    """
+    Okapi BM25 over an inverted index stored as flat numpy arrays.
+
+    Documents are identified by their position, matching the vector index.
+    Postings of term t are `postings[indptr[t]:indptr[t + 1]]`, with the
+    length-normalized term frequency part of the score precomputed in
+    `weights`, so a query is a few array slices summed per document.
+    """
+
+    def __init__(self, vocabulary: Dict[str, int], idf: np.ndarray, indptr: np.ndarray,
+                 postings: np.ndarray, weights: np.ndarray, size: int, k1: float, b: float):
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.indptr = indptr
+        self.postings = postings
+        self.weights = weights
+        self.size = size
+        self.k1 = k1
+        self.b = b
+
+    @classmethod
+    def build(cls, texts: Iterable[str], k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        vocabulary: Dict[str, int] = {}
+        term_ids, doc_ids, term_counts = array('i'), array('i'), array('f')
+        lengths = array('f')
+        for doc, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            for term, count in counts.items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_ids.append(doc)
+                term_counts.append(count)
+            lengths.append(sum(counts.values()))
+
+        term_ids = np.frombuffer(term_ids, dtype=np.int32)
+        doc_ids = np.frombuffer(doc_ids, dtype=np.int32)
+        tf = np.frombuffer(term_counts, dtype=np.float32)
+        lengths = np.frombuffer(lengths, dtype=np.float32)
+        size = len(lengths)
+
+        average_length = float(lengths.mean()) if size and lengths.mean() > 0 else 1.0
+        norm = k1 * (1 - b + b * lengths[doc_ids] / average_length)
+        weights = (tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+
+        order = np.argsort(term_ids, kind='stable')
+        df = np.bincount(term_ids, minlength=len(vocabulary))
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(df, out=indptr[1:])
+        idf = np.log(1 + (size - df + 0.5) / (df + 0.5)).astype(np.float32)
+        return cls(vocabulary, idf, indptr, doc_ids[order], weights[order], size, k1, b)
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Top `k` (position, score) pairs for the query, best first"""
+        term_ids = [self.vocabulary[t] for t in dict.fromkeys(tokenize(query)) if t in self.vocabulary]
+        if not term_ids or k <= 0:
+            return []
+        slices = [slice(self.indptr[t], self.indptr[t + 1]) for t in term_ids]
+        matches = sum(s.stop - s.start for s in slices)
+
+        if matches * 8 >= self.size:
+            # Postings cover much of the corpus: scatter-add into a dense array.
+            # A term lists each document once, so the fancy-indexed add is exact.
+            candidates = np.arange(self.size)
+            totals = np.zeros(self.size, dtype=np.float32)
+            for s, t in zip(slices, term_ids):
+                totals[self.postings[s]] += self.weights[s] * self.idf[t]
+        else:
+            # Few matches: sum per matching document only
+            docs = np.concatenate([self.postings[s] for s in slices])
+            scores = np.concatenate([self.weights[s] * self.idf[t] for s, t in zip(slices, term_ids)])
+            candidates, inverse = np.unique(docs, return_inverse=True)
+            totals = np.bincount(inverse, weights=scores)
+
+        if len(totals) > k:
+            top = np.argpartition(-totals, k - 1)[:k]
+        else:
+            top = np.arange(len(totals))
+        top = top[np.argsort(-totals[top], kind='stable')]
+        return [(int(candidates[i]), float(totals[i])) for i in top if totals[i] > 0]
+
+    def __len__(self) -> int:
+        return self.size
+
+    def save(self, path: str) -> None:
+        """Write the index atomically, so readers never see a torn file"""
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        with open(path + ".tmp", 'wb') as f:
+            np.savez(f, terms=np.array(terms, dtype=str), idf=self.idf, indptr=self.indptr,
+                     postings=self.postings, weights=self.weights,
+                     params=np.array([self.size, self.k1, self.b], dtype=np.float64))
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with np.load(path, allow_pickle=False) as data:
+            size, k1, b = data['params']
+            vocabulary = {term: i for i, term in enumerate(data['terms'].tolist())}
+            return cls(vocabulary, data['idf'], data['indptr'], data['postings'], data['weights'],
+                       int(size), float(k1), float(b))
+
+
+def reciprocal_rank_fusion(rankings: List[Tuple[List[Hashable], float]], rrf_k: int = 60) -> List[Hashable]:
+    """
+    Fuse ranked lists of positions (or any hashable hit keys), each with a
+    weight, by weighted reciprocal rank: score(d) = sum of weight / (rrf_k + rank of d)
+    """
+    scores: Dict[Hashable, float] = {}
+    for ranking, weight in rankings:
+        for rank, position in enumerate(ranking, start=1):
+            scores[position] = scores.get(position, 0.0) + weight / (rrf_k + rank)
+    return sorted(scores, key=scores.get, reverse=True)
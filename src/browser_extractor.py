@@ -0,0 +1,161 @@
+"""
+In-page content extraction for rendered pages.
+
+Main content detection, exclusion, the document-order walk to markdown blocks,
+the title and the links are all computed by one script in a single
+`page.evaluate` round trip. The walk mirrors `html_extractor._BlockWriter`,
+and the blocks are rendered by the same `render_blocks`, so static and
+rendered pages produce the same content.
+"""
+from typing import Dict, List, Optional
+
+from html_extractor import render_blocks
+
+DEFAULT_RULES = {
+    'main_content': ['main', 'article', '.content', '#content', '.main-content', 'div[role="main"]'],
+    'exclude': [
+        'nav', 'header', 'footer', '.navigation', '.sidebar',
+        '.breadcrumb', '.pagination', '.social-share', '.related-content',
+        'script', 'style', 'noscript', 'iframe', 'form'
+    ],
+    'wait_timeout': 5,
+}
+
+EXTRACT_SCRIPT = r'''(rules) => {
+    const HIDDEN = new Set(['SCRIPT', 'STYLE', 'NOSCRIPT', 'TEMPLATE', 'HEAD', 'TITLE']);
+    const BLOCKS = new Set(['ADDRESS', 'ARTICLE', 'ASIDE', 'BLOCKQUOTE', 'DIV', 'DL', 'DT', 'DD',
+        'FIELDSET', 'FIGCAPTION', 'FIGURE', 'FOOTER', 'FORM', 'H1', 'H2', 'H3', 'H4', 'H5', 'H6',
+        'HEADER', 'HR', 'LI', 'MAIN', 'NAV', 'OL', 'P', 'PRE', 'SECTION', 'TABLE', 'TR', 'UL']);
+
+    let main = null, mainSelector = null;
+    for (const selector of rules.main_content) {
+        try { main = document.querySelector(selector); } catch (e) { continue; }
+        if (main) { mainSelector = selector; break; }
+    }
+    if (!main) main = document.body || document.documentElement;
+
+    // One query per rule, then set lookups during the walk; nothing is removed from the page
+    const excluded = new Set();
+    for (const selector of rules.exclude) {
+        try { document.querySelectorAll(selector).forEach(el => excluded.add(el)); } catch (e) {}
+    }
+    const hidden = (el) => HIDDEN.has(el.tagName) || el.hidden
+        || (el.checkVisibility ? !el.checkVisibility() : false);
+    const skipped = (el) => excluded.has(el) || hidden(el);
+
+    const text = (node, pre) => {
+        const parts = [];
+        const walk = (current) => {
+            for (const child of current.childNodes) {
+                if (child.nodeType === 3) parts.push(child.nodeValue);
+                else if (child.nodeType !== 1 || skipped(child)) continue;
+                else if (child.tagName === 'BR') parts.push(pre ? '\n' : ' ');
+                else walk(child);
+            }
+        };
+        walk(node);
+        const joined = parts.join('');
+        return pre ? joined.replace(/^\n+|\s+$/g, '') : joined.replace(/\s+/g, ' ').trim();
+    };
+
+    const blocks = [];
+    let buffer = [], listDepth = 0, itemMarker = null;
+    const flush = () => {
+        const value = buffer.join('').split('\n')
+            .map(line => line.replace(/\s+/g, ' ').trim()).filter(line => line).join('\n');
+        buffer = [];
+        if (!value) return;
+        if (itemMarker !== null) { blocks.push(['item', itemMarker + value]); itemMarker = null; }
+        else if (listDepth) blocks.push(['item', '  '.repeat(listDepth) + value]);
+        else blocks.push(['paragraph', value]);
+    };
+    const walk = (node) => {
+        for (const child of node.childNodes) {
+            if (child.nodeType === 3) { buffer.push(child.nodeValue.replace(/\s+/g, ' ')); continue; }
+            if (child.nodeType !== 1 || skipped(child)) continue;
+            const tag = child.tagName;
+            if (tag === 'BR') {
+                buffer.push('\n');
+            } else if (/^H[1-6]$/.test(tag)) {
+                flush();
+                const value = text(child, false);
+                if (value) blocks.push(['heading', '#'.repeat(Number(tag[1])) + ' ' + value]);
+            } else if (tag === 'PRE') {
+                flush();
+                const value = text(child, true);
+                if (value.trim()) blocks.push(['code', value]);
+            } else if (tag === 'TABLE') {
+                flush();
+                for (const row of child.querySelectorAll('tr')) {
+                    if (skipped(row)) continue;
+                    const cells = Array.from(row.children).filter(cell => cell.tagName === 'TD' || cell.tagName === 'TH')
+                        .map(cell => skipped(cell) ? '' : text(cell, false));
+                    if (cells.some(cell => cell)) blocks.push(['row', '| ' + cells.join(' | ') + ' |']);
+                }
+            } else if (tag === 'UL' || tag === 'OL') {
+                flush();
+                listDepth += 1;
+                walk(child);
+                listDepth -= 1;
+            } else if (tag === 'LI') {
+                flush();
+                itemMarker = '  '.repeat(Math.max(0, listDepth - 1)) + '- ';
+                walk(child);
+                flush();
+                itemMarker = null;
+            } else if (BLOCKS.has(tag)) {
+                flush();
+                walk(child);
+                flush();
+            } else {
+                walk(child);
+            }
+        }
+    };
+    walk(main);
+    flush();
+
+    const insideExcluded = (el) => {
+        for (let current = el; current; current = current.parentElement) {
+            if (excluded.has(current)) return true;
+        }
+        return false;
+    };
+    const links = Array.from(document.querySelectorAll('a[href]'))
+        .filter(link => !insideExcluded(link)).map(link => link.href);
+
+    return {blocks, title: document.title, links, mainSelector};
+}'''
+
+
+class RenderedPage:
+    """Content, title and links extracted from a page in the browser"""
+
+    def __init__(self, content: str, title: str, links: List[str], main_selector: Optional[str]):
+        self.content = content
+        self.title = title
+        self.links = links
+        self.main_selector = main_selector
+
+
+async def wait_for_main_content(page, rules: Dict) -> bool:
+    """
+    Wait once for any main-content selector to be attached, instead of up to
+    `wait_timeout` per selector. Returns whether one appeared in time.
+    """
+    try:
+        await page.wait_for_selector(', '.join(rules['main_content']), state='attached',
+                                     timeout=rules.get('wait_timeout', 5) * 1000)
+        return True
+    except Exception:
+        return False
+
+
+async def extract_rendered_page(page, rules: Dict) -> RenderedPage:
+    """Extract content, title and links of a rendered page in one round trip"""
+    result = await page.evaluate(EXTRACT_SCRIPT, {
+        'main_content': rules['main_content'],
+        'exclude': rules['exclude'],
+    })
+    blocks = [(kind, text) for kind, text in result['blocks']]
+    return RenderedPage(render_blocks(blocks), result['title'], result['links'], result['mainSelector'])
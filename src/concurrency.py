@@ -0,0 +1,82 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot get an LLM slot in time or the queue is full"""
+
+
+class LLMGate:
+    """
+    Caps the number of in-flight LLM calls. Callers beyond the cap wait in a
+    bounded queue for at most `queue_timeout` seconds; when the queue is full
+    they are rejected immediately.
+    """
+
+    def __init__(self, max_in_flight: int = 8, max_queued: int = 32, queue_timeout: float = 30.0):
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queued = max(0, max_queued)
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        self.in_flight = 0
+        self.queued = 0
+        self.rejected = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold an LLM slot, e.g. for the whole duration of a streamed answer"""
+        if self._semaphore.locked() and self.queued >= self.max_queued:
+            self.rejected += 1
+            raise Overloaded(f"Too many pending questions ({self.queued} queued)")
+
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise Overloaded(f"Timed out after {self.queue_timeout}s waiting for an LLM slot")
+        finally:
+            self.queued -= 1
+
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    async def run(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        """Run `call` once a slot is free"""
+        async with self.slot():
+            return await call()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "max_in_flight": self.max_in_flight,
+        }
+
+
+class RequestCoalescer:
+    """
+    Shares a single in-flight call among concurrent requests with the same key,
+    so identical questions asked at the same time cost one upstream call
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.coalesced = 0
+
+    async def run(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(call())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # Shielded so one caller disconnecting does not cancel the shared call
+        return await asyncio.shield(task)
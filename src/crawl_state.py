@@ -0,0 +1,143 @@
+import json
+import os
+import sqlite3
+import time
+from typing import Iterator, List, Optional, Set, Tuple
+
+
+class CrawlState:
+    """
+    On-disk state of the crawl in progress: the frontier, the visited URLs
+    and the pages extracted so far, so a crawl that was killed resumes where
+    it stopped instead of starting over.
+
+    Updates are buffered and committed together every `checkpoint_every`
+    pages or `checkpoint_interval` seconds. A page is marked done in the same
+    transaction that queues its links, so after a crash every URL is either
+    done with its links queued, or still queued and fetched again.
+    """
+
+    def __init__(self, path: str, checkpoint_every: int = 50, checkpoint_interval: float = 10.0):
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS urls ("
+            " url TEXT PRIMARY KEY, depth INTEGER NOT NULL, status TEXT NOT NULL, seq INTEGER NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            " url TEXT PRIMARY KEY, changed INTEGER NOT NULL, entry TEXT, content TEXT)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+        self._url_updates: List[Tuple[str, int, str, int]] = []
+        self._page_updates: List[Tuple[str, int, Optional[str], Optional[str]]] = []
+        self._pages_since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+        self._seq = self._conn.execute("SELECT COALESCE(MAX(seq), 0) FROM urls").fetchone()[0]
+        self.resumed = False
+
+    def _meta(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def begin(self, signature: dict, resume: bool = True) -> bool:
+        """
+        Resume the unfinished crawl with the same `signature` (seeds, depth,
+        patterns), or start a new one. Returns whether it resumed.
+        """
+        signature_json = json.dumps(signature, sort_keys=True)
+        unfinished = self._meta('status') == 'running'
+        if resume and unfinished and self._meta('signature') == signature_json:
+            self.resumed = True
+            return True
+        if unfinished:
+            print("⚠️ Discarding the state of an unfinished crawl with different seeds or settings")
+        with self._conn:
+            self._conn.execute("DELETE FROM urls")
+            self._conn.execute("DELETE FROM pages")
+            self._conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", [
+                ('status', 'running'), ('signature', signature_json), ('started_at', str(time.time())),
+            ])
+        self._seq = 0
+        self.resumed = False
+        return False
+
+    def enqueue(self, url: str, depth: int) -> None:
+        self._seq += 1
+        self._url_updates.append((url, depth, 'queued', self._seq))
+
+    def page_done(self, url: str, depth: int) -> None:
+        self._url_updates.append((url, depth, 'done', 0))
+        self._pages_since_checkpoint += 1
+
+    def page_failed(self, url: str, depth: int) -> None:
+        self._url_updates.append((url, depth, 'failed', 0))
+        self._pages_since_checkpoint += 1
+
+    def record_page(self, url: str, entry: dict, content: Optional[str]) -> None:
+        """A new or changed page, with everything needed to index it later"""
+        self._page_updates.append((url, 1, json.dumps(entry), content))
+
+    def record_unchanged(self, url: str) -> None:
+        self._page_updates.append((url, 0, None, None))
+
+    def maybe_checkpoint(self) -> None:
+        if (self._pages_since_checkpoint >= self.checkpoint_every
+                or time.monotonic() - self._last_checkpoint >= self.checkpoint_interval):
+            self.checkpoint()
+
+    def checkpoint(self) -> None:
+        """Commit the buffered updates in one transaction"""
+        if self._url_updates or self._page_updates:
+            with self._conn:
+                # A status change keeps the URL's place in the discovery order
+                self._conn.executemany(
+                    "INSERT INTO urls (url, depth, status, seq) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT(url) DO UPDATE SET status = excluded.status", self._url_updates)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO pages (url, changed, entry, content) VALUES (?, ?, ?, ?)",
+                    self._page_updates)
+            self._url_updates = []
+            self._page_updates = []
+        self._pages_since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+
+    def finish(self) -> None:
+        """Mark the crawl complete and drop its state"""
+        self._url_updates = []
+        self._page_updates = []
+        with self._conn:
+            self._conn.execute("DELETE FROM urls")
+            self._conn.execute("DELETE FROM pages")
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('status', 'finished')")
+        self._conn.execute("VACUUM")
+
+    def queued(self) -> List[Tuple[str, int]]:
+        """URLs still to crawl, in the order they were discovered"""
+        return self._conn.execute("SELECT url, depth FROM urls WHERE status = 'queued' ORDER BY seq").fetchall()
+
+    def visited(self) -> Set[str]:
+        return {url for (url,) in self._conn.execute("SELECT url FROM urls")}
+
+    def failed(self) -> Set[str]:
+        return {url for (url,) in self._conn.execute("SELECT url FROM urls WHERE status = 'failed'")}
+
+    def pages(self) -> Iterator[Tuple[str, bool, Optional[dict], Optional[str]]]:
+        """Pages extracted so far: (url, changed, manifest entry, content)"""
+        for url, changed, entry, content in self._conn.execute("SELECT url, changed, entry, content FROM pages"):
+            yield url, bool(changed), json.loads(entry) if entry else None, content
+
+    def counts(self) -> dict:
+        rows = dict(self._conn.execute("SELECT status, COUNT(*) FROM urls GROUP BY status").fetchall())
+        return {"done": rows.get('done', 0), "failed": rows.get('failed', 0), "queued": rows.get('queued', 0)}
+
+    def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,384 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+from urllib.parse import urlparse
+
+from crawl_state import CrawlState
+from metrics import BROWSER_BYTES, BROWSER_REQUESTS_BLOCKED, IN_FLIGHT, PAGES_CRAWLED, PAGES_FAILED, span
+from urls import compile_globs
+
+
+class HostRateLimiter:
+    """
+    Per-host politeness: caps concurrent requests to a host and spaces
+    request starts so that a host never sees more than `requests_per_second`
+    """
+
+    def __init__(self, max_concurrency: int = 4, requests_per_second: float = 2.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._next_start: Dict[str, float] = {}
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """Hold a request slot for the host of `url`"""
+        host = urlparse(url).netloc
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self.max_concurrency))
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with semaphore:
+            if self.interval:
+                async with lock:
+                    loop = asyncio.get_running_loop()
+                    wait = self._next_start.get(host, 0.0) - loop.time()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                    self._next_start[host] = loop.time() + self.interval
+            yield
+
+
+class CrawlStats:
+    """Counters for a single crawl run"""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        self.pages_crawled = 0
+        self.pages_failed = 0
+        self.pages_skipped = 0
+        self.frontier_dropped = 0
+        self.failed_urls: Set[str] = set()
+
+    @property
+    def elapsed(self) -> float:
+        end = self.finished_at if self.finished_at is not None else time.monotonic()
+        return max(end - self.started_at, 1e-9)
+
+    @property
+    def pages_per_second(self) -> float:
+        return self.pages_crawled / self.elapsed
+
+    def summary(self) -> str:
+        skipped = f", {self.pages_skipped} unchanged skipped" if self.pages_skipped else ""
+        return (f"{self.pages_crawled} pages crawled, {self.pages_failed} failed{skipped} "
+                f"in {self.elapsed:.1f}s ({self.pages_per_second:.2f} pages/sec)")
+
+
+# Processes one URL and returns the links discovered on it
+PageProcessor = Callable[[str, int], Awaitable[List[str]]]
+
+# Returns the stored links of a URL known to be unchanged without fetching it, or None to fetch it
+UnchangedCheck = Callable[[str], Optional[List[str]]]
+
+
+class Crawler:
+    """
+    Breadth-first crawl engine with a bounded frontier and a pool of workers.
+
+    The crawler owns scheduling only: it dedups URLs, enforces `max_depth` and
+    per-host politeness, and hands each URL to `process_page`, which fetches
+    and extracts the page and returns the links found on it. URLs that
+    `skip_unchanged` reports as unchanged are not fetched at all, and take
+    no per-host slot.
+
+    With a `state`, the frontier and visited URLs are checkpointed to disk,
+    and a resumed state continues from its queued URLs instead of the seeds.
+    """
+
+    def __init__(self,
+                 process_page: PageProcessor,
+                 is_url_allowed: Callable[[str], bool],
+                 max_depth: int,
+                 concurrency: int = 4,
+                 rate_limiter: Optional[HostRateLimiter] = None,
+                 max_frontier_size: int = 10000,
+                 visited: Optional[Set[str]] = None,
+                 report_every: int = 25,
+                 state: Optional[CrawlState] = None,
+                 skip_unchanged: Optional[UnchangedCheck] = None):
+        self.process_page = process_page
+        self.is_url_allowed = is_url_allowed
+        self.max_depth = max_depth
+        self.concurrency = max(1, concurrency)
+        self.rate_limiter = rate_limiter or HostRateLimiter()
+        self.max_frontier_size = max_frontier_size
+        self.visited = visited if visited is not None else set()
+        self.report_every = report_every
+        self.state = state
+        self.skip_unchanged = skip_unchanged
+        self.stats = CrawlStats()
+        self._frontier: Optional[asyncio.Queue] = None
+
+    def _enqueue(self, url: str, depth: int) -> bool:
+        """Add a URL to the frontier unless it was already seen or is too deep"""
+        if depth >= self.max_depth or url in self.visited:
+            return False
+        if not self._schedule(url, depth):
+            return False
+        self.visited.add(url)
+        if self.state is not None:
+            self.state.enqueue(url, depth)
+        return True
+
+    def _schedule(self, url: str, depth: int) -> bool:
+        try:
+            self._frontier.put_nowait((url, depth))
+        except asyncio.QueueFull:
+            self.stats.frontier_dropped += 1
+            print(f"Frontier full ({self.max_frontier_size}), dropping {url}")
+            return False
+        return True
+
+    async def _worker(self, worker_id: int) -> None:
+        while True:
+            url, depth = await self._frontier.get()
+            try:
+                links = self.skip_unchanged(url) if self.skip_unchanged is not None else None
+                if links is not None:
+                    self.stats.pages_skipped += 1
+                else:
+                    async with self.rate_limiter.slot(url):
+                        print(f"\n[worker {worker_id}] Processing page: {url} (depth: {depth})")
+                        with span("page"), IN_FLIGHT.track_inprogress(kind="crawl_pages"):
+                            links = await self.process_page(url, depth)
+                    self.stats.pages_crawled += 1
+                    PAGES_CRAWLED.inc()
+                for link in links:
+                    if link not in self.visited and self.is_url_allowed(link):
+                        self._enqueue(link, depth + 1)
+                if self.state is not None:
+                    self.state.page_done(url, depth)
+            except Exception as e:
+                self.stats.pages_failed += 1
+                self.stats.failed_urls.add(url)
+                PAGES_FAILED.inc()
+                print(f"Error processing {url}: {e}")
+                if self.state is not None:
+                    self.state.page_failed(url, depth)
+            finally:
+                if self.state is not None:
+                    self.state.maybe_checkpoint()
+                self._frontier.task_done()
+                done = self.stats.pages_crawled + self.stats.pages_failed + self.stats.pages_skipped
+                if self.report_every and done % self.report_every == 0:
+                    print(f"Crawl progress: {self.stats.summary()}, "
+                          f"{self._frontier.qsize()} queued")
+
+    async def run(self, seeds: Iterable[str]) -> CrawlStats:
+        """Crawl breadth-first from the seed URLs until the frontier is exhausted"""
+        self.stats = CrawlStats()
+        if self.state is not None and self.state.resumed:
+            queued = self.state.queued()
+            # Restored URLs are already in `visited`, so one dropped here would never be crawled;
+            # they all fit, with the usual room left for newly found links
+            self._frontier = asyncio.Queue(maxsize=self.max_frontier_size + len(queued))
+            self.visited.update(self.state.visited())
+            self.stats.failed_urls.update(self.state.failed())
+            print(f"Resuming crawl: {len(self.visited) - len(queued)} pages already crawled, {len(queued)} queued")
+            for url, depth in queued:
+                self._schedule(url, depth)
+        else:
+            self._frontier = asyncio.Queue(maxsize=self.max_frontier_size)
+            for url in seeds:
+                if self.is_url_allowed(url):
+                    self._enqueue(url, 0)
+
+        workers = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        try:
+            await self._frontier.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            self.stats.finished_at = time.monotonic()
+            if self.state is not None:
+                self.state.checkpoint()
+
+        print(f"\nCrawl finished: {self.stats.summary()}")
+        if self.stats.frontier_dropped:
+            print(f"⚠️ {self.stats.frontier_dropped} URLs dropped because the frontier was full")
+        return self.stats
+
+
+# Resolves once the main content is present and the DOM has stopped changing
+# for `quietMs`, or without main content once it has been still for `stableMs`
+READY_SCRIPT = '''({selector, quietMs, stableMs, timeoutMs}) => new Promise(resolve => {
+    const hasContent = () => {
+        const main = document.querySelector(selector);
+        return !!main && main.textContent.trim().length > 0;
+    };
+    let timer = null;
+    const observer = new MutationObserver(() => arm());
+    const cap = setTimeout(() => done('timeout'), timeoutMs);
+    function done(reason) {
+        observer.disconnect();
+        clearTimeout(timer);
+        clearTimeout(cap);
+        resolve(reason);
+    }
+    function arm() {
+        clearTimeout(timer);
+        const content = hasContent();
+        timer = setTimeout(() => done(content ? 'content' : 'stable'), content ? quietMs : stableMs);
+    }
+    observer.observe(document, {subtree: true, childList: true, characterData: true});
+    arm();
+})'''
+
+
+async def wait_until_ready(page, main_content: List[str], quiet_ms: int, stable_ms: int,
+                           timeout: float) -> str:
+    """
+    Wait in the page until it is ready to extract, instead of for network
+    idle, which pages with analytics beacons never reach. Returns "content",
+    "stable" or "timeout".
+    """
+    selector = ', '.join(main_content) or 'body'
+    return await page.evaluate(READY_SCRIPT, {
+        'selector': selector, 'quietMs': quiet_ms, 'stableMs': stable_ms,
+        'timeoutMs': max(0, int(timeout * 1000)),
+    })
+
+
+class PageLoad:
+    """Network usage of one page load"""
+
+    def __init__(self):
+        self.bytes = 0
+        self.requests = 0
+        self.blocked = 0
+
+
+class PagePool:
+    """
+    Pool of Playwright pages spread over several browser contexts.
+    Pages are checked out for the duration of one URL and then returned.
+    The browser is only launched the first time a page is needed, so crawls
+    that never fall back to the browser never start Chromium.
+
+    Requests for `block_resource_types` (e.g. image, font, media) or URLs
+    matching `block_url_patterns` are aborted, and the bytes each page
+    transfers are counted.
+    """
+
+    def __init__(self, contexts: int = 2, pages_per_context: int = 2,
+                 user_agent: Optional[str] = None, block_resource_types: Iterable[str] = (),
+                 block_url_patterns: Iterable[str] = ()):
+        self.num_contexts = max(1, contexts)
+        self.pages_per_context = max(1, pages_per_context)
+        self.user_agent = user_agent
+        self.block_resource_types = frozenset(block_resource_types)
+        self._blocked_urls = compile_globs(block_url_patterns)
+        self._playwright = None
+        self._browser = None
+        self._contexts: List[Any] = []
+        self._pages: Optional[asyncio.Queue] = None
+        self._loads: Dict[Any, PageLoad] = {}
+        self._start_lock = asyncio.Lock()
+        self.pages_loaded = 0
+        self.bytes = 0
+        self.requests = 0
+        self.blocked = 0
+
+    @property
+    def size(self) -> int:
+        return self.num_contexts * self.pages_per_context
+
+    @property
+    def started(self) -> bool:
+        return self._pages is not None
+
+    async def _route(self, route) -> None:
+        request = route.request
+        if request.resource_type in self.block_resource_types or (
+                self._blocked_urls is not None and self._blocked_urls.match(request.url)):
+            try:
+                load = self._loads.get(request.frame.page)
+            except Exception:
+                load = None
+            if load is not None:
+                load.blocked += 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def _new_page(self, context):
+        page = await context.new_page()
+        self._loads[page] = PageLoad()
+        # Encoded bytes per finished request, as the network saw them
+        cdp = await context.new_cdp_session(page)
+        await cdp.send("Network.enable")
+
+        def finished(event):
+            # Looked up per event: every checkout starts a fresh PageLoad
+            load = self._loads[page]
+            load.bytes += int(event.get("encodedDataLength", 0))
+            load.requests += 1
+
+        cdp.on("Network.loadingFinished", finished)
+        return page
+
+    async def _start(self) -> None:
+        from playwright.async_api import async_playwright
+
+        print("Launching headless browser")
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=True)
+        pages = asyncio.Queue()
+        for _ in range(self.num_contexts):
+            context = await self._browser.new_context(user_agent=self.user_agent)
+            if self.block_resource_types or self._blocked_urls is not None:
+                await context.route("**/*", self._route)
+            self._contexts.append(context)
+            for _ in range(self.pages_per_context):
+                pages.put_nowait(await self._new_page(context))
+        self._pages = pages
+
+    def load(self, page) -> PageLoad:
+        """Network usage of the checked-out page since it was checked out"""
+        return self._loads[page]
+
+    @asynccontextmanager
+    async def page(self):
+        """Check out a page from the pool, launching the browser if needed"""
+        if not self.started:
+            async with self._start_lock:
+                if not self.started:
+                    await self._start()
+        page = await self._pages.get()
+        load = self._loads[page] = PageLoad()
+        try:
+            yield page
+        finally:
+            self.pages_loaded += 1
+            self.bytes += load.bytes
+            self.requests += load.requests
+            self.blocked += load.blocked
+            BROWSER_BYTES.inc(load.bytes)
+            BROWSER_REQUESTS_BLOCKED.inc(load.blocked)
+            self._pages.put_nowait(page)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pages": self.pages_loaded,
+            "bytes": self.bytes,
+            "requests": self.requests,
+            "requests_blocked": self.blocked,
+        }
+
+    async def close(self) -> None:
+        for context in self._contexts:
+            try:
+                await context.close()
+            except Exception as e:
+                print(f"Error closing browser context: {e}")
+        self._contexts = []
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+        self._pages = None
@@ -0,0 +1,147 @@
+import hashlib
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+_WORD_RE = re.compile(r"\w+")
+
+BITS = 64
+
+
+@lru_cache(maxsize=1 << 16)
+def _word_hash(word: str) -> int:
+    return int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _mix(h: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer, so every input bit affects every output bit"""
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+    return h ^ (h >> np.uint64(31))
+
+
+def simhash(text: str, shingle_size: int = 3) -> Tuple[int, int]:
+    """
+    64-bit SimHash of the text's word shingles, and the number of shingles.
+    Texts that share most of their shingles get fingerprints a few bits apart.
+    Words are hashed once each, and shingle hashes combined from them.
+    """
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return 0, 0
+    hashes = np.fromiter((_word_hash(word) for word in words), dtype=np.uint64, count=len(words))
+    size = min(shingle_size, len(words))
+    count = len(words) - size + 1
+    shingles = np.zeros(count, dtype=np.uint64)
+    for offset in range(size):
+        shingles = _mix(shingles ^ hashes[offset:offset + count])
+    bits = np.unpackbits(shingles.view(np.uint8).reshape(count, 8), axis=1)
+    # Majority vote per bit position
+    votes = bits.sum(axis=0, dtype=np.int64) * 2 > count
+    return int.from_bytes(np.packbits(votes).tobytes(), 'big'), count
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class NearDuplicateIndex:
+    """
+    SimHash fingerprints by key, searchable for any fingerprint within
+    `max_distance` bits. Fingerprints are split into `max_distance + 1` bands,
+    and two within the distance must agree exactly on at least one of them,
+    so only keys sharing a band are compared.
+    """
+
+    def __init__(self, max_distance: int = 3):
+        self.max_distance = max_distance
+        bands = max_distance + 1
+        widths = [BITS // bands + (1 if i < BITS % bands else 0) for i in range(bands)]
+        self._bands = []
+        shift = 0
+        for width in widths:
+            self._bands.append((shift, (1 << width) - 1))
+            shift += width
+        self._buckets: List[Dict[int, Set[str]]] = [{} for _ in self._bands]
+        self._fingerprints: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._fingerprints)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._fingerprints
+
+    def add(self, key: str, fingerprint: int) -> None:
+        self.remove(key)
+        self._fingerprints[key] = fingerprint
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            buckets.setdefault((fingerprint >> shift) & mask, set()).add(key)
+
+    def remove(self, key: str) -> None:
+        fingerprint = self._fingerprints.pop(key, None)
+        if fingerprint is None:
+            return
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            band = (fingerprint >> shift) & mask
+            bucket = buckets.get(band)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del buckets[band]
+
+    def find(self, fingerprint: int, exact: bool = False, exclude: Optional[str] = None) -> Optional[str]:
+        """Key of the closest fingerprint within the distance (or equal, if `exact`)"""
+        best, best_distance = None, (0 if exact else self.max_distance) + 1
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            for key in buckets.get((fingerprint >> shift) & mask, ()):
+                if key == exclude:
+                    continue
+                distance = hamming(fingerprint, self._fingerprints[key])
+                if distance < best_distance:
+                    best, best_distance = key, distance
+                    if distance == 0:
+                        return best
+        return best
+
+
+class Deduplicator:
+    """
+    Finds near-duplicate pages and chunks before they are embedded.
+
+    Pages are compared with the pages already kept, chunks with the chunks
+    already in the index. Texts with fewer than `min_shingles` shingles are
+    too short for SimHash to tell near from different, and only match when
+    their fingerprints are equal.
+    """
+
+    def __init__(self, max_distance: int = 3, shingle_size: int = 3, min_shingles: int = 8):
+        self.shingle_size = shingle_size
+        self.min_shingles = min_shingles
+        self.pages = NearDuplicateIndex(max_distance)
+        self.chunks = NearDuplicateIndex(max_distance)
+        self.pages_deduplicated = 0
+        self.chunks_deduplicated = 0
+        self.chars_deduplicated = 0
+
+    def fingerprint(self, text: str) -> Tuple[int, bool]:
+        """SimHash of the text and whether it is long enough for near matches"""
+        fingerprint, shingles = simhash(text, self.shingle_size)
+        return fingerprint, shingles >= self.min_shingles
+
+    def load(self, pages: Iterable[Tuple[str, dict]], chunks: Iterable[Tuple[str, dict]]) -> None:
+        """Take in the fingerprints of an existing index: manifest entries and chunk metadata"""
+        for url, entry in pages:
+            if entry.get('simhash') and not entry.get('duplicate_of'):
+                self.pages.add(url, int(entry['simhash'], 16))
+        for chunk_id, metadata in chunks:
+            if metadata.get('simhash'):
+                self.chunks.add(chunk_id, int(metadata['simhash'], 16))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pages_deduplicated": self.pages_deduplicated,
+            "chunks_deduplicated": self.chunks_deduplicated,
+            "chars_deduplicated": self.chars_deduplicated,
+        }
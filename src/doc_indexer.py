@@ -1,21 +1,52 @@
 import os
+import argparse
 import yaml
-import fnmatch
-from typing import List, Dict, Any
+import json
+from typing import List, Dict, Any, AsyncIterator, Optional, Tuple
 from dotenv import load_dotenv
 from langchain_community.document_loaders import WebBaseLoader
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain_openai import ChatOpenAI
-from langchain.chains import RetrievalQA
+from langchain.chains.question_answering import load_qa_chain
 from langchain.prompts import PromptTemplate
-from playwright.sync_api import sync_playwright
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from urllib.parse import urljoin, urlparse
 from langchain.docstore.document import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+import asyncio
 import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import weakref
+from contextlib import contextmanager, nullcontext
 from pathlib import Path
+from ann_index import index_type, load_serving_index, save_ann_index
+from bm25 import BM25_FILENAME, BM25Index
+from concurrency import LLMGate, Overloaded
+from docstore import (DOCSTORE_FILENAME, SqliteDocstore, check_consistent, load_vectorstore, migrate_pickle_docstore,
+                      verify_index)
+from crawl_state import CrawlState
+from dedup import Deduplicator
+from crawler import Crawler, CrawlStats, HostRateLimiter, PagePool, wait_until_ready
+from browser_extractor import DEFAULT_RULES, extract_rendered_page, wait_for_main_content
+from html_extractor import StaticPage, extract_static_content
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from fakes import HashEmbeddings
+from index_versions import begin_build, building_version, current_index, current_version, publish
+from history import CONDENSE_PROMPT, ConversationCompactor, PreparedQuestion, TokenCounter, Turns
+from pipeline import IndexingPipeline
+from metrics import CACHE_REQUESTS, LLM_TOKENS, StageTimings, span
+from query_cache import AnswerCache, QueryEmbeddingCache, normalize_question
+from sitemaps import SitemapDiscovery, parse_lastmod
+from shards import Collection, Shard, UnknownCollection, load_collections, merge_hits
+from manifest import MANIFEST_FILENAME, CrawlResult, PageManifest
+from urls import DEFAULT_TRACKING_PARAMS, UrlCanonicalizer, UrlMatcher
 
 # Load environment variables
 load_dotenv()
@@ -26,7 +57,8 @@ headers = {
 }
 
 class DocumentationIndexer:
-    def __init__(self, config_path: str = "config.yaml"):
+    def __init__(self, config_path: str = "config.yaml", embeddings: Optional[Embeddings] = None,
+                 llm: Optional[BaseChatModel] = None):
         # Get the absolute path of the script's directory
         script_dir = Path(__file__).parent.absolute()
         
@@ -36,30 +68,92 @@ class DocumentationIndexer:
         
         print(f"Loading config from: {config_path}")
         self.config = self._load_config(config_path)
-        self.embeddings = OpenAIEmbeddings()
+        self.embeddings = self._create_embeddings(embeddings)
+        # The flat index of the collection being indexed
         self.vectorstore = None
+        self.collections: Dict[str, Collection] = load_collections(self.config)
+        # Loaded indexes of the collections being served, by name
+        self.shards: Dict[str, Shard] = {}
+        self._shard_executor = None
+        self._reload_lock = threading.Lock()
+        self.ann_config = self.config['vector_store'].get('ann', {})
+        index_type(self.ann_config)
+        self.retrieval_config = self.config.get('retrieval', {})
         self.qa_chain = None
-        self.llm = ChatOpenAI(
+        self.prompt = None
+        self.query_cache = QueryEmbeddingCache(
+            self.config['vector_store'].get('query_embedding_cache_size', 1024)
+        )
+        answer_cache_config = self.config.get('answer_cache', {})
+        self.answer_cache = None
+        if answer_cache_config.get('enabled', True):
+            self.answer_cache = AnswerCache(
+                max_size=answer_cache_config.get('max_entries', 1000),
+                ttl=answer_cache_config.get('ttl_seconds', 86400),
+                similarity_threshold=answer_cache_config.get('similarity_threshold', 0.95)
+            )
+        self.llm = llm or ChatOpenAI(
             model_name=self.config['openai']['model_name'],
             temperature=self.config['openai']['temperature']
         )
+        history_config = self.config.get('history', {})
+        self.history = ConversationCompactor(
+            TokenCounter(self.config['openai']['model_name']),
+            token_budget=history_config.get('token_budget', 1500),
+            retrieval_token_budget=history_config.get('retrieval_token_budget', 64)
+        )
+        self.condense_with_llm = history_config.get('condense_with_llm', False)
+        self._executor = None
         self.url_patterns = self.config.get('url_patterns', {
             'accepted': [],
             'blacklisted': []
         })
         self.processed_urls = set()
         self.max_depth = self.config.get('document', {}).get('max_depth', 5)
+        self.crawler_config = self.config.get('crawler', {})
+        self.canonicalize_url = UrlCanonicalizer(self.crawler_config.get('tracking_params', DEFAULT_TRACKING_PARAMS))
+        self.fetch_mode = self.crawler_config.get('fetch_mode', 'auto')
+        if self.fetch_mode not in ('auto', 'http', 'browser'):
+            raise ValueError(f"Unknown fetch_mode '{self.fetch_mode}', expected auto, http or browser")
+        self.min_content_length = self.crawler_config.get('min_content_length', 200)
+        self.discovery = self.crawler_config.get('discovery', 'links')
+        if self.discovery not in ('links', 'sitemap'):
+            raise ValueError(f"Unknown discovery '{self.discovery}', expected links or sitemap")
+        self.page_load = self.crawler_config.get('page_load', {})
+        if self.page_load.get('mode', 'lean') not in ('lean', 'networkidle'):
+            raise ValueError(f"Unknown page_load mode '{self.page_load['mode']}', expected lean or networkidle")
+        self.browser_stats: Dict[str, int] = {}
+        self.sitemap_stats: Optional[Dict[str, int]] = None
+        self._http_session = None
+        self.timings = StageTimings()
+        self._register_cache_metrics()
         print(f"Initialized with max_depth: {self.max_depth} from config file: {config_path}")
         
-        # Content extraction settings
-        self.content_selectors = {
-            'main_content': ['main', 'article', '.content', '#content', '.main-content', 'div[role="main"]'],
-            'exclude': [
-                'nav', 'header', 'footer', '.navigation', '.sidebar',
-                '.breadcrumb', '.pagination', '.social-share', '.related-content',
-                'script', 'style', 'noscript', 'iframe', 'form'
-            ]
+        # Content extraction rules, shared by the static and in-page extractors
+        self.content_selectors = {**DEFAULT_RULES, **(self.config.get('extraction') or {})}
+
+    def _register_cache_metrics(self):
+        """
+        Expose the hit and miss counts the caches keep as /metrics counters.
+        The callbacks hold only a weak reference, so the global registry does
+        not keep an indexer alive after it has been replaced.
+        """
+        indexer = weakref.ref(self)
+
+        def cache_stats(attribute: str) -> Dict[str, int]:
+            cache = getattr(indexer(), attribute, None)
+            return cache.stats() if cache is not None else {}
+
+        # Each cache with the result counts its stats() actually reports
+        caches = {
+            "query_embedding": ("query_cache", ("hits", "misses")),
+            "embedding": ("embeddings", ("hits", "misses")),
+            "answer": ("answer_cache", ("exact_hits", "similar_hits", "misses")),
         }
+        for cache, (attribute, results) in caches.items():
+            for result in results:
+                CACHE_REQUESTS.set_function(lambda attribute=attribute, result=result: cache_stats(attribute).get(result, 0),
+                                            cache=cache, result=result)
 
     def _load_config(self, config_path: str) -> dict:
         """Load configuration from YAML file"""
@@ -73,257 +167,677 @@ class DocumentationIndexer:
             print(f"❌ Error loading config: {e}")
             raise
 
+    def _create_embeddings(self, backend: Optional[Embeddings] = None) -> CachedEmbeddings:
+        """
+        Build the embedding backend wrapped in the persistent embedding cache.
+        An explicitly passed backend (e.g. a fake one in tests) takes precedence.
+        """
+        embeddings_config = self.config.get('embeddings', {})
+        provider = embeddings_config.get('provider', 'openai')
+        model_name = embeddings_config.get('model_name', 'text-embedding-ada-002')
+        if backend is not None:
+            model_name = f"{type(backend).__name__}:{model_name}"
+        elif provider == 'openai':
+            backend = OpenAIEmbeddings(model=model_name)
+        elif provider == 'fake':
+            backend = HashEmbeddings(size=embeddings_config.get('size', 256))
+            model_name = f"fake:{backend.size}"
+        else:
+            raise ValueError(f"Unknown embeddings provider '{provider}', expected openai or fake")
+
+        cache = None
+        if embeddings_config.get('cache_path'):
+            cache = EmbeddingCache(
+                embeddings_config['cache_path'],
+                max_entries=embeddings_config.get('cache_max_entries', 500000)
+            )
+        return CachedEmbeddings(
+            backend,
+            cache,
+            model_name=model_name,
+            batch_size=embeddings_config.get('batch_size', 256),
+            max_concurrency=embeddings_config.get('max_concurrency', 4),
+            max_retries=embeddings_config.get('max_retries', 5)
+        )
+
+    @property
+    def url_patterns(self) -> Dict[str, List[str]]:
+        return self._url_patterns
+
+    @url_patterns.setter
+    def url_patterns(self, patterns: Dict[str, List[str]]):
+        # Compiled once, instead of matching every pattern against every link
+        self._url_patterns = patterns
+        self._url_matcher = UrlMatcher(patterns.get('accepted', []), patterns.get('blacklisted', []))
+
     def _is_url_allowed(self, url: str) -> bool:
         """
         Check if a URL is allowed based on accepted and blacklisted patterns
         """
         # First check if URL matches any accepted patterns
-        matches_accepted = any(fnmatch.fnmatch(url, pattern) for pattern in self.url_patterns['accepted'])
-        if not matches_accepted:
+        if not self._url_matcher.accepts(url):
             print(f"URL {url} did not match any accepted patterns")
             return False
 
         # Then check if URL matches any blacklisted patterns
-        matches_blacklisted = any(fnmatch.fnmatch(url, pattern) for pattern in self.url_patterns['blacklisted'])
-        if matches_blacklisted:
+        if self._url_matcher.blacklists(url):
             print(f"URL {url} matched blacklisted pattern")
             return False
 
         return True
 
-    def _get_links_from_page(self, page) -> List[str]:
+    def _filter_links(self, links: List[str]) -> List[str]:
         """
-        Extract all links from a page that match our patterns
+        Keep only unique links that match our patterns, canonicalized so that
+        fragment and tracking-parameter variants of a page count as one.
+        The crawler skips the ones that were already processed.
         """
-        try:
-            # Get all links from the page using JavaScript evaluation
-            links = page.evaluate('''() => {
-                const links = Array.from(document.querySelectorAll('a[href]'));
-                return links.map(link => link.href);
-            }''')
-            
-            # Filter links based on our patterns
-            valid_links = []
-            for link in links:
-                if (self._is_url_allowed(link) and
-                    link not in self.processed_urls):
-                    valid_links.append(link)
-            
-            print(f"Found {len(valid_links)} valid links")
-            return valid_links
-        except Exception as e:
-            print(f"Error extracting links: {e}")
-            return []
+        valid_links = []
+        for link in dict.fromkeys(self.canonicalize_url(link) for link in links):
+            if self._is_url_allowed(link):
+                valid_links.append(link)
+
+        print(f"Found {len(valid_links)} valid links")
+        return valid_links
 
-    def _extract_content(self, page) -> str:
+    @property
+    def http_session(self) -> requests.Session:
         """
-        Extract the main content from the page using Playwright
+        Keep-alive HTTP session with a connection pool sized for the crawler
         """
-        try:
-            # Wait for the main content to be available
-            main_content = None
-            for selector in self.content_selectors['main_content']:
-                try:
-                    main_content = page.wait_for_selector(selector, timeout=5000)
-                    if main_content:
-                        print(f"Found main content with selector: {selector}")
-                        break
-                except Exception as e:
-                    print(f"Failed to find content with selector {selector}: {e}")
-                    continue
+        if self._http_session is None:
+            pool_size = self.crawler_config.get('concurrency', 8)
+            retry = Retry(total=2, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504],
+                          allowed_methods=['GET', 'HEAD'])
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+            session = requests.Session()
+            session.headers.update(headers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._http_session = session
+        return self._http_session
 
-            # If no main content area found, use the body
-            if not main_content:
-                print("No main content area found, using body")
-                main_content = page.locator('body')
+    def _fetch_static(self, url: str, previous: Optional[dict] = None) -> Optional[StaticPage]:
+        """
+        Fetch a page over plain HTTP and extract its content without a browser.
+        If the page was indexed before, a conditional request is sent with its
+        stored validators. Returns None when the response is not HTML.
+        """
+        request_headers = {}
+        if previous:
+            if previous.get('etag'):
+                request_headers['If-None-Match'] = previous['etag']
+            if previous.get('last_modified'):
+                request_headers['If-Modified-Since'] = previous['last_modified']
 
-            if not main_content:
-                print("No content found at all")
-                return ""
+        with self.timings.time("fetch_static"):
+            response = self.http_session.get(url, headers=request_headers,
+                                             timeout=self.crawler_config.get('http_timeout', 30))
+        if response.status_code == 304:
+            return StaticPage('', '', [], None, not_modified=True)
+        response.raise_for_status()
+        if 'html' not in response.headers.get('Content-Type', 'text/html'):
+            print(f"Skipping non-HTML response from: {url}")
+            return None
+        with self.timings.time("extract_static"):
+            static_page = extract_static_content(response.text, response.url, self.content_selectors)
+        static_page.etag = response.headers.get('ETag')
+        static_page.last_modified = response.headers.get('Last-Modified')
+        return static_page
 
-            # Remove excluded elements
-            for selector in self.content_selectors['exclude']:
-                try:
-                    page.evaluate(f'''(selector) => {{
-                        const elements = document.querySelectorAll(selector);
-                        elements.forEach(el => el.remove());
-                    }}''', selector)
-                except Exception as e:
-                    print(f"Failed to remove excluded elements with selector {selector}: {e}")
-                    continue
+    async def _process_page(self, url: str, depth: int, crawl: CrawlResult, pages: PagePool) -> List[str]:
+        """
+        Process a single page and return the links found on it.
+        Static HTML is tried first; the browser is used only as a fallback.
+        """
+        previous = crawl.manifest.get(url)
+        if self.fetch_mode != 'browser':
+            static_page = await asyncio.get_running_loop().run_in_executor(
+                None, self._fetch_static, url, previous
+            )
+            if static_page is None:
+                return []
+            if static_page.not_modified:
+                # Unchanged since the last run; reuse the links we stored for it
+                print(f"Not modified since last index: {url}")
+                crawl.mark_unchanged(url)
+                return self._filter_links(previous.get('links', []))
+            if len(static_page.content) >= self.min_content_length or self.fetch_mode == 'http':
+                links = self._filter_links(static_page.links)
+                if static_page.content:
+                    print(f"Extracted {len(static_page.content)} characters of static content from: {url}")
+                else:
+                    print(f"No content extracted from: {url}")
+                if not await crawl.add_page(url, static_page.content, static_page.title or url, links,
+                                      etag=static_page.etag, last_modified=static_page.last_modified):
+                    print(f"Content unchanged since last index: {url}")
+                return links
+            print(f"Static HTML has no usable main content, falling back to the browser: {url}")
 
-            # Get the element's selector and HTML
-            element_info = main_content.evaluate('''(el) => {
-                const tag = el.tagName.toLowerCase();
-                const id = el.id ? '#' + el.id : '';
-                const classes = el.className ? '.' + el.className.split(' ').join('.') : '';
-                return {
-                    selector: tag + id + classes,
-                    html: el.outerHTML
-                };
-            }''')
-
-            # Extract text while preserving structure using JavaScript evaluation
-            content = page.evaluate('''(elementInfo) => {
-                const mainContent = document.querySelector(elementInfo.selector);
-                if (!mainContent) return '';
-                
-                const content = [];
-                
-                // Process headings
-                const headings = mainContent.querySelectorAll('h1, h2, h3, h4, h5, h6');
-                headings.forEach(heading => {
-                    const level = parseInt(heading.tagName[1]);
-                    const text = heading.innerText.trim();
-                    if (text) {
-                        content.push(`${'#'.repeat(level)} ${text}\\n`);
-                    }
-                });
-
-                // Process paragraphs and lists
-                const elements = mainContent.querySelectorAll('p, li');
-                elements.forEach(element => {
-                    const text = element.innerText.trim();
-                    if (text) {
-                        if (element.tagName === 'LI') {
-                            content.push(`- ${text}\\n`);
-                        } else {
-                            content.push(`${text}\\n\\n`);
-                        }
-                    }
-                });
-
-                // Process code blocks
-                const codeBlocks = mainContent.querySelectorAll('pre, code');
-                codeBlocks.forEach(code => {
-                    if (code.tagName === 'PRE') {
-                        const text = code.innerText.trim();
-                        if (text) {
-                            content.push(`\\`\\`\\`\\n${text}\\n\\`\\`\\`\\n\\n`);
-                        }
-                    }
-                });
-
-                return content.join('');
-            }''', element_info)
-
-            extracted_content = content.strip()
-            print(f"Extracted {len(extracted_content)} characters of content")
-            return extracted_content
-        except Exception as e:
-            print(f"Error extracting content: {e}")
-            return ""
+        return await self._process_page_in_browser(url, crawl, pages)
 
-    def _process_page(self, url: str, all_documents: List, page, depth: int = 0) -> None:
+    async def _process_page_in_browser(self, url: str, crawl: CrawlResult, pages: PagePool) -> List[str]:
         """
-        Process a single page and its linked pages recursively
+        Render a page in the browser, extract it and return the links found on it
         """
-        if url in self.processed_urls or depth >= self.max_depth:
-            return
+        budget = self.page_load.get('budget', 15)
+        async with pages.page() as page:
+            started = time.perf_counter()
+            # Navigate to the page
+            with self.timings.time("navigate"):
+                await page.goto(url, wait_until='domcontentloaded', timeout=budget * 1000)
 
-        print(f"\nProcessing page: {url} (depth: {depth})")
-        self.processed_urls.add(url)
+            # Wait until the page is ready, within what is left of its time budget
+            remaining = max(0.0, budget - (time.perf_counter() - started))
+            with self.timings.time("ready_wait"):
+                if self.page_load.get('mode', 'lean') == 'lean':
+                    ready = await wait_until_ready(page, self.content_selectors['main_content'],
+                                                   quiet_ms=self.page_load.get('quiet_ms', 300),
+                                                   stable_ms=self.page_load.get('stable_ms', 1500),
+                                                   timeout=remaining)
+                    if ready == 'timeout':
+                        print(f"Warning: Page was still changing after its {budget}s budget: {url}")
+                elif remaining <= 0:
+                    # Playwright reads a timeout of 0 as no timeout at all
+                    print(f"Warning: Navigation used the whole {budget}s budget, not waiting for networkidle: {url}")
+                else:
+                    try:
+                        await page.wait_for_load_state('networkidle', timeout=remaining * 1000)
+                    except Exception as e:
+                        print(f"Warning: Page did not reach networkidle state: {e}")
+                        # Continue anyway as we'll handle missing content gracefully
+                    await wait_for_main_content(page, self.content_selectors)
+            load_seconds = time.perf_counter() - started
+            self.timings.add("page_load", load_seconds)
+            load = pages.load(page)
+            print(f"Loaded {url} in {load_seconds:.2f}s: {load.bytes / 1024:.0f} KB over "
+                  f"{load.requests} requests, {load.blocked} blocked")
+
+            # Content, title and links in one round trip; the crawler schedules the links
+            with self.timings.time("extract_browser"):
+                rendered = await extract_rendered_page(page, self.content_selectors)
+            content = rendered.content
+            title = rendered.title or url
+            links = self._filter_links(rendered.links)
 
-        try:
-            # Navigate to the page
-            page.goto(url, wait_until='domcontentloaded', timeout=60000)
-            
-            # Wait for the main content to be available
-            try:
-                page.wait_for_load_state('networkidle', timeout=30000)
-            except Exception as e:
-                print(f"Warning: Page did not reach networkidle state: {e}")
-                # Continue anyway as we'll handle missing content gracefully
-            
-            # Extract content using our custom extractor
-            content = self._extract_content(page)
-            
             if content:
-                # Create a Document object with metadata
-                metadata = {
-                    "source": url,
-                    "title": page.title() or url
-                }
-                document = Document(
-                    page_content=content,
-                    metadata=metadata
-                )
-                all_documents.append(document)
                 print(f"Successfully extracted content from: {url}")
             else:
                 print(f"No content extracted from: {url}")
+            if not await crawl.add_page(url, content, title, links):
+                print(f"Content unchanged since last index: {url}")
+            return links
 
-            # Get links from the current page and process them
-            links = self._get_links_from_page(page)
-            for link in links:
-                if link not in self.processed_urls:
-                    self._process_page(link, all_documents, page, depth + 1)
+    async def _crawl(self, urls: List[str], crawl: CrawlResult, state: Optional[CrawlState] = None) -> CrawlStats:
+        """
+        Crawl breadth-first from the given URLs with a pool of workers.
+        The browser is only launched if a page needs the Playwright fallback.
+        Pages from sitemaps whose `<lastmod>` shows no change are not fetched.
+        """
+        pages = PagePool(
+            contexts=self.crawler_config.get('browser_contexts', 2),
+            pages_per_context=self.crawler_config.get('pages_per_context', 2),
+            user_agent=headers['User-Agent'],
+            block_resource_types=self.page_load.get('block_resource_types', []),
+            block_url_patterns=self.page_load.get('block_url_patterns', [])
+        )
+        concurrency = self.crawler_config.get('concurrency', 8)
+        if self.fetch_mode == 'browser':
+            concurrency = pages.size
 
-            # Add a small delay to be nice to the server
-            time.sleep(1)
+        try:
+            crawler = Crawler(
+                process_page=lambda url, depth: self._process_page(url, depth, crawl, pages),
+                is_url_allowed=self._is_url_allowed,
+                max_depth=self.max_depth,
+                concurrency=concurrency,
+                rate_limiter=HostRateLimiter(
+                    max_concurrency=self.crawler_config.get('per_host_concurrency', 4),
+                    requests_per_second=self.crawler_config.get('requests_per_second', 2.0)
+                ),
+                # Pages listed in sitemaps are all queued up front and do not count against the bound
+                max_frontier_size=self.crawler_config.get('max_frontier_size', 10000) + len(crawl.lastmod),
+                visited=self.processed_urls,
+                report_every=self.crawler_config.get('report_every', 25),
+                state=state,
+                skip_unchanged=(lambda url: self._unchanged_in_sitemap(url, crawl)) if crawl.lastmod else None
+            )
+            return await crawler.run(urls)
+        finally:
+            self.browser_stats = pages.stats()
+            await pages.close()
 
-        except Exception as e:
-            print(f"Error processing {url}: {e}")
+    def _discover_sitemap_pages(self, urls: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Pages listed in the sitemaps of the seeds' sites (or the configured
+        `crawler.sitemap.urls`) that match the URL patterns, with their `<lastmod>`
+        """
+        sitemap_config = self.crawler_config.get('sitemap', {})
+        discovery = SitemapDiscovery(
+            self.http_session,
+            timeout=self.crawler_config.get('http_timeout', 30),
+            max_sitemaps=sitemap_config.get('max_sitemaps', 200),
+            max_urls=sitemap_config.get('max_urls', 200000)
+        )
+
+        def select(url: str) -> Optional[str]:
+            url = self.canonicalize_url(url)
+            return url if self._url_matcher.allows(url) else None
+
+        with self.timings.time("sitemap"):
+            sitemaps = sitemap_config.get('urls') or discovery.sitemaps_for(urls)
+            pages = discovery.discover(sitemaps, select)
+        stats = discovery.stats()
+        print(f"Discovered {len(pages)} matching pages in {stats['sitemaps_read']} sitemaps "
+              f"listing {stats['urls_listed']} URLs")
+        self.sitemap_stats = {**stats, "pages_matched": len(pages)}
+        return pages
+
+    def _unchanged_in_sitemap(self, url: str, crawl: CrawlResult) -> Optional[List[str]]:
+        """
+        The stored links of a page whose sitemap `<lastmod>` is the one seen
+        when it was last crawled, or older than its indexed content, so it
+        need not be fetched; None when it has to be fetched
+        """
+        lastmod = crawl.lastmod.get(url)
+        previous = crawl.manifest.get(url)
+        if lastmod is None or previous is None or not previous.get('content_hash'):
+            return None
+        if previous.get('lastmod') != lastmod:
+            modified = parse_lastmod(lastmod)
+            if modified is None or modified >= previous.get('indexed_at', 0):
+                return None
+        crawl.mark_unchanged(url)
+        return self._filter_links(previous.get('links', []))
+
+    @staticmethod
+    def _manifest_path(index_path: str) -> str:
+        return os.path.join(index_path, MANIFEST_FILENAME)
+
+    def _open_crawl_state(self, collection: Collection, urls: List[str], full_rebuild: bool,
+                          resume: bool = True) -> CrawlState:
+        """
+        Open the collection's on-disk crawl state, resuming the crawl it holds
+        if that one was interrupted and had the same seeds and settings
+        """
+        state = CrawlState(
+            collection.state_path(self.crawler_config.get('state_path', 'crawl_state.sqlite')),
+            checkpoint_every=self.crawler_config.get('state_checkpoint_every', 50),
+            checkpoint_interval=self.crawler_config.get('state_checkpoint_interval', 10)
+        )
+        signature = {
+            'urls': urls,
+            'index_path': collection.index_path,
+            'max_depth': self.max_depth,
+            'url_patterns': self.url_patterns,
+            'full_rebuild': full_rebuild,
+            'discovery': self.discovery,
+        }
+        state.begin(signature, resume=resume and self.crawler_config.get('resume', True))
+        return state
+
+    def collection(self, name: Optional[str] = None) -> Collection:
+        """A configured collection by name; the only one if there is just one"""
+        if name is None:
+            if len(self.collections) != 1:
+                raise ValueError(f"Choose one of the collections: {', '.join(self.collections)}")
+            return next(iter(self.collections.values()))
+        if name not in self.collections:
+            raise UnknownCollection(name, self.collections)
+        return self.collections[name]
 
-    def index_documents(self, urls: List[str] = None):
+    def index_collections(self, names: Optional[List[str]] = None, full_rebuild: bool = False) -> Dict[str, dict]:
         """
-        Index documents from the provided URLs or from config
+        Index the named collections, or all of them, one after the other.
+        Returns each collection's run report.
         """
-        # Use URLs from config if none provided
-        urls = urls or self.config['urls']
-        all_documents = []
+        reports = {}
+        for name in names or list(self.collections):
+            collection = self.collection(name)
+            print(f"\n=== Collection {collection.name} ===")
+            self.processed_urls = set()
+            reports[collection.name] = self.index_documents(full_rebuild=full_rebuild, collection=collection.name)
+        return reports
 
-        print(f"\nStarting indexing with URLs: {urls}")
+    def index_documents(self, urls: List[str] = None, full_rebuild: bool = False,
+                        collection: Optional[str] = None) -> dict:
+        """
+        Index one collection, from the provided URLs or the collection's own.
+
+        Pages stream from the crawler through splitting and embedding into a
+        new version of the collection's index while the crawl is still
+        running, and the version is published once complete. When the
+        collection was indexed before, the new version starts as a copy of the
+        current one, and only pages that are new, changed or gone are
+        re-embedded. Returns a report of the run's counters and per-stage timings.
+        """
+        collection = self.collection(collection)
+        self.url_patterns = collection.url_patterns
+        # Use the collection's URLs if none provided
+        urls = [self.canonicalize_url(url) for url in urls or collection.urls]
+        self.timings = StageTimings()
+        # The embeddings wrapper outlives the run; its counters are reported per run
+        embedding_baseline = self.embeddings.stats()
+        # Only a crawl whose unfinished version is still on disk can resume
+        state = self._open_crawl_state(collection, urls, full_rebuild,
+                                       resume=building_version(collection.index_path) is not None)
+        update = self.config['vector_store'].get('incremental', True)
+        # A resumed build continues in the version it checkpointed so far
+        index_path, version = begin_build(collection.index_path, seed=update and not full_rebuild,
+                                          resume=state.resumed)
+
+        manifest = PageManifest.load(self._manifest_path(index_path))
+        incremental = (
+            (not full_rebuild or state.resumed)
+            and update
+            and len(manifest) > 0
+        )
+        if incremental:
+            # The flat index is the exact copy that pages are added to and deleted from
+            self.vectorstore = load_vectorstore(index_path, self.embeddings)
+            print(f"Incremental re-index against {len(manifest)} previously indexed pages")
+        else:
+            manifest = PageManifest(self._manifest_path(index_path))
+            self.vectorstore = None
+
+        print(f"\nStarting indexing of collection {collection.name} into version {version} with URLs: {urls}")
         print(f"URL patterns: {self.url_patterns}")
         print(f"Maximum recursion depth: {self.max_depth}")
+        lastmod = {}
+        self.sitemap_stats = None
+        if self.discovery == 'sitemap':
+            lastmod = self._discover_sitemap_pages(urls)
+            if not lastmod:
+                print("⚠️ No matching pages found in sitemaps, discovering pages by following links only")
+        seeds = list(dict.fromkeys(urls + list(lastmod)))
 
-        # Initialize Playwright
-        with sync_playwright() as p:
-            # Launch browser
-            browser = p.chromium.launch(headless=True)
-            page = browser.new_page()
+        pipeline_config = self.config.get('pipeline', {})
+        dedup = self._open_deduplicator(manifest)
+        text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=self.config['document']['chunk_size'],
+            chunk_overlap=self.config['document']['chunk_overlap']
+        )
 
+        async def run():
+            # Created inside the event loop that drives the crawl
+            pipeline = IndexingPipeline(
+                self,
+                manifest,
+                text_splitter,
+                index_path,
+                batch_size=pipeline_config.get('embed_batch_size', 256),
+                queue_size=pipeline_config.get('page_queue_size', 64),
+                checkpoint_every=pipeline_config.get('checkpoint_every_pages', 200),
+                checkpoint_interval=pipeline_config.get('checkpoint_interval', 60),
+                timings=self.timings,
+                dedup=dedup,
+                max_duplicate_sources=self.config.get('dedup', {}).get('max_duplicate_sources', 20)
+            )
+            crawl = CrawlResult(manifest, pipeline.put, state=state, lastmod=lastmod)
+            pipeline.start()
             try:
-                # Process each starting URL and its linked pages
-                for url in urls:
-                    if self._is_url_allowed(url):
-                        self._process_page(url, all_documents, page, depth=0)
-            finally:
-                browser.close()
-
-        if not all_documents:
+                if state.resumed:
+                    resent = await crawl.restore()
+                    print(f"Restored {len(crawl.seen)} pages from the interrupted crawl, "
+                          f"{resent} of them still to index")
+                stats = await self._crawl(seeds, crawl, state)
+            except BaseException:
+                await pipeline.abort()
+                state.close()
+                raise
+
+            removed = crawl.removed_urls(failed=stats.failed_urls)
+            if stats.failed_urls:
+                print(f"⚠️ {len(stats.failed_urls)} pages failed; their indexed chunks are kept")
+            await pipeline.finish(removed)
+            return crawl, pipeline, removed, stats
+
+        crawl, pipeline, removed, stats = asyncio.run(run())
+        # Everything is in the index and manifest now
+        state.finish()
+        state.close()
+        self.timings.add("crawl", stats.elapsed)
+
+        if self.vectorstore is None:
             raise ValueError("No documents were loaded from any of the provided URLs")
+        with self.timings.time("ann_build"):
+            self._build_ann_index(index_path)
+        with self.timings.time("bm25_build"):
+            lexical_index = self._build_lexical_index(index_path)
+        publish(collection.index_path, version, keep=self.config['vector_store'].get('keep_versions', 3),
+                grace_seconds=self.config['vector_store'].get('prune_grace_seconds', 600))
+        print(f"Published version {version} of collection {collection.name}")
+        # Served right away, by the flat index just updated
+        self._set_shard(Shard(collection.name, self.vectorstore, lexical_index, version=version))
 
-        # Split documents into chunks
-        text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=self.config['document']['chunk_size'],
-            chunk_overlap=self.config['document']['chunk_overlap']
+        print(f"\nRemoved {pipeline.chunks_removed} stale chunks, added {pipeline.chunks_added} chunks "
+              f"({len(crawl.changed)} new or changed, {len(crawl.unchanged)} unchanged, "
+              f"{len(removed)} removed pages)")
+        embedding_stats = self.embeddings.stats(since=embedding_baseline)
+        print(f"Embedding cache: {embedding_stats['hits']} hits, {embedding_stats['misses']} misses, "
+              f"{embedding_stats['backend_calls']} embedding calls")
+        dedup_report = self._dedup_report(dedup, pipeline)
+        if dedup_report:
+            print(f"Deduplication: {dedup_report['pages_deduplicated']} duplicate pages, "
+                  f"{dedup_report['chunks_saved']} chunks and about {dedup_report['embedding_calls_saved']} "
+                  f"embedding calls saved")
+
+        return {
+            "collection": collection.name,
+            "version": version,
+            "pages_crawled": stats.pages_crawled,
+            "pages_failed": stats.pages_failed,
+            "pages_skipped": stats.pages_skipped,
+            "crawl_seconds": round(stats.elapsed, 3),
+            "pages_per_second": round(stats.pages_per_second, 2),
+            "resumed": state.resumed,
+            "pages_changed": len(crawl.changed),
+            "pages_unchanged": len(crawl.unchanged),
+            "pages_removed": len(removed),
+            "chunks_added": pipeline.chunks_added,
+            "chunks_removed": pipeline.chunks_removed,
+            "index_bytes": sum(f.stat().st_size for f in Path(index_path).iterdir() if f.is_file()),
+            "embedding_cache": embedding_stats,
+            "dedup": dedup_report,
+            "sitemap": self.sitemap_stats,
+            "browser": self._browser_report(),
+            "stages": self.timings.as_dict(),
+        }
+
+    def _open_deduplicator(self, manifest: PageManifest) -> Optional[Deduplicator]:
+        """
+        Near-duplicate detection for the run, seeded with the fingerprints of
+        the existing index when updating it
+        """
+        dedup_config = self.config.get('dedup', {})
+        if not dedup_config.get('enabled', True):
+            return None
+        dedup = Deduplicator(
+            max_distance=dedup_config.get('max_distance', 3),
+            shingle_size=dedup_config.get('shingle_size', 3),
+            min_shingles=dedup_config.get('min_shingles', 8)
         )
-        docs = text_splitter.split_documents(all_documents)
+        if self.vectorstore is not None:
+            with self.timings.time("dedup_load"):
+                dedup.load(manifest.pages.items(), self.vectorstore.docstore.iter_metadata())
+            print(f"Loaded fingerprints of {len(dedup.pages)} pages and {len(dedup.chunks)} chunks")
+        return dedup
 
-        # Create and store embeddings
-        self.vectorstore = FAISS.from_documents(docs, self.embeddings)
-        
-        # Save the index locally
-        self.vectorstore.save_local(self.config['vector_store']['index_path'])
-        print(f"\nIndexed {len(docs)} document chunks from {len(all_documents)} pages")
+    def _dedup_report(self, dedup: Optional[Deduplicator], pipeline: IndexingPipeline) -> Optional[dict]:
+        """
+        What near-duplicate detection saved: chunks not embedded, and the
+        embedding requests they would have taken at the configured batch size
+        """
+        if dedup is None:
+            return None
+        batch_size = max(1, self.config.get('embeddings', {}).get('batch_size', 256))
+        saved = pipeline.chunks_deduplicated
+        return {
+            **dedup.stats(),
+            "chunks_saved": saved,
+            "embedding_calls_saved": -(-saved // batch_size),
+            "pages_orphaned": pipeline.pages_orphaned,
+        }
+
+    def _browser_report(self) -> dict:
+        """
+        Bytes transferred and load time per page rendered in the browser
+        """
+        report = dict(self.browser_stats)
+        pages = report.get("pages", 0)
+        load = self.timings.as_dict().get("page_load")
+        report["bytes_per_page"] = round(report["bytes"] / pages) if pages else None
+        report["load_seconds_per_page"] = round(load["seconds"] / load["count"], 3) if load else None
+        return report
+
+    def _build_ann_index(self, index_path: str):
+        """
+        Build the configured approximate index from the flat one, if any
+        """
+        meta = save_ann_index(index_path, self.vectorstore.index, self.ann_config)
+        if meta is not None:
+            action = "Trained and built" if meta['retrained'] else "Rebuilt (reusing trained quantizers)"
+            print(f"{action} {meta['factory']} index over {meta['ntotal']} vectors in {meta['build_seconds']}s")
+
+    def _build_lexical_index(self, index_path: str) -> Optional[BM25Index]:
+        """
+        Build the BM25 index over the committed chunks, in index position order
+        """
+        if not self.retrieval_config.get('hybrid', True):
+            return None
+        started = time.perf_counter()
+        lexical_index = BM25Index.build(
+            self.vectorstore.docstore.iter_texts(),
+            k1=self.retrieval_config.get('bm25_k1', 1.2),
+            b=self.retrieval_config.get('bm25_b', 0.75)
+        )
+        lexical_index.save(os.path.join(index_path, BM25_FILENAME))
+        print(f"Built BM25 index over {len(lexical_index)} chunks with "
+              f"{len(lexical_index.vocabulary)} terms in {time.perf_counter() - started:.2f}s")
+        return lexical_index
+
+    def _load_lexical_index(self, index_path: str, expected_count: int) -> Optional[BM25Index]:
+        """
+        The persisted BM25 index, if hybrid retrieval is on and it matches the index
+        """
+        if not self.retrieval_config.get('hybrid', True):
+            return None
+        path = os.path.join(index_path, BM25_FILENAME)
+        if os.path.exists(path):
+            lexical_index = BM25Index.load(path)
+            if len(lexical_index) == expected_count:
+                return lexical_index
+        print(f"⚠️ No up-to-date BM25 index in {index_path}, using vector retrieval only. "
+              f"Re-run the indexer to build it.")
+        return None
 
     def load_index(self):
         """
-        Load an existing index from disk
+        Load the published index version of every collection from disk for
+        serving. Collections that were never indexed are skipped with a warning.
         """
-        index_path = self.config['vector_store']['index_path']
-        if os.path.exists(index_path):
-            self.vectorstore = FAISS.load_local(index_path, self.embeddings, allow_dangerous_deserialization=True)
-            print("Loaded existing index")
-        else:
-            raise FileNotFoundError(f"No existing index found at {index_path}. Please index documents first.")
+        shards = {}
+        for collection in self.collections.values():
+            index_path, version = current_index(collection.index_path)
+            if version is not None:
+                shards[collection.name] = self._load_shard(collection, index_path, version)
+            else:
+                print(f"⚠️ Collection {collection.name} has no index at {collection.index_path} yet")
+        if not shards:
+            raise FileNotFoundError(f"No existing index found for any collection under "
+                                    f"{self.config['vector_store']['index_path']}. Please index documents first.")
+        self._swap_shards(shards)
+
+    def reload_index(self) -> Dict[str, str]:
+        """
+        Load the collections whose published version changed since they were
+        loaded, and swap them in. Queries keep running on the loaded shards
+        meanwhile, and those in flight during the swap finish on them.
+        Returns the newly loaded version of each changed collection.
+        """
+        with self._reload_lock:
+            loaded = {}
+            for collection in self.collections.values():
+                shard = self.shards.get(collection.name)
+                index_path, version = current_index(collection.index_path)
+                if version is None or (shard is not None and shard.version == version):
+                    continue
+                loaded[collection.name] = self._load_shard(collection, index_path, version)
+            if loaded:
+                self._swap_shards({**self.shards, **loaded})
+            return {name: shard.version for name, shard in loaded.items()}
+
+    def index_changed(self) -> bool:
+        """Whether any collection has a published version other than the loaded one"""
+        for collection in self.collections.values():
+            shard = self.shards.get(collection.name)
+            version = current_version(collection.index_path)
+            if version is not None and (shard is None or shard.version != version):
+                return True
+        return False
+
+    def _load_shard(self, collection: Collection, index_path: str, version: str) -> Shard:
+        """
+        Load one version of a collection's index. The vectors come from the
+        configured ANN index when one is built, memory-mapped unless
+        `vector_store.ann.mmap` is off. Chunk text and metadata stay in the
+        SQLite docstore and are read only for retrieved hits.
+        """
+        started = time.perf_counter()
+        migrate_pickle_docstore(index_path)
+        docstore = SqliteDocstore(os.path.join(index_path, DOCSTORE_FILENAME))
+        verify_index(index_path, docstore)
+        positions = docstore.position_map()
+        index, description = load_serving_index(index_path, self.ann_config, len(positions))
+        check_consistent(index, positions, index_path)
+        vectorstore = FAISS(self.embeddings, index, docstore, positions)
+        lexical_index = self._load_lexical_index(index_path, len(positions))
+        load_seconds = time.perf_counter() - started
+        print(f"Loaded collection {collection.name} version {version}: {description} index with "
+              f"{index.ntotal} vectors in {load_seconds:.2f}s")
+        return Shard(collection.name, vectorstore, lexical_index, version=version, load_seconds=load_seconds)
+
+    def _set_shard(self, shard: Shard):
+        """
+        Serve a freshly indexed collection in place of its loaded shard
+        """
+        with self._reload_lock:
+            self._swap_shards({**self.shards, shard.name: shard})
+
+    def _swap_shards(self, shards: Dict[str, Shard]):
+        """
+        Serve `shards` from now on, in one assignment, and retire the shards
+        they replace once the queries still using them are done
+        """
+        previous, self.shards = self.shards, shards
+        if len(shards) != len(previous):
+            # Sized by the shard count. The old pool is not shut down: queries
+            # in flight still hold it, and its threads exit once it is unreferenced
+            self._shard_executor = None
+        current = set(map(id, shards.values()))
+        for shard in previous.values():
+            if id(shard) not in current:
+                shard.retire()
+        self._on_index_changed()
+
+    def current_versions(self) -> Dict[str, dict]:
+        """Version, chunk count and load time of every loaded collection"""
+        return {name: shard.info() for name, shard in self.shards.items()}
+
+    def _on_index_changed(self):
+        """
+        Drop cached answers, which may no longer match the index contents
+        """
+        if self.answer_cache is not None:
+            self.answer_cache.invalidate()
 
     def setup_qa_chain(self):
         """
-        Set up the question-answering chain with GPT-4
+        Set up the question-answering chain with GPT-4.
+        Retrieval happens in `retrieve`, so the chain only stuffs the given
+        documents into the prompt.
         """
-        if not self.vectorstore:
+        if not self.shards:
             raise ValueError("No vector store available. Please index documents or load an existing index first.")
 
         # Create a custom prompt template
@@ -333,43 +847,510 @@ class DocumentationIndexer:
         )
 
         # Create the chain
-        self.qa_chain = RetrievalQA.from_chain_type(
+        self.prompt = PROMPT
+        self.qa_chain = load_qa_chain(
             llm=self.llm,
             chain_type="stuff",
-            retriever=self.vectorstore.as_retriever(
-                search_kwargs={"k": self.config['vector_store']['similarity_search_k']}
-            ),
-            chain_type_kwargs={"prompt": PROMPT}
+            prompt=PROMPT
+        )
+
+    def _embed_query(self, question: str) -> List[float]:
+        """
+        Embed a question, reusing the embedding of a previously seen one
+        """
+        with span("query_embed"):
+            return self.query_cache.get_or_compute(question, self.embeddings.embed_query)
+
+    def _embed_queries(self, questions: List[str]) -> List[List[float]]:
+        """
+        Embed many questions in batched calls, reusing the embeddings of
+        previously seen ones
+        """
+        with span("query_embed"):
+            return self.query_cache.get_or_compute_many(questions, self.embeddings.embed_queries)
+
+    def select_shards(self, collections: Optional[List[str]] = None) -> List[Shard]:
+        """
+        The loaded shards of the named collections, or all of them
+        """
+        shards = self.shards
+        if not collections:
+            return list(shards.values())
+        for name in collections:
+            if name not in shards:
+                raise UnknownCollection(name, shards)
+        return [shards[name] for name in dict.fromkeys(collections)]
+
+    def _cache_scope(self, collections: Optional[List[str]] = None) -> str:
+        """
+        Answer cache partition of a collection selection; all collections share ""
+        """
+        names = sorted(shard.name for shard in self.select_shards(collections))
+        return "" if names == sorted(self.shards) else ",".join(names)
+
+    @property
+    def shard_executor(self) -> ThreadPoolExecutor:
+        """
+        Threads searching the shards of one query in parallel, apart from the
+        executor that runs `retrieve` itself so fan-out can never starve it
+        """
+        if self._shard_executor is None:
+            self._shard_executor = ThreadPoolExecutor(
+                max_workers=self.config.get('serving', {}).get('shard_workers') or max(1, len(self.shards)),
+                thread_name_prefix="shard"
+            )
+        return self._shard_executor
+
+    @contextmanager
+    def _lease_shards(self, collections: Optional[List[str]] = None):
+        """
+        The selected shards, leased so a concurrent swap cannot close them
+        while they are searched. A shard retired between selection and lease
+        was just replaced, so the selection is taken again.
+        """
+        while True:
+            shards = self.select_shards(collections)
+            leased = []
+            for shard in shards:
+                if not shard.acquire():
+                    break
+                leased.append(shard)
+            if len(leased) == len(shards):
+                break
+            for shard in leased:
+                shard.release()
+        try:
+            yield shards
+        finally:
+            for shard in shards:
+                shard.release()
+
+    def retrieve(self, question: str, embedding: Optional[List[float]] = None,
+                 collections: Optional[List[str]] = None) -> List[Document]:
+        """
+        Retrieve the documents most relevant to the question from the given
+        collections, or all of them. Each shard is searched in parallel, and
+        their hits merged into the global top k. With BM25 indexes, the vector
+        and keyword rankings are fused by reciprocal rank, so exact identifiers
+        like eVar or s.tl() are matched as well.
+        """
+        # Unknown collections fail before the query is embedded
+        self.select_shards(collections)
+        if embedding is None:
+            embedding = self._embed_query(question)
+        return self.retrieve_batch([question], [embedding], collections)[0]
+
+    def retrieve_batch(self, questions: List[str], embeddings: List[List[float]],
+                       collections: Optional[List[str]] = None) -> List[List[Document]]:
+        """
+        `retrieve` for many embedded questions at once: each shard searches
+        all query vectors in one matrix search, then the hits of every
+        question are merged separately.
+        """
+        k = self.config['vector_store']['similarity_search_k']
+        candidates = max(k, self.retrieval_config.get('candidates', 20))
+        queries = np.array(embeddings, dtype=np.float32).reshape(len(questions), -1)
+        with self._lease_shards(collections) as shards:
+            if len(shards) == 1:
+                per_shard = [shards[0].search(questions, queries, candidates)]
+            else:
+                executor = self.shard_executor
+                with span("shard_search"):
+                    per_shard = list(executor.map(
+                        lambda shard: shard.search(questions, queries, candidates), shards
+                    ))
+
+            # Chunk text is only read for the merged top k
+            by_name = {shard.name: shard for shard in shards}
+            results = []
+            with span("docstore_read"):
+                for i in range(len(questions)):
+                    hits = merge_hits([(shard.name, found[i]) for shard, found in zip(shards, per_shard)],
+                                      self.retrieval_config, k)
+                    docs = [by_name[name].document(position) for name, position in hits]
+                    results.append([doc for doc in docs if doc is not None])
+            return results
+
+    @staticmethod
+    def _sources(docs: List[Document]) -> List[str]:
+        """
+        Unique source URLs of the documents, in retrieval order, followed by
+        the pages that duplicate them
+        """
+        sources = [doc.metadata.get("source", "Unknown source") for doc in docs]
+        duplicates = [url for doc in docs for url in doc.metadata.get("duplicate_sources", [])]
+        return list(dict.fromkeys(sources + duplicates))
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """
+        Bounded thread pool for the blocking parts of the async serving path
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.config.get('serving', {}).get('executor_workers', 8),
+                thread_name_prefix="indexer"
+            )
+        return self._executor
+
+    def _cached_answer(self, question: str, embedding: Optional[List[float]] = None,
+                       scope: str = "", near_lookup_follows: bool = False) -> Optional[dict]:
+        """
+        Look up the answer cache: exactly by question, or by embedding if given
+        """
+        if self.answer_cache is None:
+            return None
+        if embedding is None:
+            cached = self.answer_cache.get_exact(question, scope, count_miss=not near_lookup_follows)
+        else:
+            cached = self.answer_cache.get_similar(embedding, scope)
+        return {**cached, "cached": True} if cached is not None else None
+
+    def _cached_response(self, prepared: PreparedQuestion, embedding: Optional[List[float]] = None,
+                         scope: str = "") -> Optional[dict]:
+        """
+        Cached answer for a prepared question. Near matches are only looked up
+        without conversation turns, whose answers depend on more than the query.
+        """
+        if embedding is None:
+            cached = self._cached_answer(prepared.prompt_question, scope=scope,
+                                         near_lookup_follows=not prepared.kept_turns)
+        elif not prepared.kept_turns:
+            cached = self._cached_answer(prepared.prompt_question, embedding, scope)
+        else:
+            cached = None
+        if cached is not None:
+            cached["usage"] = self.history.usage(prepared)
+        return cached
+
+    def _answer_response(self, prepared: PreparedQuestion, embedding: List[float], docs: List[Document],
+                         answer: str, scope: str = "") -> dict:
+        """
+        Build the response for a freshly generated answer and cache it
+        """
+        response = {
+            "answer": answer,
+            "sources": self._sources(docs)
+        }
+        if self.answer_cache is not None:
+            self.answer_cache.put(prepared.prompt_question,
+                                  embedding if not prepared.kept_turns else None, response, scope)
+        usage = self.history.usage(prepared, self._prompt(prepared, docs))
+        LLM_TOKENS.inc(usage["prompt_tokens"], kind="prompt")
+        LLM_TOKENS.inc(self.history.counter.count(answer), kind="completion")
+        return {**response, "cached": False, "usage": usage}
+
+    def _prompt(self, prepared: PreparedQuestion, docs: List[Document]) -> str:
+        """
+        Same prompt the stuff chain builds from the documents and question
+        """
+        return self.prompt.format(
+            context="\n\n".join(doc.page_content for doc in docs),
+            question=prepared.prompt_question
         )
 
-    def ask_question(self, question: str) -> dict:
+    def prepare_question(self, question: str, history: Optional[Turns] = None) -> PreparedQuestion:
         """
-        Ask a question and get an answer based on the indexed documentation
-        Returns a dictionary containing the answer and source URLs
+        Compact the conversation to the configured token budgets
+        """
+        with span("history_compaction"):
+            return self.history.prepare(question, history)
+
+    def _condense_prompt(self, prepared: PreparedQuestion) -> Optional[str]:
+        """
+        Prompt asking the LLM for a standalone retrieval question, when enabled
+        """
+        if not self.condense_with_llm or not prepared.kept_turns:
+            return None
+        return CONDENSE_PROMPT.format(history=prepared.history_text, question=prepared.question)
+
+    def ask_question(self, question: str, history: Optional[Turns] = None,
+                     collections: Optional[List[str]] = None) -> dict:
+        """
+        Ask a question and get an answer based on the indexed documentation.
+        `history` holds the earlier (role, content) turns of the conversation,
+        and `collections` restricts retrieval to the named collections.
+        Returns a dictionary containing the answer, source URLs, whether the
+        answer was served from the answer cache and the token usage
         """
         if not self.qa_chain:
             self.setup_qa_chain()
+
+        scope = self._cache_scope(collections)
+        prepared = self.prepare_question(question, history)
+
+        # Exact repeats are answered before any embedding or LLM call
+        cached = self._cached_response(prepared, scope=scope)
+        if cached is not None:
+            return cached
+
+        condense_prompt = self._condense_prompt(prepared)
+        if condense_prompt is not None:
+            with span("condense"):
+                prepared.retrieval_query = self.llm.invoke(condense_prompt).content.strip()
+
+        embedding = self._embed_query(prepared.retrieval_query)
+        cached = self._cached_response(prepared, embedding, scope)
+        if cached is not None:
+            return cached
         
-        # Get the answer and source documents
-        result = self.qa_chain.invoke({"query": question})
-        answer = result["result"]
-        
-        # Get source documents from the retriever
-        docs = self.vectorstore.similarity_search(question, k=3)
-        source_urls = [doc.metadata.get("source", "Unknown source") for doc in docs]
-        
-        return {
-            "answer": answer,
-            "sources": source_urls
+        # One retrieval pass feeds both the prompt and the returned sources
+        docs = self.retrieve(prepared.retrieval_query, embedding, collections)
+        with span("llm"):
+            result = self.qa_chain.invoke({"input_documents": docs, "question": prepared.prompt_question})
+        return self._answer_response(prepared, embedding, docs, result["output_text"], scope)
+
+    async def _retrieval_embedding(self, prepared: PreparedQuestion, llm_gate: Optional[LLMGate]) -> List[float]:
+        """
+        Condense the retrieval query if enabled, then embed it on the executor
+        """
+        condense_prompt = self._condense_prompt(prepared)
+        if condense_prompt is not None:
+            async with (llm_gate.slot() if llm_gate is not None else nullcontext()):
+                with span("condense"):
+                    message = await self.llm.ainvoke(condense_prompt)
+            prepared.retrieval_query = message.content.strip()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._embed_query, prepared.retrieval_query)
+
+    async def ask_question_async(self, question: str, llm_gate: Optional[LLMGate] = None,
+                                 history: Optional[Turns] = None,
+                                 collections: Optional[List[str]] = None) -> dict:
+        """
+        Non-blocking variant of `ask_question` for the API. Embedding and search
+        run on the bounded executor and the LLM is called asynchronously,
+        through `llm_gate` when one is given.
+        """
+        if not self.qa_chain:
+            self.setup_qa_chain()
+
+        scope = self._cache_scope(collections)
+        prepared = self.prepare_question(question, history)
+        cached = self._cached_response(prepared, scope=scope)
+        if cached is not None:
+            return cached
+
+        embedding = await self._retrieval_embedding(prepared, llm_gate)
+        cached = self._cached_response(prepared, embedding, scope)
+        if cached is not None:
+            return cached
+
+        loop = asyncio.get_running_loop()
+        docs = await loop.run_in_executor(self.executor, self.retrieve, prepared.retrieval_query, embedding,
+                                          collections)
+
+        async def call_llm():
+            with span("llm"):
+                return await self.qa_chain.ainvoke({"input_documents": docs, "question": prepared.prompt_question})
+
+        result = await (llm_gate.run(call_llm) if llm_gate is not None else call_llm())
+        return self._answer_response(prepared, embedding, docs, result["output_text"], scope)
+
+    async def stream_answer(self, question: str, llm_gate: Optional[LLMGate] = None,
+                            history: Optional[Turns] = None,
+                            collections: Optional[List[str]] = None) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        Answer a question as a stream of events: a "sources" event as soon as
+        retrieval finishes, then one "token" event per chunk of the answer.
+        """
+        if not self.qa_chain:
+            self.setup_qa_chain()
+
+        loop = asyncio.get_running_loop()
+        scope = self._cache_scope(collections)
+        prepared = self.prepare_question(question, history)
+        cached = self._cached_response(prepared, scope=scope)
+        embedding = None
+        if cached is None:
+            embedding = await self._retrieval_embedding(prepared, llm_gate)
+            cached = self._cached_response(prepared, embedding, scope)
+        if cached is not None:
+            yield "sources", {"sources": cached["sources"], "cached": True, "usage": cached["usage"]}
+            yield "token", {"token": cached["answer"]}
+            return
+
+        docs = await loop.run_in_executor(self.executor, self.retrieve, prepared.retrieval_query, embedding,
+                                          collections)
+        prompt = self._prompt(prepared, docs)
+        yield "sources", {"sources": self._sources(docs), "cached": False,
+                          "usage": self.history.usage(prepared, prompt)}
+
+        answer_parts = []
+        async with (llm_gate.slot() if llm_gate is not None else nullcontext()):
+            # Includes the time the client takes to read each token
+            with span("llm_stream"):
+                async for chunk in self.llm.astream(prompt):
+                    if chunk.content:
+                        answer_parts.append(chunk.content)
+                        yield "token", {"token": chunk.content}
+        self._answer_response(prepared, embedding, docs, "".join(answer_parts), scope)
+
+    async def ask_batch(self, questions: List[str], llm_gate: Optional[LLMGate] = None,
+                        collections: Optional[List[str]] = None,
+                        max_concurrency: Optional[int] = None) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        Answer many independent questions, yielding a "result" event for each
+        as soon as it is answered and a final "report" event with throughput.
+
+        Every `serving.batch.retrieval_batch_size` questions are embedded in
+        batched calls and retrieved with one matrix search per shard. At most
+        `max_concurrency` of the batch's LLM calls run at a time, each also
+        through `llm_gate` so interactive questions keep their share. It is
+        capped by `serving.batch.max_concurrency` and by the gate's in-flight
+        limit, so a batch never queues its own calls in the gate.
+        Identical questions are answered once.
+        """
+        if not self.qa_chain:
+            self.setup_qa_chain()
+
+        batch_config = self.config.get('serving', {}).get('batch', {})
+        retrieval_batch_size = max(1, batch_config.get('retrieval_batch_size', 256))
+        concurrency = batch_config.get('max_concurrency', 4)
+        if max_concurrency:
+            concurrency = min(concurrency, max_concurrency)
+        if llm_gate is not None:
+            concurrency = min(concurrency, llm_gate.max_in_flight)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        scope = self._cache_scope(collections)
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        groups: Dict[str, List[int]] = {}
+        for i, question in enumerate(questions):
+            groups.setdefault(normalize_question(question), []).append(i)
+        # (group key, response, error) of each answered group
+        completed: asyncio.Queue = asyncio.Queue()
+        # Groups answered or failed, and groups waiting for their LLM call
+        dispatched = set()
+        scheduled = set()
+        llm_tasks = set()
+        counts = {"retrieval_batches": 0, "llm_calls": 0}
+
+        def finish(key: str, response: Optional[dict] = None, error: Optional[BaseException] = None):
+            dispatched.add(key)
+            completed.put_nowait((key, response, error))
+
+        async def answer(prepared: PreparedQuestion, embedding: List[float], docs: List[Document]) -> dict:
+            async def call_llm():
+                counts["llm_calls"] += 1
+                with span("llm"):
+                    return await self.qa_chain.ainvoke({"input_documents": docs,
+                                                        "question": prepared.prompt_question})
+
+            async with semaphore:
+                result = await (llm_gate.run(call_llm) if llm_gate is not None else call_llm())
+            return self._answer_response(prepared, embedding, docs, result["output_text"], scope)
+
+        def on_answered(key: str, task: asyncio.Task):
+            llm_tasks.discard(task)
+            if not task.cancelled():
+                error = task.exception()
+                finish(key, None if error is not None else task.result(), error)
+
+        async def produce():
+            pending = []
+            for key, indexes in groups.items():
+                prepared = self.prepare_question(questions[indexes[0]])
+                cached = self._cached_response(prepared, scope=scope)
+                if cached is not None:
+                    finish(key, cached)
+                else:
+                    pending.append((key, prepared))
+
+            for start in range(0, len(pending), retrieval_batch_size):
+                # Retrieval stays at most one batch ahead of the LLM calls
+                while len(llm_tasks) >= retrieval_batch_size:
+                    await asyncio.wait(llm_tasks, return_when=asyncio.FIRST_COMPLETED)
+                chunk = pending[start:start + retrieval_batch_size]
+                try:
+                    embeddings = await loop.run_in_executor(
+                        self.executor, self._embed_queries, [prepared.retrieval_query for _, prepared in chunk]
+                    )
+                    uncached = []
+                    for (key, prepared), embedding in zip(chunk, embeddings):
+                        cached = self._cached_response(prepared, embedding, scope)
+                        if cached is not None:
+                            finish(key, cached)
+                        else:
+                            uncached.append((key, prepared, embedding))
+                    found = await loop.run_in_executor(
+                        self.executor, self.retrieve_batch, [prepared.retrieval_query for _, prepared, _ in uncached],
+                        [embedding for _, _, embedding in uncached], collections
+                    )
+                    counts["retrieval_batches"] += 1
+                except Exception as e:
+                    for key, _ in chunk:
+                        if key not in dispatched:
+                            finish(key, error=e)
+                    continue
+                for (key, prepared, embedding), docs in zip(uncached, found):
+                    task = asyncio.ensure_future(answer(prepared, embedding, docs))
+                    llm_tasks.add(task)
+                    scheduled.add(key)
+                    task.add_done_callback(lambda task, key=key: on_answered(key, task))
+
+        producer = asyncio.ensure_future(produce())
+        producer_checked = False
+        failed = cached = 0
+        try:
+            for _ in range(len(groups)):
+                getter = asyncio.ensure_future(completed.get())
+                if not producer.done():
+                    await asyncio.wait({getter, producer}, return_when=asyncio.FIRST_COMPLETED)
+                if producer.done() and not producer_checked:
+                    producer_checked = True
+                    if producer.exception() is not None:
+                        # Groups the producer never got to fail with it
+                        for key in groups:
+                            if key not in dispatched and key not in scheduled:
+                                finish(key, error=producer.exception())
+                key, response, error = await getter
+                for i in groups[key]:
+                    if error is not None:
+                        failed += 1
+                        yield "result", {"index": i, "question": questions[i],
+                                         "status": 429 if isinstance(error, Overloaded) else 500,
+                                         "error": str(error)}
+                    else:
+                        cached += response.get("cached", False)
+                        yield "result", {"index": i, "question": questions[i], **response}
+        finally:
+            producer.cancel()
+            for task in list(llm_tasks):
+                task.cancel()
+
+        elapsed = time.perf_counter() - started
+        yield "report", {
+            "questions": len(questions),
+            "unique_questions": len(groups),
+            "answered": len(questions) - failed,
+            "cached": cached,
+            "failed": failed,
+            "llm_calls": counts["llm_calls"],
+            "retrieval_batches": counts["retrieval_batches"],
+            "seconds": round(elapsed, 3),
+            "questions_per_second": round(len(questions) / elapsed, 2) if elapsed > 0 else None,
         }
 
 def main():
+    parser = argparse.ArgumentParser(description="Crawl and index the documentation")
+    parser.add_argument("--full-rebuild", action="store_true",
+                        help="Ignore the page manifest and rebuild the index from scratch")
+    parser.add_argument("--collection", action="append", metavar="NAME",
+                        help="Index only this collection (repeatable); all collections by default")
+    parser.add_argument("--report", metavar="PATH",
+                        help="Write the run's counters and per-stage timings to this JSON file")
+    args = parser.parse_args()
+
     # Initialize the indexer
     indexer = DocumentationIndexer()
     
     print("Indexing documents...")
-    indexer.index_documents()
+    reports = indexer.index_collections(args.collection, full_rebuild=args.full_rebuild)
     print("Indexing completed!")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump({"collections": reports}, f, indent=2)
+        print(f"Wrote run report to {args.report}")
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -0,0 +1,309 @@
+"""
+On-disk docstore for the FAISS vector store.
+
+Chunk text and metadata live in SQLite and are read by ID only for the hits a
+query retrieves, instead of unpickling every chunk into memory at startup.
+
+Existing index directories with a pickled index.pkl are migrated on first load,
+or explicitly with:
+
+    python src/docstore.py migrate src/faiss_index
+"""
+import argparse
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import zlib
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+
+import faiss
+from langchain.docstore.document import Document
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.embeddings import Embeddings
+
+from ann_index import FLAT_INDEX_FILENAME
+
+DOCSTORE_FILENAME = "docstore.sqlite"
+PICKLE_FILENAME = "index.pkl"
+
+
+class SqliteDocstore(Docstore, AddableMixin):
+    """
+    Docstore backed by SQLite, plus the index position → chunk ID mapping.
+
+    Adds and deletes are buffered in memory and written in one transaction by
+    `commit`, together with the positions of the index saved alongside, so the
+    file on disk always describes a whole saved index and never half a batch.
+    With `reset`, the first commit replaces everything that was stored before.
+    """
+
+    def __init__(self, path: str, reset: bool = False):
+        self.path = path
+        self._reset = reset
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            " id TEXT PRIMARY KEY, page_content TEXT NOT NULL, metadata TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS positions (position INTEGER PRIMARY KEY, id TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        self._conn.commit()
+        self._pending_adds: Dict[str, Document] = {}
+        self._pending_deletes = set()
+        # Positions below this are already on disk, unless a delete renumbered them
+        self._committed_positions = 0 if reset else self._count_positions()
+        self._renumbered = reset
+
+    def _count_positions(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+
+    def search(self, search: str) -> Union[str, Document]:
+        if search in self._pending_adds:
+            return self._pending_adds[search]
+        if search in self._pending_deletes or self._reset:
+            return f"ID {search} not found."
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT page_content, metadata FROM chunks WHERE id = ?", (search,)
+            ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        return Document(page_content=row[0], metadata=json.loads(row[1]))
+
+    def add(self, texts: Dict[str, Document]) -> None:
+        for chunk_id, document in texts.items():
+            self._pending_deletes.discard(chunk_id)
+            self._pending_adds[chunk_id] = document
+
+    def delete(self, ids: List) -> None:
+        for chunk_id in ids:
+            self._pending_adds.pop(chunk_id, None)
+            self._pending_deletes.add(chunk_id)
+        # FAISS renumbers the remaining positions after a delete
+        self._renumbered = True
+
+    def commit(self, index_to_docstore_id: Mapping, index_checksum: Optional[str] = None) -> None:
+        """
+        Persist buffered changes and the positions of the index just saved,
+        with the checksum of the index file they describe
+        """
+        with self._lock, self._conn:
+            if index_checksum is not None:
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('index_checksum', ?)",
+                                   (index_checksum,))
+            if self._reset:
+                self._conn.execute("DELETE FROM chunks")
+            if self._pending_deletes:
+                self._conn.executemany("DELETE FROM chunks WHERE id = ?",
+                                       [(chunk_id,) for chunk_id in self._pending_deletes])
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, page_content, metadata) VALUES (?, ?, ?)",
+                [(chunk_id, doc.page_content, json.dumps(doc.metadata, default=str))
+                 for chunk_id, doc in self._pending_adds.items()]
+            )
+            start = 0 if self._renumbered else self._committed_positions
+            self._conn.execute("DELETE FROM positions WHERE position >= ?", (start,))
+            self._conn.executemany(
+                "INSERT INTO positions (position, id) VALUES (?, ?)",
+                [(position, index_to_docstore_id[position])
+                 for position in range(start, len(index_to_docstore_id))]
+            )
+        self._pending_adds.clear()
+        self._pending_deletes.clear()
+        self._committed_positions = len(index_to_docstore_id)
+        self._renumbered = False
+        self._reset = False
+
+    def index_checksum(self) -> Optional[str]:
+        """Checksum of the index file last committed with, or None for docstores saved without one"""
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'index_checksum'").fetchone()
+        return row[0] if row else None
+
+    def load_positions(self) -> Dict[int, str]:
+        """The whole position → chunk ID mapping, for updating the index"""
+        with self._lock:
+            return dict(self._conn.execute("SELECT position, id FROM positions"))
+
+    def iter_texts(self) -> Iterator[str]:
+        """Committed chunk texts in index position order, streamed"""
+        # Own connection, so streaming a large corpus does not hold the lock
+        conn = sqlite3.connect(self.path)
+        try:
+            for (text,) in conn.execute(
+                "SELECT chunks.page_content FROM positions JOIN chunks ON chunks.id = positions.id"
+                " ORDER BY positions.position"
+            ):
+                yield text
+        finally:
+            conn.close()
+
+    def iter_metadata(self) -> Iterator[Tuple[str, dict]]:
+        """Committed chunk IDs and metadata, streamed"""
+        conn = sqlite3.connect(self.path)
+        try:
+            for chunk_id, metadata in conn.execute("SELECT id, metadata FROM chunks"):
+                yield chunk_id, json.loads(metadata)
+        finally:
+            conn.close()
+
+    def position_map(self) -> "PositionMap":
+        """Lazily read position → chunk ID mapping, for serving"""
+        return PositionMap(self)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class PositionMap(Mapping):
+    """Read-only position → chunk ID mapping that looks positions up on demand"""
+
+    def __init__(self, docstore: SqliteDocstore):
+        self._docstore = docstore
+        with docstore._lock:
+            self._size = docstore._count_positions()
+
+    def __getitem__(self, position) -> str:
+        with self._docstore._lock:
+            row = self._docstore._conn.execute(
+                "SELECT id FROM positions WHERE position = ?", (int(position),)
+            ).fetchone()
+        if row is None:
+            raise KeyError(position)
+        return row[0]
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self._docstore.load_positions())
+
+    def __len__(self) -> int:
+        return self._size
+
+
+def new_vectorstore(index_path: str, embeddings: Embeddings, dimension: int) -> FAISS:
+    """Empty flat vector store whose first save replaces whatever `index_path` held"""
+    os.makedirs(index_path, exist_ok=True)
+    docstore = SqliteDocstore(os.path.join(index_path, DOCSTORE_FILENAME), reset=True)
+    return FAISS(embeddings, faiss.IndexFlatL2(dimension), docstore, {})
+
+
+def load_vectorstore(index_path: str, embeddings: Embeddings) -> FAISS:
+    """Load the flat index fully into memory, with its whole position mapping, for updating"""
+    migrate_pickle_docstore(index_path)
+    docstore = SqliteDocstore(os.path.join(index_path, DOCSTORE_FILENAME))
+    verify_index(index_path, docstore)
+    index = faiss.read_index(os.path.join(index_path, FLAT_INDEX_FILENAME))
+    positions = docstore.load_positions()
+    check_consistent(index, positions, index_path)
+    return FAISS(embeddings, index, docstore, positions)
+
+
+def save_vectorstore(vectorstore: FAISS, index_path: str) -> None:
+    """
+    Write the flat index beside the old one, commit the docstore that
+    describes it along with the new file's checksum, then swap the new index
+    in. A save interrupted before the commit leaves the previous index and
+    docstore; one interrupted after it is finished by `verify_index`.
+    """
+    index_file = os.path.join(index_path, FLAT_INDEX_FILENAME)
+    faiss.write_index(vectorstore.index, index_file + ".tmp")
+    vectorstore.docstore.commit(vectorstore.index_to_docstore_id, index_checksum=file_checksum(index_file + ".tmp"))
+    os.replace(index_file + ".tmp", index_file)
+    pickle_file = os.path.join(index_path, PICKLE_FILENAME)
+    if os.path.exists(pickle_file):
+        # Left over from before the migration and no longer describes the index
+        os.remove(pickle_file)
+
+
+def file_checksum(path: str) -> str:
+    """Size and CRC-32 of a file, read in 1 MB blocks"""
+    crc, size = 0, 0
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(1 << 20)
+            if not block:
+                break
+            crc = zlib.crc32(block, crc)
+            size += len(block)
+    return f"{size}:{crc:08x}"
+
+
+def verify_index(index_path: str, docstore: SqliteDocstore) -> None:
+    """
+    Check that the flat index is the one the docstore was committed with.
+    When a save stopped between the docstore commit and the index swap, the
+    new index is still in index.faiss.tmp and is swapped in now.
+    """
+    expected = docstore.index_checksum()
+    if expected is None:
+        return
+    index_file = os.path.join(index_path, FLAT_INDEX_FILENAME)
+    if os.path.exists(index_file) and file_checksum(index_file) == expected:
+        return
+    if os.path.exists(index_file + ".tmp") and file_checksum(index_file + ".tmp") == expected:
+        os.replace(index_file + ".tmp", index_file)
+        print(f"✅ Finished the interrupted save of the index in {index_path}")
+        return
+    raise ValueError(
+        f"Index in {index_path} is not the one its docstore was saved with; "
+        f"the last indexing run was interrupted while saving. Re-run the indexer with --full-rebuild."
+    )
+
+
+def check_consistent(index, positions: Mapping, index_path: str) -> None:
+    if index.ntotal != len(positions):
+        raise ValueError(
+            f"Index in {index_path} has {index.ntotal} vectors but its docstore maps {len(positions)}; "
+            f"the last indexing run was interrupted while saving. Re-run the indexer with --full-rebuild."
+        )
+
+
+def migrate_pickle_docstore(index_path: str) -> bool:
+    """
+    Convert a pickled index.pkl docstore into docstore.sqlite, once.
+    The pickle is kept as index.pkl.migrated. Returns whether it migrated.
+    """
+    pickle_file = os.path.join(index_path, PICKLE_FILENAME)
+    docstore_file = os.path.join(index_path, DOCSTORE_FILENAME)
+    if os.path.exists(docstore_file) or not os.path.exists(pickle_file):
+        return False
+
+    print(f"Migrating pickled docstore in {index_path} to {DOCSTORE_FILENAME}...")
+    with open(pickle_file, "rb") as f:
+        # Trusted: written by our own indexer before the migration
+        legacy_docstore, index_to_docstore_id = pickle.load(f)
+
+    # Built under a temporary name so an interrupted migration is simply redone
+    tmp_file = docstore_file + ".tmp"
+    if os.path.exists(tmp_file):
+        os.remove(tmp_file)
+    docstore = SqliteDocstore(tmp_file)
+    docstore.add({chunk_id: legacy_docstore.search(chunk_id) for chunk_id in index_to_docstore_id.values()})
+    docstore.commit(index_to_docstore_id)
+    docstore.close()
+    os.replace(tmp_file, docstore_file)
+    os.replace(pickle_file, pickle_file + ".migrated")
+    print(f"Migrated {len(index_to_docstore_id)} chunks")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the on-disk docstore of an index")
+    parser.add_argument("command", choices=["migrate"])
+    parser.add_argument("index_path", help="Index directory, e.g. src/faiss_index")
+    args = parser.parse_args()
+
+    if not migrate_pickle_docstore(args.index_path):
+        print(f"Nothing to migrate in {args.index_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+
+def embedding_key(text: str, model_name: str) -> str:
+    """Content address of an embedding: hash of the model name and the text"""
+    return hashlib.sha256(f"{model_name}\0{text}".encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk store of embedding vectors keyed by `embedding_key`.
+    Holds at most `max_entries` vectors, evicting the least recently used.
+    """
+
+    def __init__(self, path: str, max_entries: int = 500000):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            " key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        """Look up vectors for the given keys, refreshing their recency"""
+        keys = list(dict.fromkeys(keys))
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array('f')
+                    vector.frombytes(blob)
+                    found[key] = vector.tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, vectors: Dict[str, List[float]]) -> None:
+        """Store vectors and evict the least recently used ones beyond the size bound"""
+        if not vectors:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                [(key, array('f', vector).tobytes(), now) for key, vector in vectors.items()]
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        # Evict down to 90% of the bound so eviction does not run on every insert
+        excess = count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE key IN ("
+            " SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)", (excess,)
+        )
+        print(f"Evicted {excess} embeddings from cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves repeated chunk texts from an `EmbeddingCache`
+    and sends the misses to the backend in batches, with a bounded number of
+    concurrent requests and retry with exponential backoff
+    """
+
+    def __init__(self,
+                 backend: Embeddings,
+                 cache: Optional[EmbeddingCache],
+                 model_name: str,
+                 batch_size: int = 256,
+                 max_concurrency: int = 4,
+                 max_retries: int = 5,
+                 backoff_base: float = 1.0):
+        self.backend = backend
+        self.cache = cache
+        self.model_name = model_name
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.hits = 0
+        self.misses = 0
+        self.backend_calls = 0
+        self.query_calls = 0
+        self._stats_lock = threading.Lock()
+
+    def _call_backend(self, call: Callable[[], List], counter: str, description: str) -> List:
+        """Make one backend call, retrying with exponential backoff and jitter; counted in `counter`"""
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._stats_lock:
+                    setattr(self, counter, getattr(self, counter) + 1)
+                return call()
+            except Exception as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff_base * (2 ** attempt) * (1 + random.random())
+                print(f"{description} failed ({e}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _embed_batch(self, texts: List[str], counter: str = "backend_calls") -> List[List[float]]:
+        """Embed one batch on the backend"""
+        return self._call_backend(lambda: self.backend.embed_documents(texts), counter,
+                                  f"Embedding batch of {len(texts)}")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [embedding_key(text, self.model_name) for text in texts]
+        vectors = self.cache.get_many(keys) if self.cache is not None else {}
+
+        # Unique texts that still need an embedding
+        missing: Dict[str, str] = {}
+        for key, text in zip(keys, texts):
+            if key not in vectors and key not in missing:
+                missing[key] = text
+        with self._stats_lock:
+            self.hits += len(texts) - sum(1 for key in keys if key in missing)
+            self.misses += len(missing)
+
+        if missing:
+            missing_keys = list(missing)
+            batches = [missing_keys[i:i + self.batch_size]
+                       for i in range(0, len(missing_keys), self.batch_size)]
+            with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as executor:
+                results = executor.map(
+                    lambda batch: self._embed_batch([missing[key] for key in batch]), batches
+                )
+                new_vectors: Dict[str, List[float]] = {}
+                for batch, embedded in zip(batches, results):
+                    new_vectors.update(zip(batch, embedded))
+            if self.cache is not None:
+                self.cache.put_many(new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[key] for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._call_backend(lambda: self.backend.embed_query(text), "query_calls", "Embedding query")
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed many queries in `batch_size` batches, `max_concurrency` at a
+        time, bypassing the chunk cache. Batches are counted in `query_calls`,
+        apart from the indexing-side `backend_calls`.
+        """
+        if not texts:
+            return []
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as executor:
+            results = executor.map(lambda batch: self._embed_batch(batch, "query_calls"), batches)
+            return [vector for embedded in results for vector in embedded]
+
+    def stats(self, since: Optional[Dict[str, int]] = None) -> Dict[str, int]:
+        """Counters since the wrapper was created, or since an earlier `stats()` snapshot"""
+        stats = {"hits": self.hits, "misses": self.misses, "backend_calls": self.backend_calls,
+                 "query_calls": self.query_calls}
+        if since:
+            stats = {name: value - since.get(name, 0) for name, value in stats.items()}
+        return stats
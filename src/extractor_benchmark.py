@@ -0,0 +1,203 @@
+"""
+Time per page of the single-round-trip in-page extractor against the legacy
+one it replaced. The legacy extractor waited on each main-content selector
+in turn, made one call per exclude rule, and emitted headings, paragraphs
+and code blocks in three separate passes.
+
+Both run in the same browser on the same pages, by default a synthetic doc
+site served locally. Each extractor navigates to every page on its own,
+because the legacy one removes excluded elements from the live page.
+Round trips count the Playwright calls made by each extractor.
+
+    python src/extractor_benchmark.py --pages 50 --output extract.json
+    python src/extractor_benchmark.py --url https://experienceleague.adobe.com/en/docs/analytics/analyze/home
+
+Needs the Playwright browser (playwright install chromium).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import yaml
+
+sys.path.append(str(Path(__file__).parent))
+
+from benchmark import SyntheticSite
+from browser_extractor import DEFAULT_RULES, extract_rendered_page, wait_for_main_content
+from load_test import percentile
+
+LEGACY_CONTENT_SCRIPT = '''(elementInfo) => {
+    const mainContent = document.querySelector(elementInfo.selector);
+    if (!mainContent) return '';
+    const content = [];
+    mainContent.querySelectorAll('h1, h2, h3, h4, h5, h6').forEach(heading => {
+        const text = heading.innerText.trim();
+        if (text) content.push(`${'#'.repeat(parseInt(heading.tagName[1]))} ${text}\\n`);
+    });
+    mainContent.querySelectorAll('p, li').forEach(element => {
+        const text = element.innerText.trim();
+        if (text) content.push(element.tagName === 'LI' ? `- ${text}\\n` : `${text}\\n\\n`);
+    });
+    mainContent.querySelectorAll('pre').forEach(code => {
+        const text = code.innerText.trim();
+        if (text) content.push(`\\`\\`\\`\\n${text}\\n\\`\\`\\`\\n\\n`);
+    });
+    return content.join('');
+}'''
+
+
+class CallCounter:
+    """Proxy counting the calls made on a page and on the handles it returns"""
+
+    def __init__(self, target, counts: List[int]):
+        self._target = target
+        self._counts = counts
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            self._counts[0] += 1
+            result = attr(*args, **kwargs)
+            if asyncio.iscoroutine(result):
+                return self._wrap_async(result)
+            return CallCounter(result, self._counts) if hasattr(result, 'evaluate') else result
+        return call
+
+    async def _wrap_async(self, coroutine):
+        result = await coroutine
+        return CallCounter(result, self._counts) if hasattr(result, 'evaluate') else result
+
+
+async def legacy_extract(page, rules: Dict) -> Tuple[str, str, List[str]]:
+    """The extractor as it was before the single-round-trip rewrite"""
+    main_content = None
+    for selector in rules['main_content']:
+        try:
+            main_content = await page.wait_for_selector(selector, timeout=rules.get('wait_timeout', 5) * 1000)
+            if main_content:
+                break
+        except Exception:
+            continue
+    if not main_content:
+        main_content = page.locator('body')
+    for selector in rules['exclude']:
+        try:
+            await page.evaluate('''(selector) => {
+                document.querySelectorAll(selector).forEach(el => el.remove());
+            }''', selector)
+        except Exception:
+            continue
+    element_info = await main_content.evaluate('''(el) => {
+        const tag = el.tagName.toLowerCase();
+        const id = el.id ? '#' + el.id : '';
+        const classes = el.className ? '.' + el.className.split(' ').join('.') : '';
+        return {selector: tag + id + classes, html: el.outerHTML};
+    }''')
+    content = (await page.evaluate(LEGACY_CONTENT_SCRIPT, element_info)).strip()
+    title = await page.title()
+    links = await page.evaluate('''() => Array.from(document.querySelectorAll('a[href]')).map(link => link.href)''')
+    return content, title, links
+
+
+async def single_pass_extract(page, rules: Dict) -> Tuple[str, str, List[str]]:
+    await wait_for_main_content(page, rules)
+    rendered = await extract_rendered_page(page, rules)
+    return rendered.content, rendered.title, rendered.links
+
+
+EXTRACTORS = {"legacy": legacy_extract, "single_pass": single_pass_extract}
+
+
+async def measure(urls: List[str], rules: Dict) -> Dict[str, dict]:
+    from playwright.async_api import async_playwright
+
+    samples = {name: {"seconds": [], "calls": [], "chars": [], "links": []} for name in EXTRACTORS}
+    async with async_playwright() as playwright:
+        browser = await playwright.chromium.launch(headless=True)
+        page = await browser.new_page()
+        try:
+            for i, url in enumerate(urls):
+                # Alternate the order so neither extractor always gets a warm cache
+                names = list(EXTRACTORS) if i % 2 == 0 else list(reversed(EXTRACTORS))
+                for name in names:
+                    await page.goto(url, wait_until='domcontentloaded', timeout=60000)
+                    try:
+                        await page.wait_for_load_state('networkidle', timeout=30000)
+                    except Exception:
+                        pass
+                    counts = [0]
+                    started = time.perf_counter()
+                    content, _, links = await EXTRACTORS[name](CallCounter(page, counts), rules)
+                    samples[name]["seconds"].append(time.perf_counter() - started)
+                    samples[name]["calls"].append(counts[0])
+                    samples[name]["chars"].append(len(content))
+                    samples[name]["links"].append(len(links))
+        finally:
+            await browser.close()
+    return samples
+
+
+def summarize(values: Dict[str, list]) -> dict:
+    seconds = values["seconds"]
+    pages = len(seconds)
+    return {
+        "mean_ms_per_page": round(sum(seconds) / pages * 1000, 3),
+        "p50_ms": round(percentile(seconds, 50) * 1000, 3),
+        "p95_ms": round(percentile(seconds, 95) * 1000, 3),
+        "round_trips_per_page": round(sum(values["calls"]) / pages, 2),
+        "chars_per_page": round(sum(values["chars"]) / pages, 1),
+        "links_per_page": round(sum(values["links"]) / pages, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Legacy vs. single-round-trip in-page extraction")
+    parser.add_argument("--url", nargs="+", help="Benchmark these pages instead of a synthetic site")
+    parser.add_argument("--pages", type=int, default=50, help="Synthetic pages")
+    parser.add_argument("--js-fraction", type=float, default=0.5,
+                        help="Share of synthetic pages rendered by JavaScript")
+    parser.add_argument("--site-port", type=int, default=8805)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    config_path = os.path.join(Path(__file__).parent.absolute(), "config.yaml")
+    with open(config_path) as f:
+        rules = {**DEFAULT_RULES, **(yaml.safe_load(f).get('extraction') or {})}
+
+    site_server = None
+    if args.url:
+        urls = args.url
+    else:
+        site = SyntheticSite(args.pages, js_fraction=args.js_fraction)
+        site_server = site.serve(args.site_port)
+        urls = [f"http://127.0.0.1:{args.site_port}{site.path(i)}" for i in range(site.pages)]
+    try:
+        samples = asyncio.run(measure(urls, rules))
+    finally:
+        if site_server is not None:
+            site_server.shutdown()
+
+    results = {name: summarize(values) for name, values in samples.items()}
+    report = {
+        "pages": len(urls),
+        "source": "urls" if args.url else "synthetic",
+        "results": results,
+        "speedup": round(results["legacy"]["mean_ms_per_page"] / results["single_pass"]["mean_ms_per_page"], 2),
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import asyncio
+import hashlib
+import math
+import re
+import threading
+import time
+from typing import Any, AsyncIterator, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Deterministic offline embeddings for tests and benchmarks.
+    Each word is hashed into one of `size` buckets, so texts that share words
+    get similar vectors and identical texts always get identical ones.
+    """
+
+    def __init__(self, size: int = 256):
+        self.size = size
+        self.calls = 0
+        self.texts_embedded = 0
+        self._lock = threading.Lock()
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.size
+        for word in re.findall(r'\w+', text.lower()):
+            digest = hashlib.md5(word.encode('utf-8')).digest()
+            bucket = int.from_bytes(digest[:4], 'little') % self.size
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+        return [v / norm for v in vector]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with self._lock:
+            self.calls += 1
+            self.texts_embedded += len(texts)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        with self._lock:
+            self.calls += 1
+            self.texts_embedded += 1
+        return self._embed(text)
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Offline stand-in for ChatOpenAI that simulates upstream latency.
+    Answers mention the prompt length so callers can tell prompts apart.
+    When streamed, the latency is spread evenly over the answer's tokens.
+    """
+
+    latency: float = 0.5
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _answer(self, messages: List[BaseMessage]) -> str:
+        prompt = messages[-1].content if messages else ""
+        return f"Fake answer to a prompt of {len(prompt)} characters."
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        self.calls += 1
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._answer(messages)))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._answer(messages)))])
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        self.calls += 1
+        tokens = re.findall(r'\S+\s*', self._answer(messages))
+        for token in tokens:
+            await asyncio.sleep(self.latency / len(tokens))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
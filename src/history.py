@@ -0,0 +1,117 @@
+from typing import Dict, Optional, Sequence, Tuple
+
+import tiktoken
+
+# (role, content) pairs, oldest first
+Turns = Sequence[Tuple[str, str]]
+
+CONDENSE_PROMPT = """Given the following conversation and a follow-up question, rephrase the follow-up question to be a standalone question that can be understood without the conversation. Reply with the standalone question only.
+
+Conversation:
+{history}
+
+Follow-up question: {question}
+Standalone question:"""
+
+
+class TokenCounter:
+    """Counts tokens with the model's tokenizer, approximating if it is unavailable"""
+
+    def __init__(self, model_name: str):
+        try:
+            self._encoding = tiktoken.encoding_for_model(model_name)
+        except Exception:
+            try:
+                self._encoding = tiktoken.get_encoding("cl100k_base")
+            except Exception as e:
+                print(f"⚠️ Tokenizer unavailable, approximating token counts: {e}")
+                self._encoding = None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is None:
+            return max(1, len(text) // 4)
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+class PreparedQuestion:
+    """A question with its conversation compacted to the token budgets"""
+
+    def __init__(self, question: str, kept_turns: Turns, retrieval_query: str,
+                 history_tokens: int, kept_history_tokens: int, turns_dropped: int):
+        self.question = question
+        self.kept_turns = list(kept_turns)
+        self.retrieval_query = retrieval_query
+        self.history_tokens = history_tokens
+        self.kept_history_tokens = kept_history_tokens
+        self.turns_dropped = turns_dropped
+
+    @property
+    def history_text(self) -> str:
+        return "".join(f"{role}: {content}\n" for role, content in self.kept_turns)
+
+    @property
+    def prompt_question(self) -> str:
+        """The question as it goes into the prompt, after the kept turns"""
+        return f"{self.history_text}User: {self.question}"
+
+
+class ConversationCompactor:
+    """
+    Keeps only the most recent conversation turns that fit `token_budget` in
+    the prompt, and builds a short standalone query for retrieval from the
+    question plus as many earlier user turns as fit `retrieval_token_budget`
+    """
+
+    def __init__(self, counter: TokenCounter, token_budget: int = 1500, retrieval_token_budget: int = 64):
+        self.counter = counter
+        self.token_budget = token_budget
+        self.retrieval_token_budget = retrieval_token_budget
+
+    def prepare(self, question: str, history: Optional[Turns] = None) -> PreparedQuestion:
+        history = list(history or [])
+        turn_tokens = [self.counter.count(f"{role}: {content}\n") for role, content in history]
+
+        # Walk back from the most recent turn until the budget is spent
+        kept = 0
+        kept_tokens = 0
+        for tokens in reversed(turn_tokens):
+            if kept_tokens + tokens > self.token_budget:
+                break
+            kept += 1
+            kept_tokens += tokens
+        kept_turns = history[len(history) - kept:] if kept else []
+
+        # Earlier user questions give follow-ups like "how do I delete it?" their subject
+        query_parts = [question]
+        query_tokens = self.counter.count(question)
+        for role, content in reversed(kept_turns):
+            if role.lower() != "user":
+                continue
+            tokens = self.counter.count(content)
+            if query_tokens + tokens > self.retrieval_token_budget:
+                break
+            query_parts.insert(0, content)
+            query_tokens += tokens
+
+        return PreparedQuestion(
+            question=question,
+            kept_turns=kept_turns,
+            retrieval_query="\n".join(query_parts),
+            history_tokens=sum(turn_tokens),
+            kept_history_tokens=kept_tokens,
+            turns_dropped=len(history) - kept
+        )
+
+    def usage(self, prepared: PreparedQuestion, prompt: Optional[str] = None) -> Dict[str, int]:
+        """Per-request token counts showing what compaction saved"""
+        usage = {
+            "history_tokens": prepared.history_tokens,
+            "history_tokens_kept": prepared.kept_history_tokens,
+            "turns_dropped": prepared.turns_dropped,
+            "retrieval_query_tokens": self.counter.count(prepared.retrieval_query),
+        }
+        if prompt is not None:
+            usage["prompt_tokens"] = self.counter.count(prompt)
+        return usage
@@ -0,0 +1,353 @@
+import re
+from html.parser import HTMLParser
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from urllib.parse import urljoin
+
+# Elements that never have a closing tag
+VOID_ELEMENTS = {
+    'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input',
+    'link', 'meta', 'param', 'source', 'track', 'wbr'
+}
+
+# Elements whose text is never rendered
+HIDDEN_ELEMENTS = {'script', 'style', 'noscript', 'template', 'head', 'title'}
+
+# Opening one of these implicitly closes an open element of the same group
+IMPLICIT_CLOSE = {
+    'p': {'p'},
+    'li': {'li'},
+    'dt': {'dt', 'dd'},
+    'dd': {'dt', 'dd'},
+    'tr': {'tr'},
+    'td': {'td', 'th'},
+    'th': {'td', 'th'},
+    'option': {'option'},
+}
+
+BLOCK_ELEMENTS = {
+    'address', 'article', 'aside', 'blockquote', 'div', 'dl', 'dt', 'dd',
+    'fieldset', 'figcaption', 'figure', 'footer', 'form', 'h1', 'h2', 'h3',
+    'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol', 'p', 'pre',
+    'section', 'table', 'tr', 'ul'
+}
+
+
+HEADINGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+LISTS = {'ul', 'ol'}
+CELLS = {'td', 'th'}
+
+# (kind, text) pairs: heading, paragraph, item, code or row
+Block = Tuple[str, str]
+
+
+class Node:
+    """Minimal DOM element produced by the static HTML parser"""
+
+    def __init__(self, tag: str, attrs: Dict[str, str], parent: Optional["Node"] = None):
+        self.tag = tag
+        self.attrs = attrs
+        self.parent = parent
+        self.children: List[Union["Node", str]] = []
+
+    @property
+    def id(self) -> str:
+        return self.attrs.get('id', '') or ''
+
+    @property
+    def classes(self) -> List[str]:
+        return (self.attrs.get('class', '') or '').split()
+
+    def iter(self) -> Iterator["Node"]:
+        """Iterate over this element and its descendants in document order"""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(child for child in reversed(node.children) if isinstance(child, Node))
+
+    def remove(self) -> None:
+        if self.parent is not None:
+            self.parent.children = [c for c in self.parent.children if c is not self]
+            self.parent = None
+
+
+class _TreeBuilder(HTMLParser):
+    """Builds a Node tree, tolerating the unbalanced markup real pages contain"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = Node('#document', {})
+        self.stack = [self.root]
+
+    def handle_starttag(self, tag, attrs):
+        if tag in BLOCK_ELEMENTS:
+            # Block-level elements implicitly close an open paragraph
+            for i in range(len(self.stack) - 1, 0, -1):
+                open_tag = self.stack[i].tag
+                if open_tag == 'p':
+                    del self.stack[i:]
+                    break
+                if open_tag in ('td', 'th', 'table', 'button'):
+                    break
+        closes = IMPLICIT_CLOSE.get(tag)
+        if closes:
+            for i in range(len(self.stack) - 1, 0, -1):
+                open_tag = self.stack[i].tag
+                if open_tag in closes:
+                    del self.stack[i:]
+                    break
+                if open_tag in ('ul', 'ol', 'dl', 'table', 'div', 'select'):
+                    break
+        node = Node(tag, {k: v or '' for k, v in attrs}, self.stack[-1])
+        self.stack[-1].children.append(node)
+        if tag not in VOID_ELEMENTS:
+            self.stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        node = Node(tag, {k: v or '' for k, v in attrs}, self.stack[-1])
+        self.stack[-1].children.append(node)
+
+    def handle_endtag(self, tag):
+        for i in range(len(self.stack) - 1, 0, -1):
+            if self.stack[i].tag == tag:
+                del self.stack[i:]
+                return
+
+    def handle_data(self, data):
+        self.stack[-1].children.append(data)
+
+
+_SIMPLE_SELECTOR = re.compile(
+    r'^(?P<tag>[a-zA-Z][a-zA-Z0-9-]*|\*)?'
+    r'(?P<rest>(?:[.#][\w-]+)*)'
+    r'(?:\[(?P<attr>[\w-]+)(?:=["\']?(?P<value>[^"\'\]]*)["\']?)?\])?$'
+)
+
+
+class Selector:
+    """
+    Matcher for the simple CSS selectors used in `content_selectors`:
+    tag, .class, #id, [attr] and [attr="value"], optionally combined
+    """
+
+    def __init__(self, selector: str):
+        match = _SIMPLE_SELECTOR.match(selector.strip())
+        if not match:
+            raise ValueError(f"Unsupported selector: {selector}")
+        tag = match.group('tag')
+        self.tag = tag.lower() if tag and tag != '*' else None
+        rest = match.group('rest') or ''
+        self.ids = re.findall(r'#([\w-]+)', rest)
+        self.classes = re.findall(r'\.([\w-]+)', rest)
+        self.attr = match.group('attr')
+        self.value = match.group('value')
+
+    def matches(self, node: Node) -> bool:
+        if self.tag and node.tag != self.tag:
+            return False
+        if any(node.id != i for i in self.ids):
+            return False
+        if self.classes and not set(self.classes).issubset(node.classes):
+            return False
+        if self.attr:
+            if self.attr not in node.attrs:
+                return False
+            if self.value is not None and node.attrs[self.attr] != self.value:
+                return False
+        return True
+
+
+def parse_html(html: str) -> Node:
+    """Parse an HTML document into a Node tree"""
+    builder = _TreeBuilder()
+    builder.feed(html)
+    builder.close()
+    return builder.root
+
+
+def query_selector_all(root: Node, selector: str) -> List[Node]:
+    """Return all descendants of `root` matching `selector` in document order"""
+    matcher = Selector(selector)
+    return [node for node in root.iter() if node is not root and matcher.matches(node)]
+
+
+class StaticPage:
+    """Content, title and links extracted from server-rendered HTML"""
+
+    def __init__(self, content: str, title: str, links: List[str], main_selector: Optional[str],
+                 etag: Optional[str] = None, last_modified: Optional[str] = None,
+                 not_modified: bool = False):
+        self.content = content
+        self.title = title
+        self.links = links
+        self.main_selector = main_selector
+        self.etag = etag
+        self.last_modified = last_modified
+        self.not_modified = not_modified
+
+
+def _is_hidden(node: Node) -> bool:
+    if node.tag in HIDDEN_ELEMENTS or 'hidden' in node.attrs:
+        return True
+    return 'display:none' in node.attrs.get('style', '').replace(' ', '').lower()
+
+
+def _text(node: Node, preserve_whitespace: bool = False) -> str:
+    """Rendered text of an inline context; line breaks are kept only in <pre>"""
+    parts: List[str] = []
+
+    def walk(current: Node) -> None:
+        for child in current.children:
+            if isinstance(child, str):
+                parts.append(child)
+            elif child.tag == 'br':
+                parts.append('\n' if preserve_whitespace else ' ')
+            elif not _is_hidden(child):
+                walk(child)
+
+    walk(node)
+    text = ''.join(parts)
+    return text.strip('\n').rstrip() if preserve_whitespace else re.sub(r'\s+', ' ', text).strip()
+
+
+class _BlockWriter:
+    """
+    Document-order walk of a content element into markdown blocks.
+    `browser_extractor.EXTRACT_SCRIPT` implements the same walk in the page,
+    so both fetch paths produce the same content for the same HTML.
+    """
+
+    def __init__(self):
+        self.blocks: List[Block] = []
+        self.buffer: List[str] = []
+        self.list_depth = 0
+        self.item_marker: Optional[str] = None
+
+    def flush(self) -> None:
+        lines = (re.sub(r'\s+', ' ', line).strip() for line in ''.join(self.buffer).split('\n'))
+        text = '\n'.join(line for line in lines if line)
+        self.buffer = []
+        if not text:
+            return
+        if self.item_marker is not None:
+            self.blocks.append(('item', self.item_marker + text))
+            self.item_marker = None
+        elif self.list_depth:
+            # A later paragraph of the same list item
+            self.blocks.append(('item', '  ' * self.list_depth + text))
+        else:
+            self.blocks.append(('paragraph', text))
+
+    def walk(self, node: Node) -> None:
+        for child in node.children:
+            if isinstance(child, str):
+                # Source line breaks are whitespace; only <br> starts a new line
+                self.buffer.append(re.sub(r'\s+', ' ', child))
+            elif _is_hidden(child):
+                continue
+            elif child.tag == 'br':
+                self.buffer.append('\n')
+            elif child.tag in HEADINGS:
+                self.flush()
+                text = _text(child)
+                if text:
+                    self.blocks.append(('heading', f"{'#' * int(child.tag[1])} {text}"))
+            elif child.tag == 'pre':
+                self.flush()
+                text = _text(child, preserve_whitespace=True)
+                if text.strip():
+                    self.blocks.append(('code', text))
+            elif child.tag == 'table':
+                self.flush()
+                for row in child.iter():
+                    if row.tag == 'tr' and not _is_hidden(row):
+                        cells = [_text(cell) if not _is_hidden(cell) else ''
+                                 for cell in row.children if isinstance(cell, Node) and cell.tag in CELLS]
+                        if any(cells):
+                            self.blocks.append(('row', '| ' + ' | '.join(cells) + ' |'))
+            elif child.tag in LISTS:
+                self.flush()
+                self.list_depth += 1
+                self.walk(child)
+                self.list_depth -= 1
+            elif child.tag == 'li':
+                self.flush()
+                self.item_marker = '  ' * max(0, self.list_depth - 1) + '- '
+                self.walk(child)
+                self.flush()
+                self.item_marker = None
+            elif child.tag in BLOCK_ELEMENTS:
+                self.flush()
+                self.walk(child)
+                self.flush()
+            else:
+                self.walk(child)
+
+
+def content_blocks(node: Node) -> List[Block]:
+    """Markdown blocks of an element's content, in document order"""
+    writer = _BlockWriter()
+    writer.walk(node)
+    writer.flush()
+    return writer.blocks
+
+
+def render_blocks(blocks: List[Block]) -> str:
+    """
+    Join blocks into markdown: consecutive list items and table rows on
+    adjacent lines, everything else separated by a blank line
+    """
+    parts = []
+    previous = None
+    for kind, text in blocks:
+        if previous is not None:
+            parts.append('\n' if kind == previous and kind in ('item', 'row') else '\n\n')
+        if kind == 'code':
+            text = f"```\n{text}\n```"
+        parts.append(text)
+        previous = kind
+    return ''.join(parts)
+
+
+def extract_static_content(html: str, url: str, content_selectors: Dict[str, List[str]]) -> StaticPage:
+    """
+    Extract markdown content from static HTML in document order, producing
+    the same output as the in-page extractor does in the browser
+    """
+    root = parse_html(html)
+
+    # Find the main content area, falling back to the body
+    main_content = None
+    main_selector = None
+    for selector in content_selectors['main_content']:
+        found = query_selector_all(root, selector)
+        if found:
+            main_content, main_selector = found[0], selector
+            break
+    if main_content is None:
+        body = query_selector_all(root, 'body')
+        main_content = body[0] if body else root
+
+    # Title has to be read before <head> contents could be excluded
+    titles = query_selector_all(root, 'title')
+    title = _text(titles[0]) if titles else ''
+
+    # Remove excluded elements from the whole document
+    for selector in content_selectors['exclude']:
+        for node in query_selector_all(root, selector):
+            node.remove()
+
+    content = render_blocks(content_blocks(main_content))
+
+    # Resolve links the way the browser's `link.href` does
+    base_url = url
+    bases = query_selector_all(root, 'base')
+    if bases and bases[0].attrs.get('href'):
+        base_url = urljoin(url, bases[0].attrs['href'])
+    links = []
+    for node in query_selector_all(root, 'a[href]'):
+        href = node.attrs['href'].strip()
+        if href:
+            links.append(urljoin(base_url, href))
+
+    return StaticPage(content, title, links, main_selector)
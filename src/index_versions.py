@@ -0,0 +1,190 @@
+"""
+Versioned index directories with an atomically published CURRENT pointer.
+
+Each build of a collection goes to its own directory under
+`<index_path>/versions/` and becomes visible only once it is complete, when
+the name of its directory replaces the one in `<index_path>/CURRENT`. A
+server keeps reading the version it loaded until it swaps to the new one, so
+a build never changes files a running server has open. A replaced version is
+only deleted once it has been retired for a grace period, so servers still
+searching it have time to swap to the new one first.
+
+    faiss_index/analytics/CURRENT          -> "20261017T021502"
+    faiss_index/analytics/versions/20261017T021502/index.faiss
+    faiss_index/analytics/BUILDING         -> the version an unfinished build writes to
+    faiss_index/analytics/versions/20261016T021502/RETIRED -> when a newer version replaced it
+
+Index directories from before versioning, with the files directly under
+`index_path`, are served as they are and become the base of the first build.
+"""
+import os
+import shutil
+import sqlite3
+import time
+from typing import List, Optional, Tuple
+
+from ann_index import FLAT_INDEX_FILENAME
+from docstore import DOCSTORE_FILENAME, PICKLE_FILENAME
+
+CURRENT_FILENAME = "CURRENT"
+BUILDING_FILENAME = "BUILDING"
+RETIRED_FILENAME = "RETIRED"
+VERSIONS_DIRNAME = "versions"
+
+# Served from the index directory itself, before versioning
+UNVERSIONED = "unversioned"
+
+
+def _read_pointer(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _write_pointer(path: str, version: str) -> None:
+    """Replace the pointer atomically, so readers see the old or the new version, never neither"""
+    with open(path + ".tmp", 'w') as f:
+        f.write(version + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def _has_index(path: str) -> bool:
+    return any(os.path.exists(os.path.join(path, name)) for name in (FLAT_INDEX_FILENAME, PICKLE_FILENAME))
+
+
+def version_path(root: str, version: str) -> str:
+    return root if version == UNVERSIONED else os.path.join(root, VERSIONS_DIRNAME, version)
+
+
+def current_version(root: str) -> Optional[str]:
+    """The published version of the index at `root`, or None if there is none"""
+    version = _read_pointer(os.path.join(root, CURRENT_FILENAME))
+    if version is not None and _has_index(version_path(root, version)):
+        return version
+    if _has_index(root):
+        return UNVERSIONED
+    return None
+
+
+def current_index(root: str) -> Tuple[Optional[str], Optional[str]]:
+    """Directory and version of the published index at `root`"""
+    version = current_version(root)
+    return (version_path(root, version), version) if version is not None else (None, None)
+
+
+def building_version(root: str) -> Optional[str]:
+    """The version an unfinished build at `root` was writing to, if it is still there"""
+    version = _read_pointer(os.path.join(root, BUILDING_FILENAME))
+    return version if version is not None and os.path.isdir(version_path(root, version)) else None
+
+
+def _new_version_name(root: str) -> str:
+    base = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+    name, n = base, 1
+    while os.path.exists(os.path.join(root, VERSIONS_DIRNAME, name)):
+        n += 1
+        name = f"{base}-{n}"
+    return name
+
+
+def _copy_index(source: str, target: str) -> None:
+    """
+    Seed a new version with the files of the current one. Files that builds
+    only ever replace are hard-linked; the docstore, which is updated in
+    place, is copied through SQLite's backup API.
+    """
+    for name in os.listdir(source):
+        source_file = os.path.join(source, name)
+        if not os.path.isfile(source_file) or name in (CURRENT_FILENAME, BUILDING_FILENAME, RETIRED_FILENAME):
+            continue
+        if name.startswith(DOCSTORE_FILENAME) or name.endswith(".tmp"):
+            continue
+        try:
+            os.link(source_file, os.path.join(target, name))
+        except OSError:
+            shutil.copy2(source_file, os.path.join(target, name))
+    docstore = os.path.join(source, DOCSTORE_FILENAME)
+    if os.path.exists(docstore):
+        with sqlite3.connect(docstore) as src, sqlite3.connect(os.path.join(target, DOCSTORE_FILENAME)) as dst:
+            src.backup(dst)
+
+
+def begin_build(root: str, seed: bool, resume: bool) -> Tuple[str, str]:
+    """
+    Directory and version a build writes to. A resumed build continues in the
+    version it started; otherwise a new version is created, seeded with the
+    published index when `seed` is set, for an incremental update.
+    """
+    building = building_version(root)
+    if building is not None:
+        path = version_path(root, building)
+        if resume:
+            return path, building
+        if building != current_version(root):
+            shutil.rmtree(path, ignore_errors=True)
+
+    version = _new_version_name(root)
+    path = version_path(root, version)
+    os.makedirs(path)
+    source, _ = current_index(root)
+    if seed and source is not None:
+        _copy_index(source, path)
+    _write_pointer(os.path.join(root, BUILDING_FILENAME), version)
+    return path, version
+
+
+def _retired_at(root: str, version: str) -> Optional[float]:
+    """When a newer version replaced `version`, or None if it never was current"""
+    value = _read_pointer(os.path.join(version_path(root, version), RETIRED_FILENAME))
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def publish(root: str, version: str, keep: int = 3, grace_seconds: float = 600) -> None:
+    """
+    Make a finished build the current version, then drop all but the `keep`
+    newest. Versions that were current less than `grace_seconds` ago are
+    kept too: servers may still be searching them until they reload.
+    """
+    previous = current_version(root)
+    if previous not in (None, UNVERSIONED, version):
+        _write_pointer(os.path.join(version_path(root, previous), RETIRED_FILENAME), str(time.time()))
+    _write_pointer(os.path.join(root, CURRENT_FILENAME), version)
+    try:
+        os.remove(os.path.join(root, BUILDING_FILENAME))
+    except FileNotFoundError:
+        pass
+    try:
+        os.remove(os.path.join(version_path(root, version), RETIRED_FILENAME))
+    except FileNotFoundError:
+        pass
+    now = time.time()
+    for old in versions(root)[:-max(1, keep)]:
+        if old == version:
+            continue
+        retired_at = _retired_at(root, old)
+        if retired_at is not None and now - retired_at < grace_seconds:
+            continue
+        # A server still on an old version keeps reading its open files
+        shutil.rmtree(version_path(root, old), ignore_errors=True)
+
+
+def _version_order(name: str) -> Tuple[str, int]:
+    """Sort key of a version name: its timestamp, then its same-second suffix as a number"""
+    base, _, suffix = name.partition("-")
+    return base, int(suffix) if suffix.isdigit() else 1
+
+
+def versions(root: str) -> List[str]:
+    """Built versions at `root`, oldest first"""
+    directory = os.path.join(root, VERSIONS_DIRNAME)
+    if not os.path.isdir(directory):
+        return []
+    building = _read_pointer(os.path.join(root, BUILDING_FILENAME))
+    return sorted((name for name in os.listdir(directory) if name != building), key=_version_order)
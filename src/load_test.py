@@ -0,0 +1,174 @@
+"""
+Load test for the /ask endpoint against a stub LLM.
+
+Builds a small synthetic index with deterministic fake embeddings, serves the
+API in-process with a latency-simulating fake LLM, and measures throughput and
+latency at increasing client concurrency. Nothing leaves the machine.
+
+    python src/load_test.py --latency 0.5 --concurrency 1 2 4 8 16 32
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List
+
+import uvicorn
+from langchain.docstore.document import Document
+
+sys.path.append(str(Path(__file__).parent))
+
+import api
+from concurrency import LLMGate
+from doc_indexer import DocumentationIndexer
+from docstore import new_vectorstore, save_vectorstore
+from fakes import FakeChatModel, HashEmbeddings
+from shards import DEFAULT_COLLECTION, Collection
+
+TOPICS = ["segments", "calculated metrics", "eVars", "props", "processing rules",
+          "classifications", "data feeds", "report suites", "virtual report suites", "alerts"]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def build_indexer(index_path: str, llm_latency: float, chunks: int = 500) -> DocumentationIndexer:
+    """Create an indexer over a synthetic index, wired to fake embeddings and LLM"""
+    config_path = os.path.join(Path(__file__).parent.absolute(), "config.yaml")
+    indexer = DocumentationIndexer(config_path=config_path, embeddings=HashEmbeddings(),
+                                   llm=FakeChatModel(latency=llm_latency))
+    indexer.embeddings.cache = None
+    indexer.config['vector_store']['index_path'] = index_path
+    indexer.collections = {DEFAULT_COLLECTION: Collection(DEFAULT_COLLECTION, [], {}, index_path)}
+    docs = [
+        Document(
+            page_content=f"How to work with {TOPICS[i % len(TOPICS)]} in Adobe Analytics, part {i}. " * 8,
+            metadata={"source": f"https://docs.example.com/{i}", "title": f"Doc {i}"}
+        )
+        for i in range(chunks)
+    ]
+    vectorstore = new_vectorstore(index_path, indexer.embeddings, len(indexer.embeddings.embed_query("dimension")))
+    vectorstore.add_documents(docs)
+    save_vectorstore(vectorstore, index_path)
+    indexer.vectorstore = vectorstore
+    indexer._build_lexical_index(index_path)
+    indexer.load_index()
+    indexer.setup_qa_chain()
+    return indexer
+
+
+def start_server(port: int) -> uvicorn.Server:
+    """Serve the API in a background thread"""
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError(f"API server failed to start on port {port}")
+        time.sleep(0.05)
+    return server
+
+
+def ask(port: int, question: str) -> Dict:
+    """POST one question and time it"""
+    body = json.dumps({"question": question, "conversation_history": []}).encode('utf-8')
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/ask", data=body,
+                                     headers={"Content-Type": "application/json"})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return {"status": status, "latency": time.perf_counter() - started}
+
+
+def run_level(port: int, concurrency: int, requests: int, same_question: bool = False) -> Dict:
+    """Send `requests` questions with `concurrency` concurrent clients"""
+    questions = [
+        "How do I create a segment?" if same_question
+        else f"How do I configure {TOPICS[i % len(TOPICS)]}? (request {concurrency}-{i})"
+        for i in range(requests)
+    ]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda q: ask(port, q), questions))
+    elapsed = time.perf_counter() - started
+
+    latencies = [r["latency"] for r in results if r["status"] == 200]
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": len(latencies),
+        "rejected_429": sum(1 for r in results if r["status"] == 429),
+        "errors": sum(1 for r in results if r["status"] not in (200, 429)),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /ask against a stub LLM")
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated LLM latency in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--requests-per-client", type=int, default=4)
+    parser.add_argument("--max-in-flight", type=int, default=16, help="Cap on concurrent LLM calls")
+    parser.add_argument("--port", type=int, default=8802)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        indexer = build_indexer(os.path.join(tmp, "faiss_index"), args.latency)
+        # Unique questions and no answer cache, so every request reaches the LLM
+        indexer.answer_cache = None
+        api.indexer = indexer
+        api.llm_gate = LLMGate(max_in_flight=args.max_in_flight, max_queued=10000, queue_timeout=600)
+        server = start_server(args.port)
+
+        try:
+            levels = []
+            for concurrency in args.concurrency:
+                result = run_level(args.port, concurrency, concurrency * args.requests_per_client)
+                levels.append(result)
+                print(f"concurrency={concurrency:3d}  {result['throughput_rps']:7.2f} req/s  "
+                      f"p50={result['p50_ms']}ms p95={result['p95_ms']}ms", file=sys.stderr)
+
+            # Identical concurrent questions should collapse into one LLM call each wave
+            calls_before = indexer.llm.calls
+            coalescing = run_level(args.port, 16, 16, same_question=True)
+            coalescing["llm_calls"] = indexer.llm.calls - calls_before
+        finally:
+            server.should_exit = True
+
+    report = {
+        "llm_latency_s": args.latency,
+        "max_in_flight_llm_calls": args.max_in_flight,
+        "levels": levels,
+        "coalescing": coalescing,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import time
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+from langchain.docstore.document import Document
+
+MANIFEST_FILENAME = "manifest.json"
+
+
+def content_hash(content: str) -> str:
+    """Stable hash of a page's extracted content"""
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def chunk_id(url: str, index: int) -> str:
+    """Deterministic vector store ID of the `index`-th chunk of a page"""
+    return f"{hashlib.sha1(url.encode('utf-8')).hexdigest()[:16]}-{index}"
+
+
+class PageManifest:
+    """
+    Persistent record of every indexed page: HTTP validators (ETag and
+    Last-Modified), sitemap `<lastmod>`, content hash, outgoing links and
+    the IDs of the chunks the page contributed to the vector store
+    """
+
+    def __init__(self, path: str, pages: Optional[Dict[str, dict]] = None):
+        self.path = path
+        self.pages: Dict[str, dict] = pages or {}
+
+    @classmethod
+    def load(cls, path: str) -> "PageManifest":
+        """Load a manifest, returning an empty one if none exists yet"""
+        if not os.path.exists(path):
+            return cls(path)
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+            return cls(path, data.get('pages', {}))
+        except Exception as e:
+            print(f"⚠️ Could not read manifest at {path}, starting a new one: {e}")
+            return cls(path)
+
+    def save(self) -> None:
+        """Write the manifest atomically so a crash never leaves it half-written"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': 1, 'pages': self.pages}, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, url: str) -> Optional[dict]:
+        return self.pages.get(url)
+
+    def set(self, url: str, entry: dict) -> None:
+        self.pages[url] = entry
+
+    def remove(self, url: str) -> Optional[dict]:
+        return self.pages.pop(url, None)
+
+    def urls(self) -> Set[str]:
+        return set(self.pages)
+
+    def __len__(self) -> int:
+        return len(self.pages)
+
+
+# Receives each new or changed page: (url, manifest entry, document or None)
+PageSink = Callable[[str, dict, Optional[Document]], Awaitable[None]]
+
+
+class CrawlResult:
+    """
+    Pages collected by one crawl run, classified against the manifest as
+    new/changed (handed to `sink` for re-embedding) or unchanged (skipped).
+    With a `state`, every page is also recorded there so a resumed crawl
+    does not have to fetch it again. `lastmod` holds the sitemap `<lastmod>`
+    of the pages discovered from sitemaps, stored with each page seen.
+    """
+
+    def __init__(self, manifest: PageManifest, sink: PageSink, state=None,
+                 lastmod: Optional[Dict[str, Optional[str]]] = None):
+        self.manifest = manifest
+        self.sink = sink
+        self.state = state
+        self.lastmod = lastmod or {}
+        self.changed: Dict[str, dict] = {}
+        self.unchanged: Set[str] = set()
+
+    async def restore(self) -> int:
+        """
+        Take over the pages a resumed crawl extracted before it stopped.
+        Pages whose content is not in the index yet go to `sink` again.
+        Returns how many were re-sent.
+        """
+        resent = 0
+        for url, changed, entry, content in self.state.pages():
+            if not changed:
+                self.unchanged.add(url)
+                continue
+            self.changed[url] = entry
+            indexed = self.manifest.get(url)
+            if indexed is not None and indexed.get('content_hash') == entry['content_hash']:
+                continue
+            document = None
+            if content:
+                document = Document(page_content=content, metadata={"source": url, "title": entry['title'] or url})
+            await self.sink(url, entry, document)
+            resent += 1
+        return resent
+
+    @property
+    def seen(self) -> Set[str]:
+        return set(self.changed) | self.unchanged
+
+    async def add_page(self, url: str, content: str, title: str, links: List[str],
+                       etag: Optional[str] = None, last_modified: Optional[str] = None) -> bool:
+        """
+        Record an extracted page. Returns True if the page is new or changed
+        and its content has to be (re-)embedded.
+        """
+        digest = content_hash(content) if content else None
+        entry = {
+            'title': title,
+            'content_hash': digest,
+            'etag': etag,
+            'last_modified': last_modified,
+            'lastmod': self.lastmod.get(url),
+            'links': links,
+            'indexed_at': time.time(),
+        }
+        previous = self.manifest.get(url)
+        if previous is not None and previous.get('content_hash') == digest:
+            # Same content; only refresh validators and links
+            previous.update({k: entry[k] for k in ('etag', 'last_modified', 'links', 'title')})
+            self.mark_unchanged(url)
+            return False
+
+        self.changed[url] = entry
+        if self.state is not None:
+            self.state.record_page(url, entry, content)
+        document = None
+        if content:
+            document = Document(
+                page_content=content,
+                metadata={"source": url, "title": title or url}
+            )
+        await self.sink(url, entry, document)
+        return True
+
+    def mark_unchanged(self, url: str) -> None:
+        """
+        Record a page the server or its sitemap reported as not modified, or
+        with unchanged content
+        """
+        self.unchanged.add(url)
+        previous = self.manifest.get(url)
+        if previous is not None and url in self.lastmod:
+            previous['lastmod'] = self.lastmod[url]
+        if self.state is not None:
+            self.state.record_unchanged(url)
+
+    def removed_urls(self, failed: Iterable[str] = ()) -> Set[str]:
+        """Previously indexed pages that were not seen in this crawl"""
+        return self.manifest.urls() - self.seen - set(failed)
@@ -0,0 +1,243 @@
+"""
+Minimal in-process metrics: counters, gauges and histograms with labels,
+rendered in the Prometheus text exposition format for the /metrics endpoint.
+"""
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def set_function(self, function: Callable[[], float], **labels) -> None:
+        """Read the value from `function` at scrape time, for values owned elsewhere"""
+        self._functions[self._key(labels)] = function
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for suffix, labels, value in self._samples():
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        for key, function in list(self._functions.items()):
+            try:
+                value = function()
+            except Exception:
+                continue
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        # Without labels there is exactly one series, reported from zero
+        self._values: Dict[LabelValues, float] = {} if self.labelnames else {(): 0.0}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self):
+        with self._lock:
+            return [("", _format_labels(self.labelnames, key), value) for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        """Count the block as in progress while it runs"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label set: count per bucket (made cumulative when rendered), sum and count
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self):
+        samples = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    le = f'le="{_format_value(bound)}"'
+                    samples.append(("_bucket", _format_labels(self.labelnames, key, le), cumulative))
+                samples.append(("_sum", _format_labels(self.labelnames, key), total))
+                samples.append(("_count", _format_labels(self.labelnames, key), count))
+        return samples
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "docindexer_stage_seconds", "Time spent in each indexing and question answering stage", ["stage"])
+PAGES_CRAWLED = REGISTRY.counter("docindexer_pages_crawled_total", "Pages crawled successfully")
+PAGES_FAILED = REGISTRY.counter("docindexer_pages_failed_total", "Pages that failed to crawl")
+BROWSER_BYTES = REGISTRY.counter("docindexer_browser_bytes_total", "Bytes transferred by browser page loads")
+BROWSER_REQUESTS_BLOCKED = REGISTRY.counter(
+    "docindexer_browser_requests_blocked_total", "Browser requests aborted by the resource blocking rules")
+CHUNKS_EMBEDDED = REGISTRY.counter("docindexer_chunks_embedded_total", "Chunks embedded and added to the index")
+LLM_TOKENS = REGISTRY.counter(
+    "docindexer_llm_tokens_total", "Tokens sent to and generated by the LLM, by kind", ["kind"])
+CACHE_REQUESTS = REGISTRY.counter(
+    "docindexer_cache_requests_total", "Cache lookups by cache and result", ["cache", "result"])
+IN_FLIGHT = REGISTRY.gauge("docindexer_in_flight", "Operations currently in progress, by kind", ["kind"])
+REQUEST_SECONDS = REGISTRY.histogram(
+    "docindexer_http_request_seconds", "API request latency by endpoint", ["endpoint"])
+REQUESTS = REGISTRY.counter("docindexer_http_requests_total", "API requests by endpoint and status", ["endpoint", "status"])
+
+
+@contextmanager
+def span(stage: str):
+    """Time a stage into the stage histogram"""
+    with STAGE_SECONDS.time(stage=stage):
+        yield
+
+
+class StageTimings:
+    """
+    Total seconds and item counts per stage for one run, safe to update from
+    worker threads. Every timing is also observed in the stage histogram.
+    """
+
+    def __init__(self):
+        self._seconds: Dict[str, float] = {}
+        self._counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float, count: int = 1) -> None:
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        with self._lock:
+            self._seconds[stage] = self._seconds.get(stage, 0.0) + seconds
+            self._counts[stage] = self._counts.get(stage, 0) + count
+
+    @contextmanager
+    def time(self, stage: str, count: int = 1):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started, count)
+
+    def as_dict(self) -> Dict[str, dict]:
+        with self._lock:
+            return {stage: {"seconds": round(seconds, 4), "count": self._counts[stage]}
+                    for stage, seconds in self._seconds.items()}
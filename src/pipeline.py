@@ -0,0 +1,344 @@
+import asyncio
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from langchain.docstore.document import Document
+
+from dedup import Deduplicator
+from docstore import new_vectorstore, save_vectorstore
+from manifest import PageManifest, chunk_id
+from metrics import CHUNKS_EMBEDDED, StageTimings
+
+# Marks the end of the page stream
+_END = object()
+
+
+class IndexingPipeline:
+    """
+    Streaming split → embed → index stage fed by the crawler.
+
+    Pages arrive on a bounded queue, so the crawl slows down instead of
+    buffering when embedding falls behind. Each page is split as it arrives,
+    chunks are embedded in rolling batches while the crawl continues, and the
+    vectors are added to the index right away. The index and the manifest are
+    checkpointed together, so an interrupted run leaves a usable partial index
+    that the next incremental run picks up from.
+
+    With a `dedup`, a page that nearly duplicates a page already kept is not
+    split, and a chunk that nearly duplicates an indexed chunk is not
+    embedded. The duplicate's URL is added to the `duplicate_sources` of the
+    chunks it matched, and its manifest entry lists them in
+    `duplicate_chunk_ids`, so it can be taken out again when it changes. When
+    matched chunks are deleted, their duplicate pages lose their content hash
+    and are indexed on their own the next time they are crawled.
+    """
+
+    def __init__(self,
+                 indexer,
+                 manifest: PageManifest,
+                 text_splitter,
+                 index_path: str,
+                 batch_size: int = 256,
+                 queue_size: int = 64,
+                 checkpoint_every: int = 200,
+                 checkpoint_interval: float = 60.0,
+                 timings: Optional[StageTimings] = None,
+                 dedup: Optional[Deduplicator] = None,
+                 max_duplicate_sources: int = 20):
+        self.indexer = indexer
+        self.manifest = manifest
+        self.text_splitter = text_splitter
+        self.index_path = index_path
+        self.batch_size = max(1, batch_size)
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max(1, queue_size))
+        self._writer: Optional[asyncio.Task] = None
+        self.timings = timings or StageTimings()
+        self.dedup = dedup
+        self.max_duplicate_sources = max_duplicate_sources
+
+        # Whole pages waiting to be embedded: (url, manifest entry, chunks)
+        self._pending: List[Tuple[str, dict, List[Document]]] = []
+        self._pending_chunks = 0
+        # Duplicate URLs to take out of the sources of indexed chunks: (chunk ID, url),
+        # and to add to them: (chunk ID, url, version of the chunk that was matched)
+        self._released_sources: List[Tuple[str, str]] = []
+        self._duplicate_sources: List[Tuple[str, str, int]] = []
+        # Bumped whenever a chunk ID is released, since a changed page reuses its chunk IDs
+        self._chunk_versions: Dict[str, int] = {}
+        # Duplicate pages whose matched chunks were deleted
+        self._orphaned: Set[str] = set()
+        self._pages_since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+
+        self.pages_indexed = 0
+        self.chunks_added = 0
+        self.chunks_removed = 0
+        self.chunks_deduplicated = 0
+        self.pages_orphaned = 0
+
+    def start(self) -> None:
+        self._writer = asyncio.create_task(self._run())
+
+    async def put(self, url: str, entry: dict, document: Optional[Document]) -> None:
+        """
+        Hand a new or changed page to the pipeline. `document` is None for
+        pages that no longer have any content.
+        """
+        if self._writer.done():
+            # Surface writer failures to the crawler instead of blocking forever
+            self._writer.result()
+            raise RuntimeError("Indexing pipeline has stopped")
+        await self._queue.put((url, entry, document))
+
+    async def _run(self) -> None:
+        while True:
+            item = await self._queue.get()
+            if item is _END:
+                break
+            url, entry, document = item
+            if self.dedup is None:
+                with self.timings.time("split"):
+                    chunks = self.text_splitter.split_documents([document]) if document else []
+                entry['chunk_ids'] = [chunk_id(url, i) for i in range(len(chunks))]
+            else:
+                self._release(url, self.manifest.get(url))
+                chunks = self._split_unique(url, entry, document)
+            self._pending.append((url, entry, chunks))
+            self._pending_chunks += len(chunks)
+            if self._pending_chunks >= self.batch_size:
+                await self._flush()
+            await self._maybe_checkpoint()
+        await self._flush()
+
+    def _split_unique(self, url: str, entry: dict, document: Optional[Document]) -> List[Document]:
+        """
+        Split a page into the chunks that are not near-duplicates of a kept
+        page or an indexed chunk, recording what the rest duplicate
+        """
+        dedup = self.dedup
+        entry['chunk_ids'] = []
+        entry['duplicate_chunk_ids'] = []
+        if document is None:
+            return []
+        with self.timings.time("dedup"):
+            fingerprint, near = dedup.fingerprint(document.page_content)
+            canonical = dedup.pages.find(fingerprint, exact=not near, exclude=url)
+        entry['simhash'] = f"{fingerprint:016x}"
+        if canonical is not None:
+            canonical_entry = self._entry(canonical)
+            targets = canonical_entry.get('chunk_ids', []) if canonical_entry else []
+            if targets:
+                entry['duplicate_of'] = canonical
+                entry['duplicate_chunk_ids'] = list(targets)
+                self._duplicate_sources.extend(
+                    (target, url, self._chunk_versions.get(target, 0)) for target in targets)
+                dedup.pages_deduplicated += 1
+                dedup.chars_deduplicated += len(document.page_content)
+                self.chunks_deduplicated += len(targets)
+                return []
+        dedup.pages.add(url, fingerprint)
+
+        with self.timings.time("split"):
+            chunks = self.text_splitter.split_documents([document])
+        started = time.perf_counter()
+        unique = []
+        for i, chunk in enumerate(chunks):
+            fingerprint, near = dedup.fingerprint(chunk.page_content)
+            target = dedup.chunks.find(fingerprint, exact=not near)
+            if target is not None:
+                entry['duplicate_chunk_ids'].append(target)
+                self._duplicate_sources.append((target, url, self._chunk_versions.get(target, 0)))
+                dedup.chunks_deduplicated += 1
+                dedup.chars_deduplicated += len(chunk.page_content)
+                self.chunks_deduplicated += 1
+                continue
+            chunk_key = chunk_id(url, i)
+            chunk.metadata['simhash'] = f"{fingerprint:016x}"
+            dedup.chunks.add(chunk_key, fingerprint)
+            entry['chunk_ids'].append(chunk_key)
+            unique.append(chunk)
+        self.timings.add("dedup", time.perf_counter() - started, len(chunks))
+        return unique
+
+    def _entry(self, url: str) -> Optional[dict]:
+        """Manifest entry of a page, including pages not flushed yet"""
+        for pending_url, entry, _ in reversed(self._pending):
+            if pending_url == url:
+                return entry
+        return self.manifest.get(url)
+
+    def _release(self, url: str, previous: Optional[dict]) -> None:
+        """Forget a page's previous fingerprints and duplicate links before it is replaced"""
+        if previous is None:
+            return
+        self.dedup.pages.remove(url)
+        for previous_id in previous.get('chunk_ids', []):
+            self.dedup.chunks.remove(previous_id)
+            self._chunk_versions[previous_id] = self._chunk_versions.get(previous_id, 0) + 1
+        self._released_sources.extend((target, url) for target in previous.get('duplicate_chunk_ids', []))
+
+    async def _flush(self) -> None:
+        """Embed the pending pages' chunks and apply them to the index"""
+        if not self._pending:
+            return
+        pending, self._pending, self._pending_chunks = self._pending, [], 0
+
+        docs = [chunk for _, _, chunks in pending for chunk in chunks]
+        ids = [i for _, entry, _ in pending for i in entry['chunk_ids']]
+        texts = [doc.page_content for doc in docs]
+        vectors = []
+        if texts:
+            # Embedding runs in a worker thread so the crawl keeps going meanwhile
+            with self.timings.time("embed", len(texts)):
+                vectors = await asyncio.get_running_loop().run_in_executor(
+                    None, self.indexer.embeddings.embed_documents, texts
+                )
+        started = time.perf_counter()
+
+        # Drop the previous chunks of these pages, and any chunks with the new IDs
+        # left behind by an interrupted run, before adding the new ones
+        stale_ids = list(ids)
+        for url, _, _ in pending:
+            previous = self.manifest.get(url)
+            if previous:
+                stale_ids.extend(previous.get('chunk_ids', []))
+        self._delete(stale_ids)
+
+        if docs:
+            text_embeddings = list(zip(texts, vectors))
+            metadatas = [doc.metadata for doc in docs]
+            if self.indexer.vectorstore is None:
+                self.indexer.vectorstore = new_vectorstore(self.index_path, self.indexer.embeddings, len(vectors[0]))
+            self.indexer.vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+        self._update_duplicate_sources()
+        self.chunks_added += len(docs)
+        CHUNKS_EMBEDDED.inc(len(docs))
+        self.timings.add("index", time.perf_counter() - started, len(docs))
+
+        for url, entry, _ in pending:
+            self.manifest.set(url, entry)
+        self._orphan()
+        self.pages_indexed += len(pending)
+        self._pages_since_checkpoint += len(pending)
+        print(f"Indexed {len(docs)} chunks from {len(pending)} pages "
+              f"({self.pages_indexed} pages, {self.chunks_added} chunks so far)")
+
+    def _update_duplicate_sources(self) -> None:
+        """Apply the queued changes to the indexed chunks' `duplicate_sources`"""
+        released, self._released_sources = self._released_sources, []
+        added, self._duplicate_sources = self._duplicate_sources, []
+        vectorstore = self.indexer.vectorstore
+        if vectorstore is None:
+            self._orphaned.update(url for _, url, _ in added)
+            return
+        changes: Dict[str, Tuple[Set[str], List[str]]] = {}
+        for target, url in released:
+            changes.setdefault(target, (set(), []))[0].add(url)
+        for target, url, version in added:
+            if version != self._chunk_versions.get(target, 0):
+                # The page owning the matched chunk changed since
+                self._orphaned.add(url)
+                continue
+            changes.setdefault(target, (set(), []))[1].append(url)
+
+        updated = {}
+        for target, (removed_urls, added_urls) in changes.items():
+            doc = vectorstore.docstore.search(target)
+            if not isinstance(doc, Document):
+                self._orphaned.update(added_urls)
+                continue
+            sources = [url for url in doc.metadata.get('duplicate_sources', []) if url not in removed_urls]
+            for url in added_urls:
+                if url != doc.metadata.get('source') and url not in sources:
+                    sources.append(url)
+            sources = sources[:self.max_duplicate_sources]
+            if sources != doc.metadata.get('duplicate_sources', []):
+                metadata = {k: v for k, v in doc.metadata.items() if k != 'duplicate_sources'}
+                if sources:
+                    metadata['duplicate_sources'] = sources
+                updated[target] = Document(page_content=doc.page_content, metadata=metadata)
+        if updated:
+            vectorstore.docstore.add(updated)
+
+    def _orphan(self) -> None:
+        """Make duplicate pages whose matched chunks are gone count as changed on the next crawl"""
+        orphaned, self._orphaned = self._orphaned, set()
+        for url in orphaned:
+            entry = self.manifest.get(url)
+            if entry is not None and entry.get('duplicate_chunk_ids'):
+                # Without validators the next crawl fetches the page in full
+                entry.update({'content_hash': None, 'etag': None, 'last_modified': None, 'lastmod': None})
+                self.pages_orphaned += 1
+
+    def _delete(self, ids: List[str]) -> None:
+        vectorstore = self.indexer.vectorstore
+        if vectorstore is None or not ids:
+            return
+        indexed_ids = set(vectorstore.index_to_docstore_id.values())
+        stale_ids = list(dict.fromkeys(i for i in ids if i in indexed_ids))
+        if stale_ids:
+            if self.dedup is not None:
+                # Pages that duplicated these chunks, and are not being replaced themselves,
+                # have to be indexed on their own again
+                released = {(target, url) for target, url in self._released_sources}
+                for stale_id in stale_ids:
+                    doc = vectorstore.docstore.search(stale_id)
+                    if isinstance(doc, Document):
+                        self._orphaned.update(url for url in doc.metadata.get('duplicate_sources', [])
+                                              if (stale_id, url) not in released)
+            vectorstore.delete(stale_ids)
+            self.chunks_removed += len(stale_ids)
+
+    async def _maybe_checkpoint(self) -> None:
+        if not self._pages_since_checkpoint:
+            return
+        if (self._pages_since_checkpoint >= self.checkpoint_every
+                or time.monotonic() - self._last_checkpoint >= self.checkpoint_interval):
+            await self.checkpoint()
+
+    async def checkpoint(self) -> None:
+        """Persist the index, then the manifest that describes it"""
+        if self.indexer.vectorstore is None:
+            return
+        with self.timings.time("checkpoint"):
+            await asyncio.get_running_loop().run_in_executor(
+                None, save_vectorstore, self.indexer.vectorstore, self.index_path
+            )
+        # Serialized on the event loop so the crawler can't mutate it mid-write
+        self.manifest.save()
+        self._pages_since_checkpoint = 0
+        self._last_checkpoint = time.monotonic()
+        print(f"Checkpoint saved: {self.pages_indexed} pages, {self.chunks_added} chunks")
+
+    async def finish(self, removed_urls=()) -> None:
+        """Drain the queue, remove vanished pages and write the final checkpoint"""
+        await self._queue.put(_END)
+        await self._writer
+        removed_ids = []
+        for url in removed_urls:
+            entry = self.manifest.remove(url)
+            if entry:
+                removed_ids.extend(entry.get('chunk_ids', []))
+                if self.dedup is not None:
+                    self._release(url, entry)
+        self._delete(removed_ids)
+        if self.dedup is not None:
+            self._update_duplicate_sources()
+            self._orphan()
+        if self.pages_orphaned:
+            print(f"⚠️ {self.pages_orphaned} duplicate pages lost the chunks they matched "
+                  f"and will be re-indexed on the next run")
+        await self.checkpoint()
+
+    async def abort(self) -> None:
+        """Stop after a failed crawl, keeping everything indexed so far"""
+        if self._writer.done():
+            if self._writer.cancelled() or self._writer.exception() is not None:
+                # The last checkpoint is consistent; don't persist a half-applied batch
+                return
+        else:
+            await self._queue.put(_END)
+            await self._writer
+        await self.checkpoint()
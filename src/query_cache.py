@@ -0,0 +1,198 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+
+def normalize_question(text: str) -> str:
+    """Case- and whitespace-insensitive form of a question used as a cache key"""
+    return re.sub(r'\s+', ' ', text).strip().lower()
+
+
+class QueryEmbeddingCache:
+    """
+    In-memory LRU cache of query embeddings keyed by the normalized question,
+    so repeated questions skip the embedding round trip
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, question: str, compute: Callable[[str], List[float]]) -> List[float]:
+        key = normalize_question(question)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+
+        embedding = compute(question)
+        self._store({key: embedding})
+        return embedding
+
+    def get_or_compute_many(self, questions: List[str],
+                            compute: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+        """Embeddings of many questions; the unique misses are computed in one call"""
+        keys = [normalize_question(question) for question in questions]
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    found[key] = self._entries[key]
+            self.hits += sum(1 for key in keys if key in found)
+        missing = {key: question for key, question in zip(keys, questions) if key not in found}
+        with self._lock:
+            self.misses += len(missing)
+
+        if missing:
+            computed = dict(zip(missing, compute(list(missing.values()))))
+            self._store(computed)
+            found.update(computed)
+        return [found[key] for key in keys]
+
+    def _store(self, embeddings: Dict[str, List[float]]) -> None:
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            for key, embedding in embeddings.items():
+                self._entries[key] = embedding
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+class AnswerCache:
+    """
+    Cache of answers in front of the QA chain. A question hits exactly when its
+    normalized text was answered before, and nearly when its embedding has a
+    cosine similarity above `similarity_threshold` to a cached question.
+    Entries expire after `ttl` seconds, the least recently used are evicted
+    beyond `max_size`, and everything is dropped when the index changes.
+    Answers from different collection selections are kept apart by `scope`.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl: float = 86400, similarity_threshold: float = 0.95):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.exact_hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._matrix = None
+        self._matrix_keys: List[str] = []
+        self._matrix_scopes: List[str] = []
+        self._lock = threading.Lock()
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        expired = [key for key, entry in self._entries.items() if now - entry['created_at'] > self.ttl]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._matrix = None
+
+    def _similarity_matrix(self):
+        """Normalized embeddings of all cached questions, rebuilt after changes"""
+        if self._matrix is None:
+            self._matrix_keys = [key for key, entry in self._entries.items() if entry['embedding'] is not None]
+            self._matrix_scopes = [self._entries[key]['scope'] for key in self._matrix_keys]
+            if self._matrix_keys:
+                self._matrix = np.vstack([self._entries[key]['embedding'] for key in self._matrix_keys])
+            else:
+                self._matrix = np.zeros((0, 0), dtype=np.float32)
+        return self._matrix
+
+    def _hit(self, key: str) -> dict:
+        self._entries.move_to_end(key)
+        return self._entries[key]['result']
+
+    @staticmethod
+    def _key(question: str, scope: str) -> str:
+        key = normalize_question(question)
+        return f"{scope}\x00{key}" if scope else key
+
+    def get_exact(self, question: str, scope: str = "", count_miss: bool = True) -> Optional[dict]:
+        """
+        Cached result for the same normalized question, if any. Leave
+        `count_miss` off when a `get_similar` lookup follows a miss, so the
+        question counts as one miss at most.
+        """
+        key = self._key(question, scope)
+        with self._lock:
+            self._expire()
+            if key in self._entries:
+                self.exact_hits += 1
+                return self._hit(key)
+            if count_miss:
+                self.misses += 1
+        return None
+
+    def get_similar(self, embedding: List[float], scope: str = "") -> Optional[dict]:
+        """Cached result for the most similar question above the threshold, if any"""
+        query = _normalized(embedding)
+        with self._lock:
+            self._expire()
+            matrix = self._similarity_matrix()
+            if matrix.shape[0] and matrix.shape[1] == query.shape[0]:
+                similarities = matrix @ query
+                if any(entry_scope != scope for entry_scope in self._matrix_scopes):
+                    similarities = np.where(np.array(self._matrix_scopes) == scope, similarities, -np.inf)
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.similarity_threshold:
+                    self.similar_hits += 1
+                    return self._hit(self._matrix_keys[best])
+            self.misses += 1
+        return None
+
+    def put(self, question: str, embedding: Optional[List[float]], result: dict, scope: str = "") -> None:
+        if self.max_size <= 0:
+            return
+        key = self._key(question, scope)
+        with self._lock:
+            self._entries[key] = {
+                'result': result,
+                'embedding': _normalized(embedding) if embedding is not None else None,
+                'scope': scope,
+                'created_at': time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def invalidate(self) -> None:
+        """Drop every entry, e.g. because the loaded index changed"""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "exact_hits": self.exact_hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+        }
+
+
+def _normalized(embedding: List[float]):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
@@ -0,0 +1,206 @@
+"""
+Named collections of documentation, each indexed into its own shard.
+
+A collection has its own seed URLs, URL patterns and index directory under
+`vector_store.index_path`, so it is crawled, rebuilt and refreshed without
+touching the others. At query time the selected shards are searched in
+parallel and their hits merged into one ranking.
+"""
+import os
+import threading
+import time
+from contextlib import nullcontext
+from itertools import zip_longest
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain.docstore.document import Document
+
+from bm25 import BM25Index, reciprocal_rank_fusion
+from metrics import span
+
+# Collection name used when the config has no `collections` section
+DEFAULT_COLLECTION = "default"
+
+# (collection, index position) of a chunk
+ShardHit = Tuple[str, int]
+
+
+class UnknownCollection(ValueError):
+    """A request or command named a collection that is not configured or loaded"""
+
+    def __init__(self, name: str, known: Iterable[str]):
+        super().__init__(f"Unknown collection '{name}', expected one of: {', '.join(known)}")
+        self.name = name
+
+
+class Collection:
+    """Seed URLs, URL patterns and index directory of one collection"""
+
+    def __init__(self, name: str, urls: List[str], url_patterns: Dict[str, List[str]], index_path: str):
+        self.name = name
+        self.urls = urls
+        self.url_patterns = url_patterns
+        self.index_path = index_path
+
+    def state_path(self, path: str) -> str:
+        """The crawl state file of this collection, next to the configured one"""
+        if self.name == DEFAULT_COLLECTION:
+            return path
+        root, ext = os.path.splitext(path)
+        return f"{root}.{self.name}{ext}"
+
+
+def load_collections(config: dict) -> Dict[str, Collection]:
+    """
+    Collections from the config. Each one's index lives in a subdirectory of
+    `vector_store.index_path` named after it. Top-level `url_patterns` are the
+    defaults: a collection without accepted patterns uses the top-level ones,
+    and the top-level blacklist applies to every collection.
+    Without a `collections` section, the top-level `urls` form one collection
+    indexed directly into `index_path`.
+    """
+    index_path = config['vector_store']['index_path']
+    shared = config.get('url_patterns') or {}
+    collections = config.get('collections')
+    if not collections:
+        return {DEFAULT_COLLECTION: Collection(DEFAULT_COLLECTION, config.get('urls', []), {
+            'accepted': shared.get('accepted', []),
+            'blacklisted': shared.get('blacklisted', []),
+        }, index_path)}
+
+    result = {}
+    for name, settings in collections.items():
+        if not name or os.sep in name or name.startswith('.'):
+            raise ValueError(f"Invalid collection name '{name}'")
+        settings = settings or {}
+        patterns = settings.get('url_patterns') or {}
+        result[name] = Collection(name, settings.get('urls', []), {
+            'accepted': patterns.get('accepted') or shared.get('accepted', []),
+            'blacklisted': shared.get('blacklisted', []) + patterns.get('blacklisted', []),
+        }, settings.get('index_path') or os.path.join(index_path, name))
+    return result
+
+
+class Shard:
+    """
+    The loaded index of one collection version: vectors, docstore and
+    optional BM25.
+
+    Queries hold a lease on the shards they search. A shard replaced by a
+    newer version is retired, and its docstore is closed once the last
+    lease is released, so queries in flight during a swap finish on the
+    version they started with.
+    """
+
+    def __init__(self, name: str, vectorstore, lexical_index: Optional[BM25Index] = None,
+                 version: Optional[str] = None, load_seconds: Optional[float] = None):
+        self.name = name
+        self.vectorstore = vectorstore
+        self.lexical_index = lexical_index
+        self.version = version
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self._lock = threading.Lock()
+        self._leases = 0
+        self._retired = False
+
+    def __len__(self) -> int:
+        return self.vectorstore.index.ntotal
+
+    def acquire(self) -> bool:
+        """Take a lease, unless the shard was already retired"""
+        with self._lock:
+            if self._retired:
+                return False
+            self._leases += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self._leases -= 1
+            close = self._retired and self._leases == 0
+        if close:
+            self._close()
+
+    def retire(self) -> None:
+        """Stop handing out leases, and close once the current ones are released"""
+        with self._lock:
+            if self._retired:
+                return
+            self._retired = True
+            close = self._leases == 0
+        if close:
+            self._close()
+
+    @property
+    def leases(self) -> int:
+        return self._leases
+
+    def _close(self) -> None:
+        close = getattr(self.vectorstore.docstore, 'close', None)
+        if close is not None:
+            close()
+
+    def info(self) -> dict:
+        return {
+            "version": self.version,
+            "chunks": len(self),
+            "loaded_at": self.loaded_at,
+            "load_seconds": round(self.load_seconds, 3) if self.load_seconds is not None else None,
+        }
+
+    def search(self, questions: List[str], queries: np.ndarray,
+               candidates: int) -> List[Tuple[List[Tuple[float, int]], List[Tuple[int, float]]]]:
+        """
+        Per question, the top vector hits as (distance, position) and BM25
+        hits as (position, score). All query vectors are searched in one call.
+        """
+        with span("vector_search"):
+            distances, positions = self.vectorstore.index.search(queries, candidates)
+        results = []
+        with span("lexical_search") if self.lexical_index is not None else nullcontext():
+            for question, row_distances, row_positions in zip(questions, distances, positions):
+                vector_hits = [(float(d), int(p)) for d, p in zip(row_distances, row_positions) if p != -1]
+                lexical_hits = []
+                if self.lexical_index is not None:
+                    lexical_hits = self.lexical_index.search(question, candidates)
+                results.append((vector_hits, lexical_hits))
+        return results
+
+    def document(self, position: int) -> Optional[Document]:
+        doc = self.vectorstore.docstore.search(self.vectorstore.index_to_docstore_id[position])
+        if not isinstance(doc, Document):
+            return None
+        doc.metadata['collection'] = self.name
+        return doc
+
+
+def merge_hits(results: Iterable[Tuple[str, Tuple[List[Tuple[float, int]], List[Tuple[int, float]]]]],
+               retrieval_config: dict, k: int) -> List[ShardHit]:
+    """
+    Merge the hits of several shards into the top k. Vector hits are ranked
+    together by distance, which is comparable across shards built with the
+    same embeddings. BM25 scores are not: each shard has its own IDF and
+    average document length, so the shards' BM25 rankings are interleaved by
+    rank into one lexical ranking. When any shard has a BM25 index, the
+    vector and lexical rankings are fused by reciprocal rank, as within a
+    single shard, so their balance does not depend on how many shards are
+    searched.
+    """
+    vector_ranking: List[Tuple[float, ShardHit]] = []
+    lexical_rankings: List[List[ShardHit]] = []
+    for name, (vector_hits, lexical_hits) in results:
+        vector_ranking.extend((distance, (name, position)) for distance, position in vector_hits)
+        if lexical_hits:
+            ranked = sorted(lexical_hits, key=lambda hit: hit[1], reverse=True)
+            lexical_rankings.append([(name, position) for position, _ in ranked])
+    vector_ranking.sort(key=lambda hit: hit[0])
+    if not lexical_rankings:
+        return [hit for _, hit in vector_ranking[:k]]
+    lexical_ranking = [hit for same_rank in zip_longest(*lexical_rankings) for hit in same_rank if hit is not None]
+    fused = reciprocal_rank_fusion([
+        ([hit for _, hit in vector_ranking], retrieval_config.get('vector_weight', 1.0)),
+        (lexical_ranking, retrieval_config.get('lexical_weight', 1.0)),
+    ], rrf_k=retrieval_config.get('rrf_k', 60))
+    return fused[:k]
@@ -0,0 +1,158 @@
+"""
+URL discovery from robots.txt and XML sitemaps.
+
+Sitemaps list every page of a site with the time it last changed, so a crawl
+seeded from them covers the site without following links page by page, and a
+refresh only fetches pages whose `<lastmod>` moved since they were indexed.
+Sitemaps and sitemap indexes are parsed as a stream, gzipped or not, so large
+ones never have to fit in memory.
+"""
+import xml.etree.ElementTree as ET
+import zlib
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+import requests
+
+GZIP_MAGIC = b"\x1f\x8b"
+
+# (tag, loc, lastmod) of a <url> in a urlset or a <sitemap> in a sitemap index
+SitemapEntry = Tuple[str, str, Optional[str]]
+
+
+def parse_lastmod(value: Optional[str]) -> Optional[float]:
+    """Epoch seconds of a W3C datetime such as 2024-05-01 or 2024-05-01T10:00:00+02:00"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit('}', 1)[-1]
+
+
+def iter_sitemap(chunks: Iterable[bytes]) -> Iterator[SitemapEntry]:
+    """
+    Entries of a sitemap or sitemap index, parsed as its bytes arrive,
+    gzipped or not. Elements are dropped as soon as they are read.
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    decompressor = None
+    root = None
+    started = False
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if not started:
+            started = True
+            if chunk[:2] == GZIP_MAGIC:
+                decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        parser.feed(decompressor.decompress(chunk) if decompressor is not None else chunk)
+        for event, elem in parser.read_events():
+            if event == 'start':
+                if root is None:
+                    root = elem
+                continue
+            tag = _local(elem.tag)
+            if tag in ('url', 'sitemap'):
+                loc = lastmod = None
+                for child in elem:
+                    name = _local(child.tag)
+                    if name == 'loc':
+                        loc = (child.text or '').strip()
+                    elif name == 'lastmod':
+                        lastmod = (child.text or '').strip() or None
+                if loc:
+                    yield tag, loc, lastmod
+                root.clear()
+    parser.close()
+
+
+def sitemaps_in_robots(text: str, base_url: str) -> List[str]:
+    """The `Sitemap:` URLs listed in a robots.txt"""
+    sitemaps = []
+    for line in text.splitlines():
+        key, _, value = line.partition(':')
+        if key.strip().lower() == 'sitemap' and value.strip():
+            sitemaps.append(urljoin(base_url, value.strip()))
+    return sitemaps
+
+
+class SitemapDiscovery:
+    """
+    Finds the pages of a site from its sitemaps. The sitemaps of a seed's
+    site are the ones listed in its robots.txt, or /sitemap.xml when there
+    are none; sitemap indexes are followed to their sitemaps.
+    """
+
+    def __init__(self, session: requests.Session, timeout: float = 30,
+                 max_sitemaps: int = 200, max_urls: int = 200000):
+        self.session = session
+        self.timeout = timeout
+        self.max_sitemaps = max_sitemaps
+        self.max_urls = max_urls
+        self.sitemaps_read = 0
+        self.urls_listed = 0
+
+    def sitemaps_for(self, seeds: Iterable[str]) -> List[str]:
+        """Sitemap URLs of the sites the seeds belong to"""
+        sitemaps = []
+        for origin in dict.fromkeys(f"{urlsplit(seed).scheme}://{urlsplit(seed).netloc}" for seed in seeds):
+            listed = []
+            try:
+                response = self.session.get(f"{origin}/robots.txt", timeout=self.timeout)
+                if response.ok:
+                    listed = sitemaps_in_robots(response.text, origin)
+            except requests.RequestException as e:
+                print(f"⚠️ Could not read {origin}/robots.txt: {e}")
+            sitemaps.extend(listed or [f"{origin}/sitemap.xml"])
+        return list(dict.fromkeys(sitemaps))
+
+    def _read(self, url: str) -> Iterator[SitemapEntry]:
+        with self.session.get(url, timeout=self.timeout, stream=True) as response:
+            response.raise_for_status()
+            # requests undoes Content-Encoding; a .xml.gz served as a file is detected by its magic bytes
+            yield from iter_sitemap(response.iter_content(chunk_size=64 * 1024))
+
+    def discover(self, sitemaps: Iterable[str],
+                 select: Callable[[str], Optional[str]]) -> Dict[str, Optional[str]]:
+        """
+        Pages listed in the sitemaps, with their `<lastmod>` (None when not
+        given). `select` maps each listed URL to the URL to crawl, or to None
+        to leave it out. Unreadable sitemaps are skipped with a warning.
+        """
+        pages: Dict[str, Optional[str]] = {}
+        pending = list(dict.fromkeys(sitemaps))
+        seen = set(pending)
+        while pending:
+            if self.sitemaps_read >= self.max_sitemaps:
+                print(f"⚠️ Read the maximum of {self.max_sitemaps} sitemaps, skipping {len(pending)} more")
+                break
+            url = pending.pop(0)
+            self.sitemaps_read += 1
+            try:
+                for tag, loc, lastmod in self._read(url):
+                    if tag == 'sitemap':
+                        if loc not in seen:
+                            seen.add(loc)
+                            pending.append(loc)
+                        continue
+                    self.urls_listed += 1
+                    page = select(loc)
+                    if page is not None and len(pages) < self.max_urls:
+                        pages[page] = lastmod
+            except (requests.RequestException, ET.ParseError, zlib.error) as e:
+                print(f"⚠️ Could not read sitemap {url}: {e}")
+        if len(pages) >= self.max_urls:
+            print(f"⚠️ Sitemaps list more than {self.max_urls} matching pages; the rest are not crawled")
+        return pages
+
+    def stats(self) -> Dict[str, int]:
+        return {"sitemaps_read": self.sitemaps_read, "urls_listed": self.urls_listed}
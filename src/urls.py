@@ -0,0 +1,66 @@
+import fnmatch
+import re
+from typing import Iterable, List, Optional, Pattern
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit, urlunsplit
+
+# Query parameters that only track where a visitor came from
+DEFAULT_TRACKING_PARAMS = ['utm_*', 'gclid', 'fbclid', 'msclkid', 'mc_cid', 'mc_eid', '_ga', '_gl', 'mkt_tok']
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def compile_globs(patterns: Iterable[str]) -> Optional[Pattern]:
+    """One regex matching any of the shell-style patterns, or None for no patterns"""
+    patterns = list(patterns)
+    if not patterns:
+        return None
+    return re.compile('|'.join(f'(?:{fnmatch.translate(pattern)})' for pattern in patterns))
+
+
+class UrlMatcher:
+    """
+    `url_patterns` compiled once: a URL is allowed when it matches an
+    accepted pattern and no blacklisted one
+    """
+
+    def __init__(self, accepted: Iterable[str], blacklisted: Iterable[str] = ()):
+        self._accepted = compile_globs(accepted)
+        self._blacklisted = compile_globs(blacklisted)
+
+    def accepts(self, url: str) -> bool:
+        return self._accepted is not None and self._accepted.match(url) is not None
+
+    def blacklists(self, url: str) -> bool:
+        return self._blacklisted is not None and self._blacklisted.match(url) is not None
+
+    def allows(self, url: str) -> bool:
+        return self.accepts(url) and not self.blacklists(url)
+
+
+class UrlCanonicalizer:
+    """
+    Normalizes URLs so variants of one page dedup to a single URL: drops the
+    fragment and tracking parameters, lowercases scheme and host, removes the
+    default port and sorts the remaining query parameters
+    """
+
+    def __init__(self, tracking_params: Iterable[str] = DEFAULT_TRACKING_PARAMS):
+        self._tracking = compile_globs(tracking_params)
+
+    def __call__(self, url: str) -> str:
+        try:
+            parts = urlsplit(url.strip())
+            port = parts.port
+        except ValueError:
+            return url
+        scheme = parts.scheme.lower()
+        host = (parts.hostname or '').lower()
+        if port is not None and port != DEFAULT_PORTS.get(scheme):
+            host = f"{host}:{port}"
+        if parts.username or parts.password:
+            host = parts.netloc.rsplit('@', 1)[0] + '@' + host
+        query: List = parse_qsl(parts.query, keep_blank_values=True)
+        if self._tracking is not None:
+            query = [(key, value) for key, value in query if not self._tracking.match(key)]
+        path = parts.path or ('/' if host else '')
+        return urlunsplit((scheme, host, path, urlencode(sorted(query), quote_via=quote), ''))
@@ -0,0 +1,138 @@
+import os
+
+import faiss
+import numpy as np
+import pytest
+
+import ann_index
+from ann_index import (ANN_INDEX_FILENAME, FLAT_INDEX_FILENAME, factory_string, load_serving_index,
+                       save_ann_index)
+
+DIMENSION = 8
+IVF = {'type': 'ivf', 'nlist': 4, 'retrain_growth': 2.0}
+
+
+def flat_index(count, seed=0):
+    vectors = np.random.default_rng(seed).random((count, DIMENSION), dtype=np.float32)
+    index = faiss.IndexFlatL2(DIMENSION)
+    index.add(vectors)
+    return index
+
+
+def centroids(path):
+    index = faiss.read_index(os.path.join(path, ANN_INDEX_FILENAME))
+    ivf = faiss.extract_index_ivf(index)
+    return ivf.quantizer.reconstruct_n(0, ivf.nlist)
+
+
+@pytest.mark.parametrize("config, expected", [
+    ({'type': 'flat'}, "Flat"),
+    ({'type': 'ivf', 'nlist': 16}, "IVF16,Flat"),
+    ({'type': 'hnsw', 'hnsw_m': 16}, "HNSW16,Flat"),
+    ({'type': 'pq', 'pq_m': 4, 'pq_bits': 6}, "PQ4x6"),
+    ({'type': 'ivfpq', 'nlist': 16, 'pq_m': 2}, "IVF16,PQ2x8"),
+])
+def test_factory_string(config, expected):
+    assert factory_string(config, DIMENSION, 100000) == expected
+
+
+def test_factory_string_caps_parameters_to_the_training_set():
+    # 39 vectors per IVF cell, and no more PQ centroids than vectors
+    assert factory_string({'type': 'ivfpq', 'nlist': 1024, 'pq_m': 4}, DIMENSION, 390) == "IVF10,PQ4x8"
+    assert factory_string({'type': 'ivf'}, DIMENSION, 10) == "IVF1,Flat"
+    assert factory_string({'type': 'pq', 'pq_m': 4, 'pq_bits': 8}, DIMENSION, 20) == "PQ4x4"
+
+
+def test_factory_string_rejects_bad_configs():
+    with pytest.raises(ValueError, match="must divide"):
+        factory_string({'type': 'pq', 'pq_m': 3}, DIMENSION, 1000)
+    with pytest.raises(ValueError, match="Unknown vector_store.ann.type"):
+        factory_string({'type': 'lsh'}, DIMENSION, 1000)
+
+
+def test_trained_quantizer_is_reused_until_the_index_outgrows_it(tmp_path):
+    path = str(tmp_path)
+    first = save_ann_index(path, flat_index(200), IVF)
+    assert (first['factory'], first['retrained'], first['trained_count']) == ("IVF4,Flat", True, 200)
+    trained_centroids = centroids(path)
+
+    # Within retrain_growth of the training set: same quantizer, all current vectors
+    grown = save_ann_index(path, flat_index(400, seed=1), IVF)
+    assert (grown['retrained'], grown['trained_count'], grown['ntotal']) == (False, 200, 400)
+    np.testing.assert_array_equal(centroids(path), trained_centroids)
+
+    # Beyond it the quantizer is trained again on the current vectors
+    outgrown = save_ann_index(path, flat_index(401, seed=2), IVF)
+    assert (outgrown['retrained'], outgrown['trained_count']) == (True, 401)
+    assert not np.array_equal(centroids(path), trained_centroids)
+
+
+def test_changed_layout_is_retrained(tmp_path):
+    path = str(tmp_path)
+    save_ann_index(path, flat_index(200), IVF)
+    meta = save_ann_index(path, flat_index(200), {**IVF, 'nlist': 2})
+    assert (meta['factory'], meta['retrained']) == ("IVF2,Flat", True)
+
+
+def test_flat_config_builds_nothing(tmp_path):
+    assert save_ann_index(str(tmp_path), flat_index(200), {'type': 'flat'}) is None
+    assert not os.path.exists(tmp_path / ANN_INDEX_FILENAME)
+
+
+@pytest.fixture
+def read_flags(monkeypatch):
+    """Record the io flags every faiss.read_index call is made with"""
+    flags = []
+    read = faiss.read_index
+
+    def recording_read(path, *args):
+        flags.append((os.path.basename(path), args[0] if args else 0))
+        return read(path, *args)
+
+    monkeypatch.setattr(ann_index.faiss, "read_index", recording_read)
+    return flags
+
+
+def test_serving_index_is_memory_mapped(tmp_path, read_flags):
+    path = str(tmp_path)
+    flat = flat_index(200)
+    faiss.write_index(flat, os.path.join(path, FLAT_INDEX_FILENAME))
+    save_ann_index(path, flat, IVF)
+    read_flags.clear()
+
+    index, description = load_serving_index(path, {**IVF, 'nprobe': 3}, expected_count=200)
+    assert description == "IVF4,Flat"
+    assert faiss.extract_index_ivf(index).nprobe == 3
+    assert read_flags == [(ANN_INDEX_FILENAME, faiss.IO_FLAG_MMAP_IFC)]
+
+    read_flags.clear()
+    load_serving_index(path, {**IVF, 'mmap': False}, expected_count=200)
+    assert read_flags == [(ANN_INDEX_FILENAME, 0)]
+
+
+def test_serving_falls_back_to_the_flat_index_when_the_ann_index_is_stale(tmp_path, read_flags, capsys):
+    path = str(tmp_path)
+    flat = flat_index(200)
+    faiss.write_index(flat, os.path.join(path, FLAT_INDEX_FILENAME))
+    save_ann_index(path, flat, IVF)
+    read_flags.clear()
+
+    index, description = load_serving_index(path, IVF, expected_count=201)
+    assert (description, index.ntotal) == ("Flat", 200)
+    assert "No up-to-date ivf index" in capsys.readouterr().out
+    assert read_flags == [(FLAT_INDEX_FILENAME, faiss.IO_FLAG_MMAP_IFC)]
+
+
+def test_index_is_read_into_memory_when_it_cannot_be_mapped(tmp_path, monkeypatch, capsys):
+    path = str(tmp_path / FLAT_INDEX_FILENAME)
+    faiss.write_index(flat_index(10), path)
+    read = faiss.read_index
+
+    def unmappable(path, *args):
+        if args:
+            raise RuntimeError("mmap not supported")
+        return read(path)
+
+    monkeypatch.setattr(ann_index.faiss, "read_index", unmappable)
+    assert ann_index.read_index(path).ntotal == 10
+    assert "Could not memory-map" in capsys.readouterr().out
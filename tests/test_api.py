@@ -0,0 +1,34 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+from pydantic import ValidationError
+
+import api
+
+
+def status_of(call):
+    with pytest.raises(HTTPException) as raised:
+        asyncio.run(call)
+    return raised.value.status_code
+
+
+def test_admin_reload_is_disabled_without_an_admin_token(monkeypatch):
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+    assert status_of(api.admin_reload(authorization=None)) == 403
+    assert status_of(api.admin_reload(authorization="Bearer ")) == 403
+
+
+def test_admin_reload_requires_the_admin_token(monkeypatch):
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    assert status_of(api.admin_reload(authorization=None)) == 401
+    assert status_of(api.admin_reload(authorization="Bearer wrong")) == 401
+
+
+def test_batch_max_concurrency_is_bounded_by_the_serving_config():
+    limit = api.batch_concurrency_limit()
+    assert api.BatchQuestionRequest(questions=["q"], max_concurrency=limit).max_concurrency == limit
+    assert api.BatchQuestionRequest(questions=["q"]).max_concurrency is None
+    for value in (0, limit + 1, 10000):
+        with pytest.raises(ValidationError):
+            api.BatchQuestionRequest(questions=["q"], max_concurrency=value)
@@ -0,0 +1,76 @@
+import numpy as np
+
+from bm25 import BM25Index, reciprocal_rank_fusion, tokenize
+
+DOCS = [
+    "Set the eVar5 variable on the page view",
+    "The s.tl function sends a link tracking call",
+    "Page views are counted for every page, page after page",
+    "Processing rules rewrite props before reports",
+]
+
+
+def test_tokenize_splits_identifiers_and_drops_stopwords():
+    assert tokenize("How do I set eVar5 with s.tl?") == ["set", "evar5", "evar", "s.tl", "s", "tl"]
+    assert tokenize("page_name") == ["page_name", "page", "name"]
+
+
+def test_search_ranks_by_term_frequency_and_rarity():
+    index = BM25Index.build(DOCS)
+    hits = index.search("page", k=10)
+    assert [position for position, _ in hits] == [2, 0]
+    assert hits[0][1] > hits[1][1] > 0
+    # A term found in one document outweighs one found in several
+    assert index.search("processing page", k=1)[0][0] == 3
+
+
+def test_search_limits_and_misses():
+    index = BM25Index.build(DOCS)
+    assert len(index.search("page tracking rules", k=2)) == 2
+    assert index.search("the", k=5) == []
+    assert index.search("nonexistent", k=5) == []
+    assert index.search("page", k=0) == []
+
+
+def brute_force(docs, query, k1=1.2, b=0.75):
+    """BM25 scores of every document, computed term by term"""
+    tokenized = [tokenize(doc) for doc in docs]
+    average_length = sum(map(len, tokenized)) / len(tokenized)
+    scores = {}
+    for term in set(tokenize(query)):
+        df = sum(term in tokens for tokens in tokenized)
+        idf = np.log(1 + (len(docs) - df + 0.5) / (df + 0.5))
+        for position, tokens in enumerate(tokenized):
+            tf = tokens.count(term)
+            if tf:
+                norm = k1 * (1 - b + b * len(tokens) / average_length)
+                scores[position] = scores.get(position, 0.0) + idf * tf * (k1 + 1) / (tf + norm)
+    return scores
+
+
+def test_sparse_and_dense_scoring_match_bm25():
+    docs = [f"filler text {i}" for i in range(200)] + DOCS
+    index = BM25Index.build(docs)
+    # Few matching postings are scored per document, many through a dense array
+    for query in ("evar5 tracking", "filler page"):
+        expected = brute_force(docs, query)
+        hits = index.search(query, k=len(docs))
+        assert len(hits) == len(expected)
+        for position, score in hits:
+            assert np.isclose(score, expected[position], rtol=1e-5)
+
+
+def test_save_and_load(tmp_path):
+    index = BM25Index.build(DOCS)
+    path = str(tmp_path / "bm25.npz")
+    index.save(path)
+    loaded = BM25Index.load(path)
+    assert len(loaded) == len(index)
+    assert loaded.search("page tracking", k=4) == index.search("page tracking", k=4)
+
+
+def test_reciprocal_rank_fusion():
+    assert reciprocal_rank_fusion([([1, 2, 3], 1.0), ([2, 3], 1.0)]) == [2, 3, 1]
+    assert reciprocal_rank_fusion([([1, 2], 1.0), ([2, 1], 3.0)])[0] == 2
+    assert reciprocal_rank_fusion([]) == []
+
@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+
+from concurrency import LLMGate, Overloaded, RequestCoalescer
+
+
+def test_gate_rejects_when_the_queue_is_full():
+    async def scenario():
+        gate = LLMGate(max_in_flight=1, max_queued=1, queue_timeout=5)
+        release = asyncio.Event()
+
+        async def hold():
+            await release.wait()
+            return "done"
+
+        first = asyncio.ensure_future(gate.run(hold))
+        second = asyncio.ensure_future(gate.run(hold))
+        await asyncio.sleep(0.01)
+        assert gate.stats() == {"in_flight": 1, "queued": 1, "rejected": 0, "max_in_flight": 1}
+
+        with pytest.raises(Overloaded, match="queued"):
+            await gate.run(hold)
+
+        release.set()
+        assert await asyncio.gather(first, second) == ["done", "done"]
+        assert gate.stats() == {"in_flight": 0, "queued": 0, "rejected": 1, "max_in_flight": 1}
+
+    asyncio.run(scenario())
+
+
+def test_gate_times_out_waiting_for_a_slot():
+    async def scenario():
+        gate = LLMGate(max_in_flight=1, max_queued=4, queue_timeout=0.05)
+        release = asyncio.Event()
+        holder = asyncio.ensure_future(gate.run(release.wait))
+        await asyncio.sleep(0.01)
+
+        with pytest.raises(Overloaded, match="Timed out"):
+            await gate.run(release.wait)
+        assert gate.rejected == 1
+        assert gate.queued == 0
+
+        # The slot is still usable once the holder finishes
+        release.set()
+        await holder
+        assert await gate.run(lambda: asyncio.sleep(0, result="ok")) == "ok"
+        assert gate.in_flight == 0
+
+    asyncio.run(scenario())
+
+
+def test_gate_releases_the_slot_when_the_call_fails():
+    async def scenario():
+        gate = LLMGate(max_in_flight=1, max_queued=0, queue_timeout=0.05)
+
+        async def fail():
+            raise RuntimeError("upstream error")
+
+        with pytest.raises(RuntimeError):
+            await gate.run(fail)
+        assert await gate.run(lambda: asyncio.sleep(0, result="ok")) == "ok"
+
+    asyncio.run(scenario())
+
+
+def test_coalescer_shares_one_call_among_concurrent_callers():
+    async def scenario():
+        coalescer = RequestCoalescer()
+        calls = 0
+
+        async def answer():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"answer": "42"}
+
+        results = await asyncio.gather(*(coalescer.run("q", answer) for _ in range(5)))
+        assert calls == 1
+        assert coalescer.coalesced == 4
+        assert all(result is results[0] for result in results)
+
+        # Once finished, the key is free again
+        await coalescer.run("q", answer)
+        assert calls == 2
+
+    asyncio.run(scenario())
+
+
+def test_coalescer_survives_cancellation_of_the_first_caller():
+    async def scenario():
+        coalescer = RequestCoalescer()
+        release = asyncio.Event()
+        calls = 0
+
+        async def answer():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return "shared"
+
+        first = asyncio.ensure_future(coalescer.run("q", answer))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(coalescer.run("q", answer))
+        await asyncio.sleep(0)
+
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+
+        release.set()
+        assert await second == "shared"
+        assert calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_coalescer_propagates_errors_to_every_caller():
+    async def scenario():
+        coalescer = RequestCoalescer()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream error")
+
+        results = await asyncio.gather(
+            coalescer.run("q", fail), coalescer.run("q", fail), return_exceptions=True
+        )
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert coalescer._in_flight == {}
+
+    asyncio.run(scenario())
@@ -0,0 +1,91 @@
+from crawl_state import CrawlState
+
+SIGNATURE = {"seeds": ["https://docs.example.com/"], "max_depth": 3}
+
+
+def reopened(path, read):
+    """What `read` returns from a second connection to the state, as a restarted crawl sees it"""
+    state = CrawlState(path)
+    try:
+        return read(state)
+    finally:
+        state.close()
+
+
+def test_new_crawl_then_resume(tmp_path):
+    path = str(tmp_path / "crawl_state.sqlite")
+    state = CrawlState(path)
+    assert state.begin(SIGNATURE) is False
+    for url in ("https://a/1", "https://a/2", "https://a/3"):
+        state.enqueue(url, 1)
+    state.page_done("https://a/1", 1)
+    state.record_page("https://a/1", {"hash": "x"}, "content")
+    state.page_failed("https://a/2", 1)
+    state.checkpoint()
+    state.close()
+
+    resumed = CrawlState(path)
+    assert resumed.begin(dict(SIGNATURE)) is True
+    assert resumed.resumed
+    assert resumed.queued() == [("https://a/3", 1)]
+    assert resumed.visited() == {"https://a/1", "https://a/2", "https://a/3"}
+    assert resumed.failed() == {"https://a/2"}
+    assert list(resumed.pages()) == [("https://a/1", True, {"hash": "x"}, "content")]
+    assert resumed.counts() == {"done": 1, "failed": 1, "queued": 1}
+    resumed.close()
+
+
+def test_queued_keeps_discovery_order(tmp_path):
+    state = CrawlState(str(tmp_path / "state.sqlite"))
+    state.begin(SIGNATURE)
+    for url in ("https://a/c", "https://a/a", "https://a/b"):
+        state.enqueue(url, 0)
+    state.checkpoint()
+    state.page_done("https://a/c", 0)
+    state.page_failed("https://a/c", 0)
+    state.checkpoint()
+    assert state.queued() == [("https://a/a", 0), ("https://a/b", 0)]
+    state.close()
+
+
+def test_updates_are_not_written_before_a_checkpoint(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    state = CrawlState(path, checkpoint_every=2, checkpoint_interval=3600)
+    state.begin(SIGNATURE)
+    state.enqueue("https://a/1", 0)
+    state.enqueue("https://a/2", 0)
+    state.page_done("https://a/1", 0)
+    state.maybe_checkpoint()
+    assert reopened(path, CrawlState.queued) == []
+    state.page_done("https://a/2", 0)
+    state.maybe_checkpoint()
+    assert reopened(path, CrawlState.counts) == {"done": 2, "failed": 0, "queued": 0}
+    state.close()
+
+
+def test_different_signature_or_no_resume_starts_over(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    state = CrawlState(path)
+    state.begin(SIGNATURE)
+    state.enqueue("https://a/1", 0)
+    state.checkpoint()
+    assert reopened(path, lambda s: s.begin({**SIGNATURE, "max_depth": 4})) is False
+    assert reopened(path, CrawlState.queued) == []
+
+    state.begin(SIGNATURE)
+    state.enqueue("https://a/1", 0)
+    state.checkpoint()
+    assert reopened(path, lambda s: s.begin(SIGNATURE, resume=False)) is False
+    assert reopened(path, CrawlState.queued) == []
+    state.close()
+
+
+def test_finished_crawl_is_not_resumed(tmp_path):
+    path = str(tmp_path / "state.sqlite")
+    state = CrawlState(path)
+    state.begin(SIGNATURE)
+    state.enqueue("https://a/1", 0)
+    state.checkpoint()
+    state.finish()
+    state.close()
+    assert reopened(path, lambda s: s.begin(SIGNATURE)) is False
@@ -0,0 +1,79 @@
+from dedup import Deduplicator, NearDuplicateIndex, hamming, simhash
+
+PAGE = " ".join(
+    f"The tracking server receives the beacon number {i} and writes it to report suite data"
+    for i in range(20)
+)
+
+
+def flip(fingerprint: int, bits: int) -> int:
+    """The fingerprint with its lowest `bits` bits flipped"""
+    return fingerprint ^ ((1 << bits) - 1)
+
+
+def test_simhash_is_stable_and_counts_shingles():
+    assert simhash(PAGE) == simhash(PAGE)
+    assert simhash("one two three four", shingle_size=3) == (simhash("one two three four")[0], 2)
+    assert simhash("") == (0, 0)
+
+
+def test_simhash_near_texts_are_close_and_different_texts_far():
+    edited = PAGE.replace("number 7", "number seven")
+    other = " ".join(f"Processing rules rewrite variable {i} before the data is stored" for i in range(20))
+    assert hamming(simhash(PAGE)[0], simhash(edited)[0]) <= 3
+    assert hamming(simhash(PAGE)[0], simhash(other)[0]) > 10
+
+
+def test_find_matches_within_max_distance_only():
+    index = NearDuplicateIndex(max_distance=3)
+    fingerprint = simhash(PAGE)[0]
+    index.add("page", fingerprint)
+    assert index.find(flip(fingerprint, 3)) == "page"
+    assert index.find(flip(fingerprint, 4)) is None
+
+
+def test_find_exact_and_exclude():
+    index = NearDuplicateIndex(max_distance=3)
+    fingerprint = simhash(PAGE)[0]
+    index.add("page", fingerprint)
+    assert index.find(flip(fingerprint, 1), exact=True) is None
+    assert index.find(fingerprint, exact=True) == "page"
+    assert index.find(fingerprint, exclude="page") is None
+
+
+def test_find_prefers_closest_key():
+    index = NearDuplicateIndex(max_distance=3)
+    fingerprint = simhash(PAGE)[0]
+    index.add("far", flip(fingerprint, 3))
+    index.add("near", flip(fingerprint, 1))
+    assert index.find(fingerprint) == "near"
+
+
+def test_remove_and_re_add():
+    index = NearDuplicateIndex(max_distance=3)
+    index.add("page", 0xFFFF)
+    index.add("page", 0xFF00)
+    assert len(index) == 1
+    assert index.find(0xFFFF) is None
+    index.remove("page")
+    assert "page" not in index
+    assert index.find(0xFF00) is None
+
+
+def test_short_texts_are_not_near_matched():
+    deduplicator = Deduplicator(min_shingles=8)
+    assert deduplicator.fingerprint("Set up the report suite")[1] is False
+    assert deduplicator.fingerprint(PAGE)[1] is True
+
+
+def test_load_skips_duplicates_of_other_pages():
+    deduplicator = Deduplicator()
+    deduplicator.load(
+        [("https://a/1", {"simhash": "ff"}), ("https://a/2", {"simhash": "ff", "duplicate_of": "https://a/1"}),
+         ("https://a/3", {})],
+        [("chunk", {"simhash": "f0"})],
+    )
+    assert "https://a/1" in deduplicator.pages
+    assert "https://a/2" not in deduplicator.pages
+    assert len(deduplicator.pages) == 1
+    assert "chunk" in deduplicator.chunks
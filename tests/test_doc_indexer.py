@@ -0,0 +1,79 @@
+import asyncio
+import gc
+import weakref
+from contextlib import asynccontextmanager
+
+import pytest
+
+from crawler import PageLoad
+from doc_indexer import DocumentationIndexer
+from fakes import FakeChatModel, HashEmbeddings
+from metrics import CACHE_REQUESTS
+
+
+def test_cache_metrics_do_not_keep_a_replaced_indexer_alive(monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "x")
+    indexer = DocumentationIndexer(embeddings=HashEmbeddings(), llm=FakeChatModel())
+    indexer.query_cache.stats = lambda: {"hits": 3, "misses": 1}
+    assert 'docindexer_cache_requests_total{cache="query_embedding",result="hits"} 3' in CACHE_REQUESTS.render()
+
+    replaced = weakref.ref(indexer)
+    del indexer
+    gc.collect()
+    assert replaced() is None
+    # The callbacks of a collected indexer report nothing instead of failing
+    assert 'docindexer_cache_requests_total{cache="query_embedding",result="hits"} 0' in CACHE_REQUESTS.render()
+
+
+class FakePage:
+    def __init__(self, navigation_seconds):
+        self.navigation_seconds = navigation_seconds
+        self.load_state_timeouts = []
+
+    async def goto(self, url, wait_until, timeout):
+        await asyncio.sleep(self.navigation_seconds)
+
+    async def wait_for_load_state(self, state, timeout):
+        self.load_state_timeouts.append(timeout)
+
+    async def wait_for_selector(self, selector, state, timeout):
+        pass
+
+    async def evaluate(self, script, arg):
+        return {'blocks': [['p', 'Rendered content']], 'title': 'Page', 'links': [], 'mainSelector': 'main'}
+
+
+class FakePagePool:
+    def __init__(self, page):
+        self._page = page
+
+    @asynccontextmanager
+    async def page(self):
+        yield self._page
+
+    def load(self, page):
+        return PageLoad()
+
+
+class FakeCrawl:
+    def __init__(self):
+        self.pages = {}
+
+    async def add_page(self, url, content, title, links):
+        self.pages[url] = content
+        return True
+
+
+@pytest.mark.parametrize("navigation_seconds, waits", [(0, 1), (0.05, 0)])
+def test_networkidle_wait_stays_within_the_page_budget(monkeypatch, navigation_seconds, waits):
+    monkeypatch.setenv("OPENAI_API_KEY", "x")
+    indexer = DocumentationIndexer(embeddings=HashEmbeddings(), llm=FakeChatModel())
+    indexer.page_load = {'mode': 'networkidle', 'budget': 0.02}
+    page, crawl = FakePage(navigation_seconds), FakeCrawl()
+
+    asyncio.run(indexer._process_page_in_browser("https://docs.example.com/a", crawl, FakePagePool(page)))
+
+    # Once navigation has used the budget up, no wait is started: a timeout of 0 would never expire
+    assert len(page.load_state_timeouts) == waits
+    assert all(timeout > 0 for timeout in page.load_state_timeouts)
+    assert crawl.pages == {"https://docs.example.com/a": "Rendered content"}
@@ -0,0 +1,132 @@
+import os
+import pickle
+
+import numpy as np
+import pytest
+from langchain.docstore.document import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
+
+import docstore as docstore_module
+from docstore import (DOCSTORE_FILENAME, PICKLE_FILENAME, SqliteDocstore, load_vectorstore, migrate_pickle_docstore,
+                      new_vectorstore, save_vectorstore)
+from fakes import HashEmbeddings
+
+
+def doc(text, **metadata):
+    return Document(page_content=text, metadata={"source": "https://docs.example.com/", **metadata})
+
+
+def test_sqlite_docstore_round_trip(tmp_path):
+    path = str(tmp_path / DOCSTORE_FILENAME)
+    store = SqliteDocstore(path)
+    store.add({"a": doc("alpha", n=1), "b": doc("beta"), "c": doc("gamma")})
+    # Pending changes are visible before they are committed
+    assert store.search("a").page_content == "alpha"
+    store.delete(["c"])
+    assert store.search("c") == "ID c not found."
+    store.commit({0: "a", 1: "b"}, index_checksum="10:0000abcd")
+    store.close()
+
+    reopened = SqliteDocstore(path)
+    assert reopened.search("a") == doc("alpha", n=1)
+    assert reopened.search("c") == "ID c not found."
+    assert reopened.load_positions() == {0: "a", 1: "b"}
+    assert list(reopened.iter_texts()) == ["alpha", "beta"]
+    assert dict(reopened.iter_metadata())["a"]["n"] == 1
+    positions = reopened.position_map()
+    assert len(positions) == 2 and positions[1] == "b"
+    with pytest.raises(KeyError):
+        positions[2]
+    assert reopened.index_checksum() == "10:0000abcd"
+    reopened.close()
+
+
+def test_sqlite_docstore_commits_appended_and_renumbered_positions(tmp_path):
+    path = str(tmp_path / DOCSTORE_FILENAME)
+    store = SqliteDocstore(path)
+    store.add({"a": doc("alpha"), "b": doc("beta")})
+    store.commit({0: "a", 1: "b"})
+    store.add({"c": doc("gamma")})
+    store.commit({0: "a", 1: "b", 2: "c"})
+    assert store.load_positions() == {0: "a", 1: "b", 2: "c"}
+    # A delete renumbers the positions after it
+    store.delete(["a"])
+    store.commit({0: "b", 1: "c"})
+    assert store.load_positions() == {0: "b", 1: "c"}
+    store.close()
+
+    reset = SqliteDocstore(path, reset=True)
+    assert reset.search("b") == "ID b not found."
+    reset.add({"d": doc("delta")})
+    reset.commit({0: "d"})
+    assert list(reset.iter_texts()) == ["delta"]
+    assert [chunk_id for chunk_id, _ in reset.iter_metadata()] == ["d"]
+    reset.close()
+
+
+def test_migrate_pickle_docstore(tmp_path):
+    index_path = str(tmp_path)
+    legacy = InMemoryDocstore({"a": doc("alpha"), "b": doc("beta")})
+    with open(os.path.join(index_path, PICKLE_FILENAME), "wb") as f:
+        pickle.dump((legacy, {0: "b", 1: "a"}), f)
+
+    assert migrate_pickle_docstore(index_path) is True
+    assert not os.path.exists(os.path.join(index_path, PICKLE_FILENAME))
+    assert os.path.exists(os.path.join(index_path, PICKLE_FILENAME + ".migrated"))
+    store = SqliteDocstore(os.path.join(index_path, DOCSTORE_FILENAME))
+    assert store.load_positions() == {0: "b", 1: "a"}
+    assert list(store.iter_texts()) == ["beta", "alpha"]
+    store.close()
+    assert migrate_pickle_docstore(index_path) is False
+
+
+def save_texts(index_path, texts):
+    embeddings = HashEmbeddings(size=8)
+    vectorstore = new_vectorstore(index_path, embeddings, 8)
+    vectorstore.add_texts(texts, ids=[f"chunk-{i}" for i in range(len(texts))])
+    save_vectorstore(vectorstore, index_path)
+    vectorstore.docstore.close()
+    return embeddings
+
+
+def test_vectorstore_round_trip(tmp_path):
+    index_path = str(tmp_path)
+    embeddings = save_texts(index_path, ["alpha", "beta"])
+    vectorstore = load_vectorstore(index_path, embeddings)
+    assert vectorstore.index.ntotal == 2
+    assert vectorstore.similarity_search("beta", k=1)[0].page_content == "beta"
+    vectorstore.docstore.close()
+
+
+def test_save_interrupted_before_the_index_swap_is_finished_on_load(tmp_path, monkeypatch):
+    index_path = str(tmp_path)
+    save_texts(index_path, ["alpha", "beta"])
+    replace = os.replace
+
+    def crash_on_index_swap(src, dst):
+        if src.endswith("index.faiss.tmp"):
+            raise KeyboardInterrupt
+        replace(src, dst)
+
+    monkeypatch.setattr(docstore_module.os, "replace", crash_on_index_swap)
+    with pytest.raises(KeyboardInterrupt):
+        save_texts(index_path, ["gamma", "delta"])
+    monkeypatch.setattr(docstore_module.os, "replace", replace)
+
+    vectorstore = load_vectorstore(index_path, HashEmbeddings(size=8))
+    assert not os.path.exists(os.path.join(index_path, "index.faiss.tmp"))
+    assert vectorstore.similarity_search("gamma", k=1)[0].page_content == "gamma"
+    assert np.allclose(vectorstore.index.reconstruct(0), HashEmbeddings(size=8).embed_query("gamma"))
+    vectorstore.docstore.close()
+
+
+def test_index_with_the_same_count_but_other_vectors_is_rejected(tmp_path):
+    index_path = str(tmp_path)
+    save_texts(index_path, ["alpha", "beta"])
+    with open(os.path.join(index_path, "index.faiss"), "rb") as f:
+        old_index = f.read()
+    save_texts(index_path, ["gamma", "delta"])
+    with open(os.path.join(index_path, "index.faiss"), "wb") as f:
+        f.write(old_index)
+    with pytest.raises(ValueError, match="not the one its docstore was saved with"):
+        load_vectorstore(index_path, HashEmbeddings(size=8))
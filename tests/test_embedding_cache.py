@@ -0,0 +1,97 @@
+from typing import List
+
+import pytest
+from langchain_core.embeddings import Embeddings
+
+import embedding_cache
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+
+
+class FakeBackend(Embeddings):
+    """Embeds a text as [len(text), number of the call], failing the first `failures` calls"""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.document_calls: List[List[str]] = []
+        self.query_calls: List[str] = []
+
+    def _fail(self):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("transient")
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._fail()
+        self.document_calls.append(list(texts))
+        return [[float(len(text)), float(len(self.document_calls))] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self._fail()
+        self.query_calls.append(text)
+        return [float(len(text)), 0.0]
+
+
+def test_embed_queries_batches_and_counts_query_calls():
+    backend = FakeBackend()
+    embeddings = CachedEmbeddings(backend, None, "model", batch_size=4, max_concurrency=2)
+    questions = [f"question {i}" * (i + 1) for i in range(10)]
+    vectors = embeddings.embed_queries(questions)
+    assert [vector[0] for vector in vectors] == [float(len(q)) for q in questions]
+    assert sorted(map(len, backend.document_calls)) == [2, 4, 4]
+    assert embeddings.stats()["query_calls"] == 3
+    assert embeddings.stats()["backend_calls"] == 0
+    assert embeddings.embed_queries([]) == []
+
+
+def test_cache_hits_skip_the_backend(tmp_path):
+    backend = FakeBackend()
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    embeddings = CachedEmbeddings(backend, cache, "model", batch_size=2)
+    first = embeddings.embed_documents(["a", "bb", "a", "ccc"])
+    assert first[0] == first[2]
+    assert sorted(backend.document_calls) == [["a", "bb"], ["ccc"]]
+    assert embeddings.stats() == {"hits": 0, "misses": 3, "backend_calls": 2, "query_calls": 0}
+
+    baseline = embeddings.stats()
+    assert embeddings.embed_documents(["ccc", "bb", "dddd"])[:2] == [first[3], first[1]]
+    assert backend.document_calls[-1] == ["dddd"]
+    assert embeddings.stats(since=baseline) == {"hits": 2, "misses": 1, "backend_calls": 1, "query_calls": 0}
+
+    # A cache written by another model is not reused
+    other = CachedEmbeddings(backend, cache, "other-model")
+    other.embed_documents(["a"])
+    assert other.stats()["misses"] == 1
+    cache.close()
+
+
+def test_cache_evicts_least_recently_used_down_to_90_percent(tmp_path, monkeypatch):
+    clock = iter(range(1000))
+    monkeypatch.setattr(embedding_cache.time, "time", lambda: float(next(clock)))
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite"), max_entries=10)
+    for i in range(10):
+        cache.put_many({f"k{i}": [float(i)]})
+    # Reading k0 makes it recent, so k1 is now the least recently used
+    assert cache.get_many(["k0"]) == {"k0": [0.0]}
+    assert len(cache) == 10
+    cache.put_many({"k10": [10.0]})
+    assert len(cache) == 9
+    assert set(cache.get_many(f"k{i}" for i in range(11))) == {"k0", *(f"k{i}" for i in range(3, 11))}
+    cache.close()
+
+
+def test_backend_calls_are_retried_after_a_transient_failure():
+    backend = FakeBackend(failures=2)
+    embeddings = CachedEmbeddings(backend, None, "model", max_retries=2, backoff_base=0)
+    assert embeddings.embed_documents(["a"]) == [[1.0, 1.0]]
+    assert embeddings.stats()["backend_calls"] == 3
+
+    backend.failures = 1
+    assert embeddings.embed_query("abc") == [3.0, 0.0]
+    assert embeddings.stats()["query_calls"] == 2
+
+
+def test_backend_errors_surface_after_the_last_retry():
+    embeddings = CachedEmbeddings(FakeBackend(failures=3), None, "model", max_retries=2, backoff_base=0)
+    with pytest.raises(ConnectionError):
+        embeddings.embed_query("abc")
+    assert embeddings.stats()["query_calls"] == 3
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from browser_extractor import DEFAULT_RULES, extract_rendered_page
+from html_extractor import content_blocks, extract_static_content, parse_html, query_selector_all, render_blocks
+
+URL = "https://docs.example.com/docs/evar"
+
+PAGE = '''<html><head><title>Variables</title><base href="/docs/"></head><body>
+<nav><a href="/nav">Nav</a></nav>
+<div class="sidebar"><p>Sidebar</p></div>
+<main>
+<div class="breadcrumb">Home / Variables</div>
+<h1>eVars</h1>
+<p>An eVar is a <b>conversion</b>
+   variable.<br>It persists.</p>
+<div hidden><p>Hidden</p></div>
+<p style="display: none">Also hidden</p>
+<ul><li>First<ul><li>Nested</li></ul></li><li>Second<p>More of second</p></li></ul>
+<pre>s.eVar1 = "x";
+  s.t();
+</pre>
+<table><tr><th>Name</th><th>Type</th></tr><tr><td>eVar1</td><td>conversion</td></tr><tr><td></td><td></td></tr></table>
+<script>var x = 1;</script>
+<footer><a href="/footer">Footer</a></footer>
+<p>See <a href="props">props</a> and <a href="https://other.example.com/x">other</a>.</p>
+</main></body></html>'''
+
+CONTENT = '''# eVars
+
+An eVar is a conversion variable.
+It persists.
+
+- First
+  - Nested
+- Second
+  More of second
+
+```
+s.eVar1 = "x";
+  s.t();
+```
+
+| Name | Type |
+| eVar1 | conversion |
+
+See props and other.'''
+
+
+def test_static_extraction_applies_the_rules():
+    page = extract_static_content(PAGE, URL, DEFAULT_RULES)
+    assert page.content == CONTENT
+    assert page.title == "Variables"
+    assert page.main_selector == "main"
+    # Links inside excluded elements are dropped, the rest resolved against <base>
+    assert page.links == ["https://docs.example.com/docs/props", "https://other.example.com/x"]
+
+
+def test_main_content_follows_the_rule_order_and_falls_back_to_the_body():
+    page = extract_static_content('<div class="content"><p>c</p></div><article><p>a</p></article>', URL, DEFAULT_RULES)
+    assert (page.content, page.main_selector) == ("a", "article")
+
+    page = extract_static_content("<html><body><p>Just a body</p><nav>Menu</nav></body></html>", URL, DEFAULT_RULES)
+    assert (page.content, page.main_selector) == ("Just a body", None)
+
+
+def test_configured_rules_replace_the_defaults():
+    rules = {**DEFAULT_RULES, 'main_content': ['#docs'], 'exclude': ['.note']}
+    page = extract_static_content('<main><p>m</p></main><div id="docs"><p>d</p><p class="note">n</p></div>',
+                                  URL, rules)
+    assert (page.content, page.main_selector) == ("d", "#docs")
+
+
+def test_render_blocks_groups_items_and_rows():
+    blocks = [('heading', '# T'), ('item', '- a'), ('item', '- b'), ('paragraph', 'p'),
+              ('row', '| x |'), ('row', '| y |'), ('code', 'print(1)')]
+    assert render_blocks(blocks) == "# T\n\n- a\n- b\n\np\n\n| x |\n| y |\n\n```\nprint(1)\n```"
+    assert render_blocks([]) == ""
+
+
+class ScriptPage:
+    """Hands back blocks the way page.evaluate returns the EXTRACT_SCRIPT result"""
+
+    def __init__(self, blocks):
+        self.blocks = blocks
+
+    async def evaluate(self, script, rules):
+        return {'blocks': [list(block) for block in self.blocks], 'title': 'Variables', 'links': [], 'mainSelector': 'main'}
+
+
+def test_rendered_blocks_go_through_the_same_renderer():
+    blocks = content_blocks(query_selector_all(parse_html(PAGE.replace('<script>var x = 1;</script>', '')), 'main')[0])
+    rendered = asyncio.run(extract_rendered_page(ScriptPage(blocks), DEFAULT_RULES))
+    assert rendered.content == render_blocks(blocks)
+    assert rendered.main_selector == "main"
+
+
+def test_browser_and_static_extraction_agree():
+    async_api = pytest.importorskip("playwright.async_api")
+
+    async def render():
+        async with async_api.async_playwright() as playwright:
+            try:
+                browser = await playwright.chromium.launch()
+            except Exception as e:
+                pytest.skip(f"Chromium is not available: {e}")
+            try:
+                page = await browser.new_page()
+                await page.route("**/*", lambda route: route.fulfill(body=PAGE, content_type="text/html"))
+                await page.goto(URL)
+                return await extract_rendered_page(page, DEFAULT_RULES)
+            finally:
+                await browser.close()
+
+    rendered = asyncio.run(render())
+    static = extract_static_content(PAGE, URL, DEFAULT_RULES)
+    assert (rendered.content, rendered.title, rendered.links, rendered.main_selector) == \
+        (static.content, static.title, static.links, static.main_selector)
@@ -0,0 +1,80 @@
+import history
+from history import ConversationCompactor, PreparedQuestion, TokenCounter
+
+
+def offline_counter(monkeypatch):
+    """A counter without a tokenizer, as when tiktoken cannot download its files"""
+    def unavailable(*args, **kwargs):
+        raise OSError("no network")
+
+    monkeypatch.setattr(history.tiktoken, "encoding_for_model", unavailable)
+    monkeypatch.setattr(history.tiktoken, "get_encoding", unavailable)
+    return TokenCounter("gpt-4o-mini")
+
+
+def turn(role, tokens, label):
+    """A turn of exactly `tokens` approximated tokens, including its "role: " prefix"""
+    prefix = f"{role}: {label} "
+    return role, f"{label} " + "x" * (tokens * 4 - len(prefix) - 1)
+
+
+def test_fallback_counter_approximates_four_characters_per_token(monkeypatch, capsys):
+    counter = offline_counter(monkeypatch)
+    assert "Tokenizer unavailable" in capsys.readouterr().out
+    assert counter.count("") == 0
+    assert counter.count("abc") == 1
+    assert counter.count("x" * 40) == 10
+
+
+def test_only_the_most_recent_turns_within_the_budget_are_kept(monkeypatch):
+    compactor = ConversationCompactor(offline_counter(monkeypatch), token_budget=25, retrieval_token_budget=0)
+    turns = [turn("User", 10, "q1"), turn("Assistant", 10, "a1"), turn("User", 10, "q2"), turn("Assistant", 10, "a2")]
+
+    prepared = compactor.prepare("And then?", turns)
+    assert prepared.kept_turns == turns[2:]
+    assert prepared.turns_dropped == 2
+    assert prepared.history_tokens == 40
+    assert prepared.kept_history_tokens == 20
+    assert compactor.usage(prepared) == {
+        "history_tokens": 40, "history_tokens_kept": 20, "turns_dropped": 2, "retrieval_query_tokens": 2,
+    }
+
+
+def test_a_turn_over_the_budget_drops_everything_before_it(monkeypatch):
+    compactor = ConversationCompactor(offline_counter(monkeypatch), token_budget=15)
+    turns = [turn("User", 5, "q1"), turn("Assistant", 20, "a1"), turn("User", 5, "q2")]
+
+    prepared = compactor.prepare("Why?", turns)
+    # The short first turn would fit, but turns are only kept contiguously from the end
+    assert prepared.kept_turns == turns[2:]
+    assert compactor.prepare("Why?", None).kept_turns == []
+
+
+def test_retrieval_query_prepends_earlier_user_questions_that_fit(monkeypatch):
+    compactor = ConversationCompactor(offline_counter(monkeypatch), token_budget=1000, retrieval_token_budget=6)
+    turns = [("User", "x" * 40), ("Assistant", "An eVar is a variable."), ("User", "What is an eVar?")]
+
+    prepared = compactor.prepare("How do I delete it?", turns)
+    # The question and the latest user turn are 4 tokens each, over the budget of 6 together
+    assert prepared.retrieval_query == "How do I delete it?"
+
+    compactor.retrieval_token_budget = 8
+    prepared = compactor.prepare("How do I delete it?", turns)
+    # The first user turn would take it to 18 tokens, so it stops at the latest one
+    assert prepared.retrieval_query == "What is an eVar?\nHow do I delete it?"
+
+
+def test_prepared_question_renders_the_kept_turns_before_the_question():
+    prepared = PreparedQuestion("How do I delete it?", [("User", "What is an eVar?"), ("Assistant", "A variable.")],
+                                "What is an eVar?\nHow do I delete it?", 12, 12, 0)
+    assert prepared.history_text == "User: What is an eVar?\nAssistant: A variable.\n"
+    assert prepared.prompt_question == "User: What is an eVar?\nAssistant: A variable.\nUser: How do I delete it?"
+
+    alone = PreparedQuestion("What is an eVar?", [], "What is an eVar?", 0, 0, 0)
+    assert alone.prompt_question == "User: What is an eVar?"
+
+
+def test_usage_counts_the_prompt_when_given(monkeypatch):
+    compactor = ConversationCompactor(offline_counter(monkeypatch))
+    prepared = compactor.prepare("x" * 8)
+    assert compactor.usage(prepared, prompt="y" * 400)["prompt_tokens"] == 100
@@ -0,0 +1,104 @@
+import os
+import sqlite3
+
+import index_versions
+from index_versions import (UNVERSIONED, begin_build, building_version, current_index, current_version, publish,
+                            version_path, versions)
+
+
+def write_index(path, content="index"):
+    with open(os.path.join(path, "index.faiss"), 'w') as f:
+        f.write(content)
+    with sqlite3.connect(os.path.join(path, "docstore.sqlite")) as conn:
+        conn.execute("CREATE TABLE IF NOT EXISTS chunks (id TEXT)")
+        conn.execute("INSERT INTO chunks VALUES (?)", (content,))
+
+
+def test_versions_sort_same_second_suffixes_numerically(tmp_path):
+    root = str(tmp_path)
+    names = ["20261017T021502-10", "20261017T021502", "20261017T021503", "20261017T021502-2"]
+    for name in names:
+        os.makedirs(os.path.join(root, "versions", name))
+    assert versions(root) == ["20261017T021502", "20261017T021502-2", "20261017T021502-10", "20261017T021503"]
+
+
+def test_no_index_and_unversioned_index(tmp_path):
+    root = str(tmp_path)
+    assert current_index(root) == (None, None)
+    write_index(root)
+    assert current_index(root) == (root, UNVERSIONED)
+
+
+def test_build_is_visible_only_once_published(tmp_path):
+    root = str(tmp_path)
+    path, version = begin_build(root, seed=False, resume=False)
+    write_index(path)
+    assert current_version(root) is None
+    assert building_version(root) == version
+    assert versions(root) == []
+    publish(root, version)
+    assert current_index(root) == (path, version)
+    assert building_version(root) is None
+    assert versions(root) == [version]
+
+
+def test_seeded_build_copies_the_current_index(tmp_path):
+    root = str(tmp_path)
+    write_index(root, "old")
+    path, _ = begin_build(root, seed=True, resume=False)
+    with open(os.path.join(path, "index.faiss")) as f:
+        assert f.read() == "old"
+    with sqlite3.connect(os.path.join(path, "docstore.sqlite")) as conn:
+        assert conn.execute("SELECT id FROM chunks").fetchall() == [("old",)]
+    assert not os.path.exists(os.path.join(begin_build(root, seed=False, resume=False)[0], "index.faiss"))
+
+
+def test_resume_continues_the_unfinished_build(tmp_path):
+    root = str(tmp_path)
+    path, version = begin_build(root, seed=False, resume=False)
+    write_index(path, "partial")
+    assert begin_build(root, seed=False, resume=True) == (path, version)
+    new_path, new_version = begin_build(root, seed=False, resume=False)
+    assert building_version(root) == new_version
+    assert not os.path.exists(os.path.join(new_path, "index.faiss"))
+
+
+def test_publish_keeps_the_newest_versions(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    # Builds within the same second get -2, -3, ... suffixes
+    seconds = iter([0, 0, 0, 1, 1])
+    gmtime = index_versions.time.gmtime
+    monkeypatch.setattr(index_versions.time, "gmtime", lambda: gmtime(next(seconds)))
+    built = []
+    for i in range(5):
+        path, version = begin_build(root, seed=False, resume=False)
+        write_index(path, str(i))
+        publish(root, version, keep=3, grace_seconds=0)
+        built.append(version)
+    assert built == ["19700101T000000", "19700101T000000-2", "19700101T000000-3",
+                     "19700101T000001", "19700101T000001-2"]
+    assert versions(root) == built[-3:]
+    assert current_version(root) == built[-1]
+
+
+def test_publish_keeps_recently_replaced_versions_for_the_grace_period(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    now = [1000.0]
+    monkeypatch.setattr(index_versions.time, "time", lambda: now[0])
+    built = []
+    for i in range(3):
+        path, version = begin_build(root, seed=False, resume=False)
+        write_index(path, str(i))
+        publish(root, version, keep=1, grace_seconds=60)
+        built.append(version)
+        now[0] += 1
+    # Both replaced versions were current within the last minute
+    assert versions(root) == built
+    assert not os.path.exists(os.path.join(version_path(root, built[-1]), "RETIRED"))
+
+    now[0] += 60
+    path, version = begin_build(root, seed=True, resume=False)
+    assert not os.path.exists(os.path.join(path, "RETIRED"))
+    publish(root, version, keep=1, grace_seconds=60)
+    # The version just replaced stays until its grace period is over
+    assert versions(root) == [built[-1], version]
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import os
+import threading
+import types
+from typing import List
+
+import pytest
+from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.embeddings import Embeddings
+
+import pipeline as pipeline_module
+from docstore import load_vectorstore
+from embedding_cache import CachedEmbeddings
+from manifest import MANIFEST_FILENAME, PageManifest
+from pipeline import IndexingPipeline
+
+
+class FakeBackend(Embeddings):
+    """Two-dimensional embeddings; fails every call from `fail_at` on, blocks while `gate` is clear"""
+
+    def __init__(self, fail_at: int = 0):
+        self.fail_at = fail_at
+        self.calls: List[int] = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self.gate.wait()
+        self.calls.append(len(texts))
+        if self.fail_at and len(self.calls) >= self.fail_at:
+            raise ConnectionError("embedding service down")
+        return [[float(len(text)), 1.0] for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return [float(len(text)), 1.0]
+
+
+def make_pipeline(index_path, backend, **kwargs):
+    embeddings = CachedEmbeddings(backend, None, "model", max_retries=0, backoff_base=0)
+    indexer = types.SimpleNamespace(embeddings=embeddings, vectorstore=None)
+    manifest = PageManifest(os.path.join(index_path, MANIFEST_FILENAME))
+    splitter = RecursiveCharacterTextSplitter(chunk_size=40, chunk_overlap=0)
+    options = dict(batch_size=4, queue_size=4, checkpoint_every=2, checkpoint_interval=3600)
+    options.update(kwargs)
+    return IndexingPipeline(indexer, manifest, splitter, index_path, **options)
+
+
+def page(i):
+    url = f"https://docs.example.com/page{i}"
+    text = f"Page {i} explains report suites. It also covers the tracking code of page {i}."
+    return url, {"content_hash": str(i)}, Document(page_content=text, metadata={"source": url})
+
+
+def assert_manifest_matches_index(index_path):
+    """Every chunk the saved manifest lists is in the saved index"""
+    with open(os.path.join(index_path, MANIFEST_FILENAME)) as f:
+        pages = json.load(f)["pages"]
+    vectorstore = load_vectorstore(index_path, CachedEmbeddings(FakeBackend(), None, "model"))
+    indexed = set(vectorstore.index_to_docstore_id.values())
+    listed = {chunk for entry in pages.values() for chunk in entry["chunk_ids"]}
+    assert listed <= indexed
+    vectorstore.docstore.close()
+    return pages, indexed
+
+
+def test_pages_are_embedded_in_rolling_batches(tmp_path):
+    backend = FakeBackend()
+    pipeline = make_pipeline(str(tmp_path), backend)
+
+    async def run():
+        pipeline.start()
+        for i in range(6):
+            await pipeline.put(*page(i))
+        await pipeline.finish()
+
+    asyncio.run(run())
+    # Two chunks per page, flushed once at least batch_size chunks are pending
+    assert backend.calls == [4, 4, 4]
+    assert pipeline.chunks_added == 12
+    pages, indexed = assert_manifest_matches_index(str(tmp_path))
+    assert len(pages) == 6 and len(indexed) == 12
+
+
+def test_put_blocks_while_the_queue_is_full(tmp_path):
+    backend = FakeBackend()
+    backend.gate.clear()
+    pipeline = make_pipeline(str(tmp_path), backend, batch_size=1, queue_size=1)
+
+    async def run():
+        pipeline.start()
+        await pipeline.put(*page(0))
+        await asyncio.sleep(0.05)
+        # Page 0 is stuck in embedding and page 1 fills the queue
+        await pipeline.put(*page(1))
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(pipeline.put(*page(2)), 0.1)
+        backend.gate.set()
+        await pipeline.put(*page(2))
+        await pipeline.finish()
+
+    asyncio.run(run())
+    assert pipeline.pages_indexed == 3
+
+
+def test_checkpoint_saves_the_index_before_the_manifest(tmp_path, monkeypatch):
+    order = []
+    save_vectorstore = pipeline_module.save_vectorstore
+    monkeypatch.setattr(pipeline_module, "save_vectorstore",
+                        lambda *args: (order.append("index"), save_vectorstore(*args)))
+    pipeline = make_pipeline(str(tmp_path), FakeBackend())
+    save_manifest = pipeline.manifest.save
+    monkeypatch.setattr(pipeline.manifest, "save", lambda: (order.append("manifest"), save_manifest()))
+
+    async def run():
+        pipeline.start()
+        await pipeline.put(*page(0))
+        await pipeline.finish()
+
+    asyncio.run(run())
+    assert order == ["index", "manifest"]
+
+
+def test_abort_after_a_failed_crawl_keeps_what_was_indexed(tmp_path):
+    pipeline = make_pipeline(str(tmp_path), FakeBackend())
+
+    async def run():
+        pipeline.start()
+        for i in range(3):
+            await pipeline.put(*page(i))
+        await pipeline.abort()
+
+    asyncio.run(run())
+    pages, indexed = assert_manifest_matches_index(str(tmp_path))
+    assert len(pages) == 3 and len(indexed) == 6
+
+
+def test_abort_after_a_failed_batch_leaves_the_last_checkpoint(tmp_path):
+    # The third embedding batch fails after two checkpoints
+    pipeline = make_pipeline(str(tmp_path), FakeBackend(fail_at=3))
+
+    async def run():
+        pipeline.start()
+        with pytest.raises((ConnectionError, RuntimeError)):
+            for i in range(20):
+                await pipeline.put(*page(i))
+                await asyncio.sleep(0.01)
+        await pipeline.abort()
+
+    asyncio.run(run())
+    pages, indexed = assert_manifest_matches_index(str(tmp_path))
+    assert len(pages) == 4 and len(indexed) == 8
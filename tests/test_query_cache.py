@@ -0,0 +1,107 @@
+import math
+
+import query_cache
+from query_cache import AnswerCache, QueryEmbeddingCache, normalize_question
+
+ANSWER = {"answer": "An eVar is a conversion variable.", "sources": ["https://docs.example.com/evar"]}
+
+
+def unit(angle_degrees):
+    """2-d unit vector at the angle; cosine similarity to [1, 0] is cos(angle)"""
+    angle = math.radians(angle_degrees)
+    return [math.cos(angle), math.sin(angle)]
+
+
+def test_normalize_question():
+    assert normalize_question("  What IS an\teVar?\n") == "what is an evar?"
+
+
+def test_exact_hits_ignore_case_and_whitespace():
+    cache = AnswerCache()
+    cache.put("What is an eVar?", None, ANSWER)
+    assert cache.get_exact("what is an  EVAR?") == ANSWER
+    assert cache.stats() == {"exact_hits": 1, "similar_hits": 0, "misses": 0, "size": 1}
+
+
+def test_exact_misses_are_counted_unless_a_near_lookup_follows():
+    cache = AnswerCache()
+    assert cache.get_exact("What is an eVar?") is None
+    assert cache.stats()["misses"] == 1
+    # A miss followed by a near lookup counts once, in get_similar
+    assert cache.get_exact("What is an eVar?", count_miss=False) is None
+    assert cache.get_similar(unit(0)) is None
+    assert cache.stats()["misses"] == 2
+
+
+def test_near_match_threshold():
+    cache = AnswerCache(similarity_threshold=0.95)
+    cache.put("What is an eVar?", unit(0), ANSWER)
+    # cos(15°) ≈ 0.966, cos(20°) ≈ 0.940
+    assert cache.get_similar(unit(15)) == ANSWER
+    assert cache.get_similar(unit(20)) is None
+    assert cache.stats() == {"exact_hits": 0, "similar_hits": 1, "misses": 1, "size": 1}
+
+
+def test_near_match_picks_the_most_similar_question():
+    cache = AnswerCache(similarity_threshold=0.9)
+    cache.put("first", unit(0), {"answer": "first"})
+    cache.put("second", unit(20), {"answer": "second"})
+    assert cache.get_similar(unit(15))["answer"] == "second"
+    # Questions cached without an embedding only match exactly
+    cache.put("with turns", None, {"answer": "with turns"})
+    assert cache.get_similar(unit(0))["answer"] == "first"
+
+
+def test_scopes_are_kept_apart():
+    cache = AnswerCache()
+    cache.put("What is an eVar?", unit(0), ANSWER, scope="analytics")
+    assert cache.get_exact("What is an eVar?") is None
+    assert cache.get_exact("What is an eVar?", scope="media") is None
+    assert cache.get_similar(unit(0), scope="media") is None
+    assert cache.get_similar(unit(0)) is None
+    assert cache.get_exact("What is an eVar?", scope="analytics") == ANSWER
+    assert cache.get_similar(unit(0), scope="analytics") == ANSWER
+
+
+def test_entries_expire_after_the_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(query_cache.time, "monotonic", lambda: now[0])
+    cache = AnswerCache(ttl=60)
+    cache.put("What is an eVar?", unit(0), ANSWER)
+    now[0] += 60
+    assert cache.get_exact("What is an eVar?") == ANSWER
+    now[0] += 1
+    assert cache.get_similar(unit(0)) is None
+    assert cache.get_exact("What is an eVar?") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_answers_are_evicted_and_invalidate_drops_all():
+    cache = AnswerCache(max_size=2)
+    cache.put("a", unit(0), {"answer": "a"})
+    cache.put("b", unit(90), {"answer": "b"})
+    cache.get_exact("a")
+    cache.put("c", unit(180), {"answer": "c"})
+    assert cache.get_exact("b") is None
+    assert cache.get_exact("a") is not None and cache.get_similar(unit(180)) is not None
+    cache.invalidate()
+    assert cache.stats()["size"] == 0
+    assert cache.get_similar(unit(0)) is None
+    assert AnswerCache(max_size=0).put("a", None, ANSWER) is None
+
+
+def test_query_embedding_cache_computes_unique_misses_once():
+    calls = []
+
+    def compute(questions):
+        calls.append(list(questions))
+        return [[float(len(question.strip()))] for question in questions]
+
+    cache = QueryEmbeddingCache(max_size=2)
+    assert cache.get_or_compute_many(["ab", "AB ", "abc"], compute) == [[2.0], [2.0], [3.0]]
+    assert len(calls) == 1 and len(calls[0]) == 2
+    assert cache.get_or_compute("abc", lambda question: [0.0]) == [3.0]
+    assert cache.get_or_compute("abcd", lambda question: [4.0]) == [4.0]
+    # "ab" was the least recently used
+    assert cache.get_or_compute("ab", lambda question: [9.0]) == [9.0]
+    assert cache.stats() == {"hits": 1, "misses": 4, "size": 2}
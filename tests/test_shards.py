@@ -0,0 +1,37 @@
+import pytest
+
+from shards import merge_hits
+
+
+def identical_shards(count, vector_hits, lexical_hits):
+    """Results of `count` shards holding the same chunks"""
+    return [(f"shard{i}", (vector_hits, lexical_hits)) for i in range(count)]
+
+
+def test_merge_hits_ranks_vector_hits_by_distance_across_shards():
+    results = [("a", ([(0.3, 0), (0.9, 1)], [])), ("b", ([(0.1, 0), (0.5, 1)], []))]
+    assert merge_hits(results, {}, k=3) == [("b", 0), ("a", 0), ("b", 1)]
+
+
+def test_merge_hits_ranks_each_shards_bm25_hits_by_its_own_scores():
+    # Shard b's BM25 scores are far larger, which says nothing about shard a's hits
+    results = [
+        ("a", ([], [(4, 1.5)])),
+        ("b", ([], [(7, 40.0), (8, 90.0)])),
+    ]
+    assert merge_hits(results, {}, k=3) == [("a", 4), ("b", 8), ("b", 7)]
+
+
+@pytest.mark.parametrize("config", [{}, {"vector_weight": 2.0}, {"lexical_weight": 1.5}, {"rrf_k": 10}])
+@pytest.mark.parametrize("k", [2, 4])
+def test_merge_hits_balance_does_not_depend_on_shard_count(config, k):
+    vector_hits = [(0.1 * i, i) for i in range(20)]
+    lexical_hits = [(100 + i, 20.0 - i) for i in range(20)]
+
+    def vector_share(shards):
+        merged = merge_hits(identical_shards(shards, vector_hits, lexical_hits), config, k * shards)
+        return sum(position < 100 for _, position in merged) / len(merged)
+
+    single = vector_share(1)
+    for shards in (2, 3, 5):
+        assert vector_share(shards) == single
@@ -0,0 +1,126 @@
+import gzip
+
+import requests
+
+from sitemaps import SitemapDiscovery, iter_sitemap, parse_lastmod, sitemaps_in_robots
+
+URLSET = b"""<?xml version="1.0" encoding="UTF-8"?>
+<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <url><loc> https://docs.example.com/a </loc><lastmod>2024-05-01</lastmod></url>
+  <url><loc>https://docs.example.com/b</loc></url>
+  <url><lastmod>2024-05-02</lastmod></url>
+</urlset>"""
+
+SITEMAP_INDEX = b"""<?xml version="1.0" encoding="UTF-8"?>
+<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">
+  <sitemap><loc>https://docs.example.com/sitemap-1.xml</loc><lastmod>2024-05-01T10:00:00Z</lastmod></sitemap>
+  <sitemap><loc>https://docs.example.com/sitemap-2.xml.gz</loc></sitemap>
+</sitemapindex>"""
+
+
+def chunked(data: bytes, size: int = 7):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+def test_parse_lastmod():
+    assert parse_lastmod("2024-05-01") == 1714521600.0
+    assert parse_lastmod("2024-05-01T10:00:00Z") == 1714557600.0
+    assert parse_lastmod("2024-05-01T12:00:00+02:00") == 1714557600.0
+    assert parse_lastmod("yesterday") is None
+    assert parse_lastmod("") is None
+    assert parse_lastmod(None) is None
+
+
+def test_iter_sitemap_urlset_in_small_chunks():
+    assert list(iter_sitemap(chunked(URLSET))) == [
+        ("url", "https://docs.example.com/a", "2024-05-01"),
+        ("url", "https://docs.example.com/b", None),
+    ]
+
+
+def test_iter_sitemap_gzipped():
+    assert list(iter_sitemap(chunked(gzip.compress(URLSET)))) == list(iter_sitemap([URLSET]))
+
+
+def test_iter_sitemap_index():
+    assert list(iter_sitemap([SITEMAP_INDEX])) == [
+        ("sitemap", "https://docs.example.com/sitemap-1.xml", "2024-05-01T10:00:00Z"),
+        ("sitemap", "https://docs.example.com/sitemap-2.xml.gz", None),
+    ]
+
+
+def test_sitemaps_in_robots():
+    robots = "User-agent: *\nDisallow: /private\nSitemap: /sitemap.xml\nsitemap: https://cdn.example.com/s.xml\n"
+    assert sitemaps_in_robots(robots, "https://docs.example.com") == [
+        "https://docs.example.com/sitemap.xml",
+        "https://cdn.example.com/s.xml",
+    ]
+
+
+class FakeResponse:
+    def __init__(self, body: bytes = b"", status: int = 200):
+        self.body = body
+        self.status_code = status
+        self.ok = status < 400
+
+    @property
+    def text(self):
+        return self.body.decode()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if not self.ok:
+            raise requests.HTTPError(f"{self.status_code}")
+
+    def iter_content(self, chunk_size):
+        return chunked(self.body, chunk_size)
+
+
+class FakeSession:
+    def __init__(self, pages):
+        self.pages = pages
+        self.requested = []
+
+    def get(self, url, **kwargs):
+        self.requested.append(url)
+        return FakeResponse(self.pages[url]) if url in self.pages else FakeResponse(status=404)
+
+
+def test_sitemaps_for_falls_back_to_sitemap_xml():
+    session = FakeSession({"https://a.example.com/robots.txt": b"Sitemap: /listed.xml\n"})
+    discovery = SitemapDiscovery(session)
+    assert discovery.sitemaps_for(["https://a.example.com/docs", "https://b.example.com/", "https://a.example.com/x"]) == [
+        "https://a.example.com/listed.xml",
+        "https://b.example.com/sitemap.xml",
+    ]
+
+
+def test_discover_follows_indexes_and_selects_pages():
+    session = FakeSession({
+        "https://docs.example.com/sitemap.xml": SITEMAP_INDEX,
+        "https://docs.example.com/sitemap-1.xml": URLSET,
+        "https://docs.example.com/sitemap-2.xml.gz": gzip.compress(
+            URLSET.replace(b"/a ", b"/c ").replace(b"/b<", b"/private<")),
+    })
+    discovery = SitemapDiscovery(session)
+    pages = discovery.discover(["https://docs.example.com/sitemap.xml"],
+                               lambda url: None if "private" in url else url)
+    assert pages == {
+        "https://docs.example.com/a": "2024-05-01",
+        "https://docs.example.com/b": None,
+        "https://docs.example.com/c": "2024-05-01",
+    }
+    assert discovery.stats() == {"sitemaps_read": 3, "urls_listed": 4}
+
+
+def test_discover_skips_unreadable_sitemaps():
+    session = FakeSession({"https://docs.example.com/broken.xml": b"<urlset><url><loc>"})
+    discovery = SitemapDiscovery(session)
+    assert discovery.discover(["https://docs.example.com/missing.xml", "https://docs.example.com/broken.xml"],
+                              lambda url: url) == {}
+    assert discovery.sitemaps_read == 2
@@ -0,0 +1,43 @@
+from urls import UrlCanonicalizer, UrlMatcher, compile_globs
+
+
+def test_canonicalizer_normalizes_variants_of_a_page():
+    canonical = UrlCanonicalizer()
+    expected = "https://docs.example.com/guide?lang=en&page=2"
+    assert canonical("https://docs.example.com/guide?page=2&lang=en") == expected
+    assert canonical("HTTPS://Docs.Example.COM:443/guide?lang=en&page=2#setup") == expected
+    assert canonical(" https://docs.example.com/guide?utm_source=x&lang=en&gclid=1&page=2 ") == expected
+
+
+def test_canonicalizer_keeps_what_identifies_the_page():
+    canonical = UrlCanonicalizer()
+    assert canonical("http://docs.example.com:8080/Guide") == "http://docs.example.com:8080/Guide"
+    assert canonical("https://docs.example.com") == "https://docs.example.com/"
+    assert canonical("https://user@Docs.example.com/a") == "https://user@docs.example.com/a"
+    assert canonical("https://docs.example.com/a?q=a%20b&empty=") == "https://docs.example.com/a?empty=&q=a%20b"
+
+
+def test_canonicalizer_custom_tracking_params():
+    canonical = UrlCanonicalizer(["ref"])
+    assert canonical("https://a.com/?ref=x&utm_source=y") == "https://a.com/?utm_source=y"
+    assert UrlCanonicalizer([])("https://a.com/?ref=x") == "https://a.com/?ref=x"
+
+
+def test_canonicalizer_leaves_unparseable_urls():
+    assert UrlCanonicalizer()("https://a.com:port/x") == "https://a.com:port/x"
+
+
+def test_compile_globs():
+    assert compile_globs([]) is None
+    pattern = compile_globs(["https://a.com/docs/*", "*.pdf"])
+    assert pattern.match("https://a.com/docs/x/y")
+    assert pattern.match("https://b.com/file.pdf")
+    assert not pattern.match("https://a.com/blog/x")
+
+
+def test_url_matcher():
+    matcher = UrlMatcher(["https://a.com/docs/*"], ["*/archive/*"])
+    assert matcher.allows("https://a.com/docs/guide")
+    assert not matcher.allows("https://a.com/docs/archive/old")
+    assert not matcher.allows("https://a.com/blog")
+    assert not UrlMatcher([]).allows("https://a.com/docs/guide")